@@ -14,7 +14,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 # This is the Alembic Config object
 from alembic.config import Config
 
-from marvin.database import Base
+from marvin.database import (
+    MESSAGE_SEARCH_TABLE,
+    Base,
+    ensure_sqlite_directory,
+    is_sqlite,
+)
 from marvin.settings import settings
 
 config = Config("alembic.ini")
@@ -29,6 +34,14 @@ fileConfig(config.config_file_name, disable_existing_loggers=False)
 target_metadata = Base.metadata
 
 
+def include_name(name, type_, parent_names):
+    """Skip the full-text index, which is managed outside the ORM metadata."""
+    if type_ == "table":
+        # SQLite FTS5 tables also have shadow tables, e.g. messages_fts_data
+        return not name.startswith(MESSAGE_SEARCH_TABLE)
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode."""
     url = config.get_main_option("sqlalchemy.url")
@@ -37,6 +50,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
         # Enable batch operations for SQLite
         render_as_batch=url.startswith("sqlite"),
     )
@@ -52,6 +66,7 @@ def do_run_migrations(connection):
     context.configure(
         connection=connection,
         target_metadata=target_metadata,
+        include_name=include_name,
         # Enable batch operations for SQLite
         render_as_batch=(connection.dialect.name == "sqlite"),
     )
@@ -64,6 +79,8 @@ async def run_async_migrations():
     """In this scenario we need to create an Engine
     and associate a connection with the context.
     """
+    if is_sqlite():
+        ensure_sqlite_directory()
     connectable = async_engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
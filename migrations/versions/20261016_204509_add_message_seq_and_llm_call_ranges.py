@@ -0,0 +1,235 @@
+"""Add message sequence numbers and range-based LLM call provenance
+
+Revision ID: 52a2560272f3
+Revises: 06f7fae3efce
+Create Date: 2026-10-16 20:45:09.000000
+
+"""
+
+import uuid
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "52a2560272f3"
+down_revision = "06f7fae3efce"
+branch_labels = None
+depends_on = None
+
+RANGE_COLUMNS = [
+    "prompt_start_seq",
+    "prompt_end_seq",
+    "completion_start_seq",
+    "completion_end_seq",
+]
+
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.UUID()),
+    sa.column("thread_id", sa.String()),
+    sa.column("message", sa.JSON()),
+    sa.column("created_at", sa.TIMESTAMP(timezone=True)),
+    sa.column("seq", sa.Integer()),
+)
+llm_calls = sa.table(
+    "llm_calls",
+    sa.column("id", sa.UUID()),
+    sa.column("thread_id", sa.String()),
+    *[sa.column(name, sa.Integer()) for name in RANGE_COLUMNS],
+)
+llm_call_messages = sa.table(
+    "llm_call_messages",
+    sa.column("id", sa.UUID()),
+    sa.column("llm_call_id", sa.UUID()),
+    sa.column("message_id", sa.UUID()),
+    sa.column("in_initial_prompt", sa.Boolean()),
+    sa.column("order", sa.Integer()),
+)
+
+
+def _is_system_message(message: dict) -> bool:
+    return message.get("kind") == "request" and any(
+        part.get("part_kind") == "system-prompt" for part in message.get("parts", [])
+    )
+
+
+def upgrade():
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.add_column(sa.Column("seq", sa.Integer(), nullable=True))
+    with op.batch_alter_table("llm_calls") as batch_op:
+        for name in RANGE_COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), nullable=True))
+
+    conn = op.get_bind()
+
+    # Number each thread's messages in chronological order
+    rows = conn.execute(
+        sa.select(messages.c.id, messages.c.thread_id).order_by(
+            messages.c.thread_id, messages.c.created_at, messages.c.id
+        )
+    )
+    seqs = []
+    thread_id, seq = None, 0
+    for row in rows:
+        if row.thread_id != thread_id:
+            thread_id, seq = row.thread_id, 0
+        seq += 1
+        seqs.append({"_id": row.id, "_seq": seq})
+    if seqs:
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam("_id"))
+            .values(seq=sa.bindparam("_seq")),
+            seqs,
+        )
+
+    op.create_index(
+        "ix_messages_thread_id_seq", "messages", ["thread_id", "seq"], unique=True
+    )
+
+    # Replace mapping rows with sequence ranges where possible
+    thread_ids = conn.execute(sa.select(llm_calls.c.thread_id).distinct()).scalars()
+    for thread_id in list(thread_ids):
+        _convert_thread_llm_calls(conn, thread_id)
+
+
+def _convert_thread_llm_calls(conn, thread_id: str) -> None:
+    seq_by_id = {}
+    history = []
+    for row in conn.execute(
+        sa.select(messages.c.id, messages.c.seq, messages.c.message)
+        .where(messages.c.thread_id == thread_id)
+        .order_by(messages.c.seq)
+    ):
+        seq_by_id[row.id] = row.seq
+        if not _is_system_message(row.message):
+            history.append(row.seq)
+    history_index = {seq: i for i, seq in enumerate(history)}
+
+    def find_range(mappings):
+        # orchestrator prompts are the system prompt followed by the history,
+        # so try the whole list and the list without its first message
+        for start in (0, 1):
+            seqs = [seq_by_id.get(m.message_id) for m in mappings[start:]]
+            if not seqs or seqs[0] not in history_index:
+                continue
+            i = history_index[seqs[0]]
+            if history[i : i + len(seqs)] == seqs:
+                return start, seqs[0], seqs[-1]
+        return None
+
+    llm_call_ids = conn.execute(
+        sa.select(llm_calls.c.id).where(llm_calls.c.thread_id == thread_id)
+    ).scalars()
+    for llm_call_id in list(llm_call_ids):
+        mappings = conn.execute(
+            sa.select(
+                llm_call_messages.c.id,
+                llm_call_messages.c.message_id,
+                llm_call_messages.c.in_initial_prompt,
+            )
+            .where(llm_call_messages.c.llm_call_id == llm_call_id)
+            .order_by(llm_call_messages.c.order)
+        ).all()
+
+        values = {}
+        covered = []
+        for prefix, in_initial_prompt in (("prompt", True), ("completion", False)):
+            part = [m for m in mappings if m.in_initial_prompt == in_initial_prompt]
+            if (found := find_range(part)) is not None:
+                start, values[f"{prefix}_start_seq"], values[f"{prefix}_end_seq"] = (
+                    found
+                )
+                covered.extend(m.id for m in part[start:])
+
+        if values:
+            conn.execute(
+                llm_calls.update().where(llm_calls.c.id == llm_call_id).values(values)
+            )
+            conn.execute(
+                llm_call_messages.delete().where(llm_call_messages.c.id.in_(covered))
+            )
+
+
+def downgrade():
+    conn = op.get_bind()
+
+    # Expand sequence ranges back into mapping rows
+    llm_calls_with_ranges = conn.execute(
+        sa.select(llm_calls).where(
+            sa.or_(
+                llm_calls.c.prompt_start_seq.is_not(None),
+                llm_calls.c.completion_start_seq.is_not(None),
+            )
+        )
+    ).all()
+    for llm_call in llm_calls_with_ranges:
+        _expand_llm_call(conn, llm_call)
+
+    op.drop_index("ix_messages_thread_id_seq", table_name="messages")
+    with op.batch_alter_table("llm_calls") as batch_op:
+        for name in RANGE_COLUMNS:
+            batch_op.drop_column(name)
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("seq")
+
+
+def _expand_llm_call(conn, llm_call) -> None:
+    def range_message_ids(start_seq, end_seq):
+        if start_seq is None:
+            return []
+        rows = conn.execute(
+            sa.select(messages.c.id, messages.c.message)
+            .where(
+                messages.c.thread_id == llm_call.thread_id,
+                messages.c.seq.between(start_seq, end_seq),
+            )
+            .order_by(messages.c.seq)
+        )
+        return [row.id for row in rows if not _is_system_message(row.message)]
+
+    def free_positions(taken, start, count):
+        positions = []
+        position = start
+        while len(positions) < count:
+            if position not in taken:
+                positions.append(position)
+            position += 1
+        return positions
+
+    mappings = conn.execute(
+        sa.select(
+            llm_call_messages.c.in_initial_prompt, llm_call_messages.c.order
+        ).where(llm_call_messages.c.llm_call_id == llm_call.id)
+    ).all()
+    prompt_orders = {m.order for m in mappings if m.in_initial_prompt}
+    completion_orders = {m.order for m in mappings if not m.in_initial_prompt}
+
+    prompt_ids = range_message_ids(llm_call.prompt_start_seq, llm_call.prompt_end_seq)
+    completion_ids = range_message_ids(
+        llm_call.completion_start_seq, llm_call.completion_end_seq
+    )
+    prompt_length = len(prompt_orders) + len(prompt_ids)
+
+    rows = []
+    for in_initial_prompt, message_ids, positions in (
+        (True, prompt_ids, free_positions(prompt_orders, 0, len(prompt_ids))),
+        (
+            False,
+            completion_ids,
+            free_positions(completion_orders, prompt_length, len(completion_ids)),
+        ),
+    ):
+        rows.extend(
+            {
+                "id": uuid.uuid4(),
+                "llm_call_id": llm_call.id,
+                "message_id": message_id,
+                "in_initial_prompt": in_initial_prompt,
+                "order": position,
+            }
+            for message_id, position in zip(message_ids, positions)
+        )
+    if rows:
+        conn.execute(llm_call_messages.insert(), rows)
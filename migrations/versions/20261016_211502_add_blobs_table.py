@@ -0,0 +1,60 @@
+"""Add content-addressed blobs table
+
+Revision ID: 9d1c4b7e2f60
+Revises: 52a2560272f3
+Create Date: 2026-10-16 21:15:02.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d1c4b7e2f60"
+down_revision = "52a2560272f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Large message contents are stored once here and referenced by hash from
+    # the message's parts. Existing messages keep their contents inline.
+    op.create_table(
+        "blobs",
+        sa.Column("hash", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+
+
+def downgrade():
+    # Restore blob contents into the messages that reference them
+    conn = op.get_bind()
+    messages = sa.table(
+        "messages", sa.column("id", sa.UUID()), sa.column("message", sa.JSON())
+    )
+    blobs = sa.table("blobs", sa.column("hash"), sa.column("content"))
+    contents = dict(conn.execute(sa.select(blobs.c.hash, blobs.c.content)).all())
+
+    updates = []
+    for row in conn.execute(sa.select(messages.c.id, messages.c.message)):
+        parts = row.message.get("parts", [])
+        if not any("content_blob" in part for part in parts):
+            continue
+        restored = []
+        for part in parts:
+            if (hash := part.get("content_blob")) is not None:
+                part = {k: v for k, v in part.items() if k != "content_blob"}
+                part["content"] = contents[hash]
+            restored.append(part)
+        updates.append({"_id": row.id, "_message": {**row.message, "parts": restored}})
+    if updates:
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam("_id"))
+            .values(message=sa.bindparam("_message")),
+            updates,
+        )
+
+    op.drop_table("blobs")
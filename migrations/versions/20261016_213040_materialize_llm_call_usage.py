@@ -0,0 +1,80 @@
+"""Materialize LLM call usage into integer columns
+
+Revision ID: 8e3f0a6c51d2
+Revises: 9d1c4b7e2f60
+Create Date: 2026-10-16 21:30:40.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e3f0a6c51d2"
+down_revision = "9d1c4b7e2f60"
+branch_labels = None
+depends_on = None
+
+USAGE_COLUMNS = [
+    "requests",
+    "tool_calls",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_tokens",
+    "cache_write_tokens",
+    "input_audio_tokens",
+    "cache_audio_read_tokens",
+    "output_audio_tokens",
+]
+
+# Older versions of pydantic-ai used different names for some usage fields
+LEGACY_USAGE_FIELDS = {
+    "input_tokens": "request_tokens",
+    "output_tokens": "response_tokens",
+}
+
+
+def upgrade():
+    with op.batch_alter_table("llm_calls") as batch_op:
+        batch_op.add_column(sa.Column("model", sa.String(), nullable=True))
+        for name in USAGE_COLUMNS:
+            batch_op.add_column(
+                sa.Column(name, sa.Integer(), nullable=False, server_default="0")
+            )
+
+    # Backfill the columns from the usage JSON
+    conn = op.get_bind()
+    llm_calls = sa.table(
+        "llm_calls",
+        sa.column("id", sa.UUID()),
+        sa.column("usage", sa.JSON()),
+        *[sa.column(name, sa.Integer()) for name in USAGE_COLUMNS],
+    )
+    updates = []
+    for row in conn.execute(sa.select(llm_calls.c.id, llm_calls.c.usage)):
+        usage = row.usage or {}
+        values = {
+            name: usage.get(name, usage.get(LEGACY_USAGE_FIELDS.get(name, name))) or 0
+            for name in USAGE_COLUMNS
+        }
+        if any(values.values()):
+            updates.append({"_id": row.id, **{f"_{k}": v for k, v in values.items()}})
+    if updates:
+        conn.execute(
+            llm_calls.update()
+            .where(llm_calls.c.id == sa.bindparam("_id"))
+            .values({name: sa.bindparam(f"_{name}") for name in USAGE_COLUMNS}),
+            updates,
+        )
+
+    op.create_index(
+        "ix_llm_calls_thread_id_timestamp", "llm_calls", ["thread_id", "timestamp"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_llm_calls_thread_id_timestamp", table_name="llm_calls")
+    with op.batch_alter_table("llm_calls") as batch_op:
+        for name in reversed(USAGE_COLUMNS):
+            batch_op.drop_column(name)
+        batch_op.drop_column("model")
@@ -0,0 +1,75 @@
+"""Add fork points to threads
+
+Revision ID: b7d4e19a3c05
+Revises: 8e3f0a6c51d2
+Create Date: 2026-10-16 22:04:15.000000
+
+"""
+
+import uuid
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7d4e19a3c05"
+down_revision = "8e3f0a6c51d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("threads") as batch_op:
+        batch_op.add_column(sa.Column("fork_seq", sa.Integer(), nullable=True))
+
+
+threads = sa.table(
+    "threads",
+    sa.column("id", sa.String()),
+    sa.column("parent_thread_id", sa.String()),
+    sa.column("fork_seq", sa.Integer()),
+    sa.column("created_at", sa.TIMESTAMP(timezone=True)),
+)
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.UUID()),
+    sa.column("thread_id", sa.String()),
+    sa.column("message", sa.JSON()),
+    sa.column("created_at", sa.TIMESTAMP(timezone=True)),
+    sa.column("seq", sa.Integer()),
+)
+
+
+def downgrade():
+    # Copy shared history into forks. Parents are copied before their forks,
+    # so forks of forks also receive the history their parent shared.
+    conn = op.get_bind()
+    forks = conn.execute(
+        sa.select(threads.c.id, threads.c.parent_thread_id, threads.c.fork_seq)
+        .where(threads.c.fork_seq.is_not(None))
+        .order_by(threads.c.created_at)
+    ).all()
+    for fork in forks:
+        rows = conn.execute(
+            sa.select(messages.c.message, messages.c.created_at, messages.c.seq).where(
+                messages.c.thread_id == fork.parent_thread_id,
+                messages.c.seq <= fork.fork_seq,
+            )
+        ).all()
+        if rows:
+            conn.execute(
+                messages.insert(),
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "thread_id": fork.id,
+                        "message": row.message,
+                        "created_at": row.created_at,
+                        "seq": row.seq,
+                    }
+                    for row in rows
+                ],
+            )
+
+    with op.batch_alter_table("threads") as batch_op:
+        batch_op.drop_column("fork_seq")
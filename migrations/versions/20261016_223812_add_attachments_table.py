@@ -0,0 +1,78 @@
+"""Add content-addressed attachments table
+
+Revision ID: 3f6a9c2d8e14
+Revises: b7d4e19a3c05
+Create Date: 2026-10-16 22:38:12.000000
+
+"""
+
+import base64
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f6a9c2d8e14"
+down_revision = "b7d4e19a3c05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Binary message contents are stored once, here or on the filesystem, and
+    # referenced by hash from the message. Existing messages keep them inline.
+    op.create_table(
+        "attachments",
+        sa.Column("hash", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+
+
+def downgrade():
+    # Restore attachment data into the messages that reference them
+    from marvin.database import _attachment_store
+
+    conn = op.get_bind()
+    messages = sa.table(
+        "messages", sa.column("id", sa.UUID()), sa.column("message", sa.JSON())
+    )
+    attachments = sa.table("attachments", sa.column("hash"), sa.column("data"))
+    stored = dict(conn.execute(sa.select(attachments.c.hash, attachments.c.data)).all())
+    store = _attachment_store()
+
+    def restore(item):
+        if not isinstance(item, dict) or (hash := item.get("data_blob")) is None:
+            return item
+        data = stored.get(hash)
+        if data is None and store is not None:
+            data = store.get(hash)
+        if data is None:
+            raise ValueError(f"Attachment {hash} is missing")
+        item = {k: v for k, v in item.items() if k != "data_blob"}
+        item["data"] = base64.b64encode(data).decode()
+        return item
+
+    updates = []
+    for row in conn.execute(sa.select(messages.c.id, messages.c.message)):
+        parts = row.message.get("parts", [])
+        restored = [
+            {**part, "content": [restore(item) for item in part["content"]]}
+            if isinstance(part.get("content"), list)
+            else part
+            for part in parts
+        ]
+        if restored != parts:
+            updates.append(
+                {"_id": row.id, "_message": {**row.message, "parts": restored}}
+            )
+    if updates:
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam("_id"))
+            .values(message=sa.bindparam("_message")),
+            updates,
+        )
+
+    op.drop_table("attachments")
@@ -0,0 +1,63 @@
+"""Add a denormalized message role column
+
+Revision ID: c1e7a5d93b28
+Revises: 3f6a9c2d8e14
+Create Date: 2026-10-16 22:55:26.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c1e7a5d93b28"
+down_revision = "3f6a9c2d8e14"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.UUID()),
+    sa.column("message", sa.JSON()),
+    sa.column("role", sa.String()),
+)
+
+
+def _message_role(message: dict) -> str:
+    # keep in sync with `marvin.database.message_role`
+    if message.get("kind") == "response":
+        return "assistant"
+    part_kinds = {part.get("part_kind") for part in message.get("parts", [])}
+    if "system-prompt" in part_kinds:
+        return "system"
+    if part_kinds and part_kinds <= {"tool-return", "retry-prompt"}:
+        return "tool"
+    return "user"
+
+
+def upgrade():
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.add_column(sa.Column("role", sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(messages.c.id, messages.c.message)).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start : start + BATCH_SIZE]
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam("_id"))
+            .values(role=sa.bindparam("_role")),
+            [{"_id": row.id, "_role": _message_role(row.message)} for row in batch],
+        )
+
+    op.create_index(
+        "ix_messages_thread_id_role_seq", "messages", ["thread_id", "role", "seq"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_messages_thread_id_role_seq", table_name="messages")
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("role")
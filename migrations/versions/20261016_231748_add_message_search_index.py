@@ -0,0 +1,98 @@
+"""Add a full-text search index over message text
+
+Revision ID: 5a8e2b71f9c4
+Revises: c1e7a5d93b28
+Create Date: 2026-10-16 23:17:48.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5a8e2b71f9c4"
+down_revision = "c1e7a5d93b28"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+SEARCHABLE_PART_KINDS = {"user-prompt", "text", "tool-return"}
+
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.UUID()),
+    sa.column("thread_id", sa.String()),
+    sa.column("message", sa.JSON()),
+)
+blobs = sa.table("blobs", sa.column("hash"), sa.column("content"))
+messages_fts = sa.table(
+    "messages_fts",
+    sa.column("message_id", sa.String()),
+    sa.column("thread_id", sa.String()),
+    sa.column("text", sa.Text()),
+)
+
+
+def _create_statements(dialect: str) -> list[str]:
+    if dialect == "sqlite":
+        return [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "text, thread_id UNINDEXED, message_id UNINDEXED, "
+            "tokenize='porter unicode61')"
+        ]
+    if dialect == "postgresql":
+        return [
+            "CREATE TABLE IF NOT EXISTS messages_fts ("
+            "message_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, "
+            "text TEXT NOT NULL, tsv TSVECTOR GENERATED ALWAYS AS "
+            "(to_tsvector('english', text)) STORED)",
+            "CREATE INDEX IF NOT EXISTS ix_messages_fts_tsv "
+            "ON messages_fts USING GIN (tsv)",
+            "CREATE INDEX IF NOT EXISTS ix_messages_fts_thread_id "
+            "ON messages_fts (thread_id)",
+        ]
+    return [
+        "CREATE TABLE IF NOT EXISTS messages_fts ("
+        "message_id VARCHAR(36) PRIMARY KEY, thread_id VARCHAR(255) NOT NULL, "
+        "text TEXT NOT NULL)",
+    ]
+
+
+def _search_text(message: dict, contents: dict) -> str:
+    # keep in sync with `marvin.database.message_search_text`
+    texts = []
+    for part in message.get("parts", []):
+        if part.get("part_kind") not in SEARCHABLE_PART_KINDS:
+            continue
+        content = part.get("content")
+        if content is None and "content_blob" in part:
+            content = contents.get(part["content_blob"])
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(item for item in content if isinstance(item, str))
+    return "\n".join(texts)
+
+
+def upgrade():
+    conn = op.get_bind()
+    for statement in _create_statements(conn.dialect.name):
+        op.execute(statement)
+
+    # Index existing messages
+    contents = dict(conn.execute(sa.select(blobs.c.hash, blobs.c.content)).all())
+    rows = conn.execute(
+        sa.select(messages.c.id, messages.c.thread_id, messages.c.message)
+    ).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        values = [
+            {"message_id": str(row.id), "thread_id": row.thread_id, "text": text}
+            for row in rows[start : start + BATCH_SIZE]
+            if (text := _search_text(row.message, contents))
+        ]
+        if values:
+            conn.execute(messages_fts.insert(), values)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS messages_fts")
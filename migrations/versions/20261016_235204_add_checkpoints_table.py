@@ -0,0 +1,41 @@
+"""Add thread history checkpoints table
+
+Revision ID: 9d2c4f7a1e63
+Revises: 5a8e2b71f9c4
+Create Date: 2026-10-16 23:52:04.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d2c4f7a1e63"
+down_revision = "5a8e2b71f9c4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Summaries of thread history that replace the messages they cover in
+    # prompts. Messages are kept, so there is nothing to backfill.
+    op.create_table(
+        "checkpoints",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("thread_id", sa.String(), nullable=False),
+        sa.Column("through_seq", sa.Integer(), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["thread_id"], ["threads.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_checkpoints_thread_id_through_seq",
+        "checkpoints",
+        ["thread_id", "through_seq"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_checkpoints_thread_id_through_seq", table_name="checkpoints")
+    op.drop_table("checkpoints")
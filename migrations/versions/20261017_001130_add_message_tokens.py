@@ -0,0 +1,93 @@
+"""Add a per-message token count column
+
+Revision ID: 4b7d1e9c2a58
+Revises: 9d2c4f7a1e63
+Create Date: 2026-10-17 00:11:30.000000
+
+"""
+
+import json
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4b7d1e9c2a58"
+down_revision = "9d2c4f7a1e63"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# keep in sync with `marvin.utilities.tokens`
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+MEDIA_TOKENS = 1000
+MEDIA_KINDS = {"binary", "image-url", "audio-url", "document-url", "video-url"}
+PART_FIELDS = ("content", "args", "tool_name")
+
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.UUID()),
+    sa.column("message", sa.JSON()),
+    sa.column("tokens", sa.Integer()),
+)
+blobs = sa.table(
+    "blobs",
+    sa.column("hash", sa.String()),
+    sa.column("content", sa.Text()),
+)
+
+
+def _estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _estimate_value_tokens(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return _estimate_tokens(value)
+    if isinstance(value, list):
+        return sum(_estimate_value_tokens(item) for item in value)
+    if isinstance(value, dict) and value.get("kind") in MEDIA_KINDS:
+        return MEDIA_TOKENS
+    return _estimate_tokens(json.dumps(value, separators=(",", ":"), default=str))
+
+
+def _message_tokens(message: dict, blob_sizes: dict[str, int]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in message.get("parts", []):
+        for name in PART_FIELDS:
+            tokens += _estimate_value_tokens(part.get(name))
+        # contents stored in the blobs table are only referenced by hash
+        if (hash := part.get("content_blob")) is not None:
+            tokens += -(-blob_sizes.get(hash, 0) // CHARS_PER_TOKEN)
+    return tokens
+
+
+def upgrade():
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.add_column(sa.Column("tokens", sa.Integer(), nullable=True))
+
+    conn = op.get_bind()
+    blob_sizes = dict(
+        conn.execute(sa.select(blobs.c.hash, sa.func.length(blobs.c.content))).all()
+    )
+    rows = conn.execute(sa.select(messages.c.id, messages.c.message)).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start : start + BATCH_SIZE]
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == sa.bindparam("_id"))
+            .values(tokens=sa.bindparam("_tokens")),
+            [
+                {"_id": row.id, "_tokens": _message_tokens(row.message, blob_sizes)}
+                for row in batch
+            ],
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("messages") as batch_op:
+        batch_op.drop_column("tokens")
@@ -0,0 +1,40 @@
+"""Map checkpoint summaries sent to LLM calls
+
+Revision ID: 6c3a8f1d4b27
+Revises: 4b7d1e9c2a58
+Create Date: 2026-10-17 00:45:12.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6c3a8f1d4b27"
+down_revision = "4b7d1e9c2a58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Checkpoint summaries aren't stored as messages, so their mappings
+    # reference the checkpoint instead. Existing mappings are all messages.
+    with op.batch_alter_table("llm_call_messages") as batch_op:
+        batch_op.add_column(sa.Column("checkpoint_id", sa.UUID(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_llm_call_messages_checkpoint_id",
+            "checkpoints",
+            ["checkpoint_id"],
+            ["id"],
+        )
+        batch_op.alter_column("message_id", existing_type=sa.UUID(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM llm_call_messages WHERE checkpoint_id IS NOT NULL")
+    with op.batch_alter_table("llm_call_messages") as batch_op:
+        batch_op.alter_column("message_id", existing_type=sa.UUID(), nullable=False)
+        batch_op.drop_constraint(
+            "fk_llm_call_messages_checkpoint_id", type_="foreignkey"
+        )
+        batch_op.drop_column("checkpoint_id")
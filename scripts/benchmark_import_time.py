@@ -0,0 +1,107 @@
+"""
+Benchmark the wall time of `import marvin` in a fresh interpreter.
+
+Each run imports Marvin in a new subprocess with an empty home directory, so
+nothing is cached between runs and any database or file system work done at
+import time would show up in the timings. Exits with an error if the median
+exceeds the budget. With `--top`, also lists the modules that take the longest
+to import, as reported by `python -X importtime`.
+
+## Usage
+
+```bash
+uv run python scripts/benchmark_import_time.py
+uv run python scripts/benchmark_import_time.py --runs 20 --budget 800
+uv run python scripts/benchmark_import_time.py --top 20
+```
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+DEFAULT_BUDGET_MS = 1500
+
+# report the time of the import itself, not interpreter startup
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import marvin
+print(time.perf_counter() - start)
+"""
+
+
+def marvin_env(home: Path) -> dict[str, str]:
+    env = {**os.environ, "MARVIN_HOME_PATH": str(home)}
+    env.pop("MARVIN_DATABASE_URL", None)
+    return env
+
+
+def time_import(home: Path) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        env=marvin_env(home),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1]) * 1000
+
+
+def import_profile(home: Path) -> list[tuple[int, int, str]]:
+    """The (self, cumulative) import time in microseconds of each module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import marvin"],
+        env=marvin_env(home),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if self_us.strip().isdigit():
+            profile.append((int(self_us), int(cumulative_us), name.strip()))
+    return profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as temp_dir:
+        timings = [time_import(Path(temp_dir) / str(i)) for i in range(args.runs)]
+        profile = import_profile(Path(temp_dir) / "profile") if args.top else []
+        created = [
+            path.relative_to(temp_dir).as_posix()
+            for path in Path(temp_dir).rglob("*")
+            if path.is_file()
+        ]
+
+    median = statistics.median(timings)
+    print(
+        f"import marvin: median {median:.1f}ms, min {min(timings):.1f}ms, "
+        f"max {max(timings):.1f}ms over {args.runs} runs "
+        f"(budget {args.budget:.0f}ms)"
+    )
+    if profile:
+        print(f"\n{'self (ms)':>10} {'total (ms)':>11}  module")
+        for self_us, cumulative_us, name in sorted(profile, reverse=True)[: args.top]:
+            print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>11.1f}  {name}")
+    if created:
+        print(f"files created at import: {', '.join(sorted(created))}")
+    if median > args.budget:
+        sys.exit(f"median import time exceeds the {args.budget:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark concurrent thread persistence under each SQLite profile.
+
+Simulates a `run_tasks_async` fan-out: many threads concurrently add messages,
+read their history, and record LLM calls against a fresh SQLite file. The
+thread history cache is disabled so every read hits the database.
+
+## Usage
+
+```bash
+uv run python scripts/benchmark_sqlite_profiles.py
+uv run python scripts/benchmark_sqlite_profiles.py --threads 50 --turns 20
+```
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from pydantic_ai.usage import RunUsage
+
+from marvin import database
+from marvin.database import DBLLMCall, dispose_async_engine
+from marvin.engine.llm import AgentMessage, UserMessage
+from marvin.settings import settings
+from marvin.thread import Thread
+
+
+async def run_thread(turns: int, latencies: list[float]) -> None:
+    thread = Thread()
+    for i in range(turns):
+        start = time.perf_counter()
+        prompt = await thread.get_messages_async()
+        completion = await thread.add_messages_async(
+            [UserMessage(f"question {i}"), AgentMessage(f"answer {i}")]
+        )
+        await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=RunUsage(requests=1, input_tokens=100, output_tokens=20),
+            prompt_messages=prompt,
+            completion_messages=completion,
+        )
+        latencies.append(time.perf_counter() - start)
+
+
+async def benchmark(profile: str, threads: int, turns: int, path: Path) -> None:
+    settings.database_url = f"sqlite+aiosqlite:///{path}"
+    settings.database_sqlite_profile = profile
+    database._async_engine_cache.clear()
+    database._engine_state_cache.clear()
+    await database.create_db_and_tables(force=True)
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_thread(turns, latencies) for _ in range(threads)))
+    elapsed = time.perf_counter() - start
+    await dispose_async_engine()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{profile:>12}: {elapsed:7.2f}s total, "
+        f"{threads * turns / elapsed:8.1f} turns/s, "
+        f"median {statistics.median(latencies) * 1000:7.1f}ms, "
+        f"p95 {p95 * 1000:7.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    settings.thread_history_cache_max_threads = 0
+    print(f"{args.threads} concurrent threads x {args.turns} turns")
+    with TemporaryDirectory() as temp_dir:
+        for profile in ("default", "performance"):
+            path = Path(temp_dir) / f"{profile}.db"
+            asyncio.run(benchmark(profile, args.threads, args.turns, path))
+
+
+if __name__ == "__main__":
+    main()
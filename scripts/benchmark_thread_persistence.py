@@ -0,0 +1,119 @@
+"""
+Benchmark per-turn persistence time as a thread grows.
+
+Each turn persists two new messages and an LLM call whose prompt maps every
+earlier message in the thread, like an orchestrator turn. Turns are timed
+with the bulk insert path used by Marvin and with one ORM object per row.
+
+## Usage
+
+```bash
+uv run python scripts/benchmark_thread_persistence.py
+uv run python scripts/benchmark_thread_persistence.py --lengths 10 100 1000 --turns 5
+```
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from pydantic_ai.usage import RunUsage
+
+from marvin import database
+from marvin.database import (
+    DBLLMCall,
+    DBLLMCallMessage,
+    DBMessage,
+    dispose_async_engine,
+    get_async_session,
+)
+from marvin.engine.llm import AgentMessage, UserMessage
+from marvin.settings import settings
+from marvin.thread import Message, Thread
+
+USAGE = RunUsage(requests=1, input_tokens=100, output_tokens=20)
+
+
+async def bulk_turn(thread: Thread, prompt: list[Message]) -> list[Message]:
+    completion = await thread.add_messages_async(
+        [UserMessage("question"), AgentMessage("answer")]
+    )
+    await DBLLMCall.create(
+        thread_id=thread.id,
+        usage=USAGE,
+        prompt_messages=prompt,
+        completion_messages=completion,
+    )
+    return completion
+
+
+async def orm_turn(thread: Thread, prompt: list[Message]) -> list[Message]:
+    db_messages = [
+        DBMessage.from_message(thread_id=thread.id, message=message)
+        for message in [UserMessage("question"), AgentMessage("answer")]
+    ]
+    async with get_async_session() as session:
+        session.add_all(db_messages)
+    completion = [m.to_message() for m in db_messages]
+
+    async with get_async_session() as session:
+        llm_call = DBLLMCall(thread_id=thread.id, usage=USAGE)
+        session.add(llm_call)
+        await session.flush()
+        for i, message in enumerate(prompt + completion):
+            session.add(
+                DBLLMCallMessage(
+                    llm_call_id=llm_call.id,
+                    message_id=message.id,
+                    in_initial_prompt=i < len(prompt),
+                    order=i,
+                )
+            )
+    return completion
+
+
+async def benchmark(lengths: list[int], turns: int, path: Path) -> None:
+    settings.database_url = f"sqlite+aiosqlite:///{path}"
+    database._async_engine_cache.clear()
+    database._engine_state_cache.clear()
+    await database.create_db_and_tables(force=True)
+
+    print(f"{'messages':>10} {'orm (ms)':>10} {'bulk (ms)':>10} {'speedup':>8}")
+    for length in lengths:
+        timings = {}
+        for name, turn in (("orm", orm_turn), ("bulk", bulk_turn)):
+            thread = Thread()
+            history = await thread.add_messages_async(
+                [UserMessage(f"message {i}") for i in range(length)]
+            )
+            durations = []
+            for _ in range(turns):
+                start = time.perf_counter()
+                history += await turn(thread, history)
+                durations.append(time.perf_counter() - start)
+            timings[name] = statistics.median(durations) * 1000
+        print(
+            f"{length:>10} {timings['orm']:>10.1f} {timings['bulk']:>10.1f} "
+            f"{timings['orm'] / timings['bulk']:>7.1f}x"
+        )
+
+    await dispose_async_engine()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--lengths", type=int, nargs="+", default=[10, 100, 300, 1000, 3000]
+    )
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as temp_dir:
+        asyncio.run(benchmark(args.lengths, args.turns, Path(temp_dir) / "marvin.db"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,104 @@
-from importlib.metadata import version as _version
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
 # necessary imports
 from marvin.settings import settings
-from marvin.database import init_database_if_necessary
-
-# core classes
-from marvin.thread import Thread
-from marvin.agents.agent import Agent
-from marvin.tasks.task import Task
-from marvin.memory.memory import Memory
 
 # public access
 from marvin.instructions import instructions
 from marvin.defaults import defaults
-from marvin.agents.team import Swarm, Team
-from . import handlers
 
-# marvin fns
-from marvin.fns.run import (
-    run,
-    run_async,
-    run_tasks_async,
-    run_tasks,
-    run_stream,
-    run_tasks_stream,
-)
-from marvin.fns.classify import classify, classify_async
-from marvin.fns.extract import extract, extract_async
-from marvin.fns.cast import cast, cast_async
-from marvin.fns.generate import (
-    generate,
-    generate_async,
-    generate_schema,
-    generate_schema_async,
-)
-from marvin.fns.fn import fn
-from marvin.fns.say import say, say_async
-from marvin.fns.summarize import summarize, summarize_async
-from marvin.fns.plan import plan, plan_async
+if TYPE_CHECKING:
+    # core classes
+    from marvin.thread import Thread
+    from marvin.agents.agent import Agent
+    from marvin.tasks.task import Task
+    from marvin.memory.memory import Memory
+
+    from marvin.agents.team import Swarm, Team
+    from . import handlers
+
+    # marvin fns
+    from marvin.fns.run import (
+        run,
+        run_async,
+        run_tasks_async,
+        run_tasks,
+        run_stream,
+        run_tasks_stream,
+    )
+    from marvin.fns.classify import classify, classify_async
+    from marvin.fns.extract import extract, extract_async
+    from marvin.fns.cast import cast, cast_async
+    from marvin.fns.generate import (
+        generate,
+        generate_async,
+        generate_schema,
+        generate_schema_async,
+    )
+    from marvin.fns.fn import fn
+    from marvin.fns.say import say, say_async
+    from marvin.fns.summarize import summarize, summarize_async
+    from marvin.fns.plan import plan, plan_async
+
+    __version__: str
+
+# Public names that are imported from these modules on first access (PEP 562),
+# so `import marvin` doesn't pay for pydantic-ai agents, SQLAlchemy, Jinja, and
+# rich until they are used
+_LAZY_IMPORTS: dict[str, str] = {
+    "Thread": "marvin.thread",
+    "Agent": "marvin.agents.agent",
+    "Task": "marvin.tasks.task",
+    "Memory": "marvin.memory.memory",
+    "Swarm": "marvin.agents.team",
+    "Team": "marvin.agents.team",
+    "handlers": "marvin.handlers",
+    "run": "marvin.fns.run",
+    "run_async": "marvin.fns.run",
+    "run_tasks_async": "marvin.fns.run",
+    "run_tasks": "marvin.fns.run",
+    "run_stream": "marvin.fns.run",
+    "run_tasks_stream": "marvin.fns.run",
+    "classify": "marvin.fns.classify",
+    "classify_async": "marvin.fns.classify",
+    "extract": "marvin.fns.extract",
+    "extract_async": "marvin.fns.extract",
+    "cast": "marvin.fns.cast",
+    "cast_async": "marvin.fns.cast",
+    "generate": "marvin.fns.generate",
+    "generate_async": "marvin.fns.generate",
+    "generate_schema": "marvin.fns.generate",
+    "generate_schema_async": "marvin.fns.generate",
+    "fn": "marvin.fns.fn",
+    "say": "marvin.fns.say",
+    "say_async": "marvin.fns.say",
+    "summarize": "marvin.fns.summarize",
+    "summarize_async": "marvin.fns.summarize",
+    "plan": "marvin.fns.plan",
+    "plan_async": "marvin.fns.plan",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name == "__version__":
+        from importlib.metadata import version
+
+        value = version("marvin")
+    elif (module_name := _LAZY_IMPORTS.get(name)) is not None:
+        module = import_module(module_name)
+        value = module if module_name == f"{__name__}.{name}" else getattr(module, name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # cache the value so later lookups don't go through this function
+    globals()[name] = value
+    return value
 
-# Initialize the database on import
-from marvin.database import ensure_db_tables_exist
 
-ensure_db_tables_exist()
+def __dir__() -> list[str]:
+    return sorted({*globals(), *_LAZY_IMPORTS, "__version__"})
 
-__version__ = _version("marvin")
 
 __all__ = [
     "Agent",
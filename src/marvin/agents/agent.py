@@ -20,6 +20,7 @@ from marvin._internal.integrations.fastmcp import (
 )
 from marvin.agents.actor import Actor
 from marvin.agents.names import AGENT_NAMES
+from marvin.engine.context import ContextPolicy
 from marvin.memory.memory import Memory
 from marvin.prompts import Template
 from marvin.utilities.logging import get_logger
@@ -93,6 +94,15 @@ class Agent(Actor):
         repr=False,
     )
 
+    context_policy: ContextPolicy | None = field(
+        default=None,
+        metadata={
+            "description": "Limits the thread history sent to the model on"
+            " each turn. None sends the full history."
+        },
+        repr=False,
+    )
+
     def __hash__(self) -> int:
         return super().__hash__()
 
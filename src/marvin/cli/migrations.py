@@ -3,17 +3,12 @@
 import asyncio
 import os
 import sys
+from datetime import timedelta
 
 import typer
 from rich.console import Console
 from rich.table import Table
 
-from marvin.database import (
-    ALEMBIC_DIR,
-    ALEMBIC_INI,
-    get_async_engine,
-    is_sqlite,
-)
 from marvin.utilities.logging import get_logger
 
 logger = get_logger(__name__)
@@ -34,6 +29,8 @@ def get_alembic_cfg():
     """Get the Alembic config."""
     from alembic.config import Config
 
+    from marvin.database import ALEMBIC_INI
+
     cfg = Config(str(ALEMBIC_INI))
     return cfg
 
@@ -59,6 +56,8 @@ def revision(
     message: str = typer.Option(None, "--message", "-m", help="Migration message"),
 ):
     """Create a new migration revision. Developer command."""
+    from marvin.database import ALEMBIC_DIR
+
     try:
         # Ensure versions directory exists
         versions_dir = ALEMBIC_DIR / "versions"
@@ -87,6 +86,8 @@ def upgrade(
     try:
         from alembic import command
 
+        from marvin.database import ALEMBIC_DIR
+
         # Ensure versions directory exists
         versions_dir = ALEMBIC_DIR / "versions"
         os.makedirs(versions_dir, exist_ok=True)
@@ -164,6 +165,78 @@ def reset(
         sys.exit(1)
 
 
+@migrations.command("compact")
+def compact(
+    older_than_days: float = typer.Option(
+        None,
+        "--older-than-days",
+        help="Delete threads with no messages in this many days",
+    ),
+    max_messages: int = typer.Option(
+        None,
+        "--max-messages",
+        help="Keep only this many of the newest messages of each thread",
+    ),
+    batch_size: int = typer.Option(
+        500, "--batch-size", help="Threads or messages deleted per transaction"
+    ),
+    vacuum: bool = typer.Option(
+        True, "--vacuum/--no-vacuum", help="Reclaim free space after deleting"
+    ),
+    yes: bool = typer.Option(
+        False, "--yes", "-y", help="Confirm the destructive operation without prompting"
+    ),
+):
+    """Delete old threads and messages and reclaim space. Requires confirmation."""
+    if older_than_days is None and max_messages is None and not vacuum:
+        console.print("[yellow]Nothing to do.[/yellow]")
+        return
+
+    if not yes and (older_than_days is not None or max_messages is not None):
+        confirmation = typer.confirm(
+            "WARNING: You are about to permanently delete threads and messages. "
+            "Continue?",
+            default=False,
+        )
+        if not confirmation:
+            console.print("[yellow]Operation cancelled.[/yellow]")
+            sys.exit(0)
+
+    from marvin.database import compact_database_async, dispose_async_engine
+
+    async def run_compaction():
+        try:
+            return await compact_database_async(
+                older_than=(
+                    timedelta(days=older_than_days)
+                    if older_than_days is not None
+                    else None
+                ),
+                max_messages_per_thread=max_messages,
+                batch_size=batch_size,
+                vacuum=vacuum,
+            )
+        finally:
+            await dispose_async_engine()
+
+    try:
+        result = asyncio.run(run_compaction())
+    except Exception as e:
+        console.print(f"[red]Failed to compact database: {e}[/red]")
+        sys.exit(1)
+
+    result_table = Table.grid(padding=(0, 2))
+    result_table.add_column(style="bold")
+    result_table.add_column(justify="right")
+    result_table.add_row("Threads deleted:", str(result.threads))
+    result_table.add_row("Messages deleted:", str(result.messages))
+    result_table.add_row("LLM calls deleted:", str(result.llm_calls))
+    result_table.add_row("Blobs deleted:", str(result.blobs))
+    result_table.add_row("Attachments deleted:", str(result.attachments))
+    console.print(result_table)
+    console.print("[green]Database compacted[/green]")
+
+
 @migrations.command("history")
 def history():
     """Show migration history."""
@@ -204,6 +277,7 @@ async def _get_migration_status(connection, alembic_cfg, script):
 @migrations.command("status")
 def status():
     """Show database migration status and information."""
+    from marvin.database import ALEMBIC_DIR, get_async_engine, is_sqlite
     from marvin.settings import settings
 
     is_sqlite_db = is_sqlite()
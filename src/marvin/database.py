@@ -4,11 +4,20 @@ This module provides utilities for managing database sessions and migrations.
 """
 
 import asyncio
+import atexit
+import base64
+import hashlib
 import inspect
+import mmap
+import os
+import tempfile
+import threading
 import uuid
-from collections.abc import AsyncGenerator
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Iterable, Mapping, Sequence
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 from urllib.parse import urlparse
@@ -21,11 +30,25 @@ from sqlalchemy import (
     TIMESTAMP,
     ForeignKey,
     Index,
+    LargeBinary,
     String,
+    Text,
     TypeDecorator,
+    cast,
+    column,
+    delete,
+    event,
+    exists,
     func,
+    insert,
+    or_,
     select,
+    table,
 )
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -35,18 +58,21 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    aliased,
     mapped_column,
     relationship,
 )
 
 import marvin
+from marvin._internal.deprecation import deprecated_callable
 from marvin.settings import settings
 from marvin.utilities.logging import get_logger
+from marvin.utilities.tokens import estimate_message_tokens
 
 from .engine.llm import PydanticAIMessage
 
 if TYPE_CHECKING:
-    from marvin.thread import Message
+    from marvin.thread import Checkpoint, Message
 
 logger = get_logger(__name__)
 message_adapter: TypeAdapter[PydanticAIMessage] = TypeAdapter(
@@ -57,7 +83,13 @@ usage_adapter: TypeAdapter[Usage] = TypeAdapter(Usage)
 
 # Module-level cache for engines and sessionmakers
 _async_engine_cache: dict[Any, AsyncEngine] = {}
-db_initialized = False
+_engine_state_cache: dict[Any, "_EngineState"] = {}
+
+# Databases whose tables were created or verified in this process, by URL.
+# Engines of different event loops may initialize the same database from
+# different threads, so initialization is serialized by a process-wide lock.
+_initialized_databases: set[str | None] = set()
+_initialize_lock = threading.Lock()
 
 # Migration constants
 MARVIN_DIR = Path(marvin.__file__).parent.parent.parent
@@ -79,6 +111,13 @@ def serialize_message(message: PydanticAIMessage) -> str:
     return message_adapter.dump_python(message, mode="json")
 
 
+def deserialize_message(data: dict[str, Any]) -> PydanticAIMessage:
+    """Validate a serialized message, reading any attachments it references."""
+    if _has_blob_refs(data):
+        data = _resolve_blob_refs(data, {})
+    return message_adapter.validate_python(data)
+
+
 def get_async_engine() -> AsyncEngine:
     """Get the SQLAlchemy engine for async operations.
 
@@ -99,16 +138,94 @@ def get_async_engine() -> AsyncEngine:
 
         # Handle SQLite databases (default)
         if is_sqlite():
-            engine = create_async_engine(url, echo=False)
+            if _use_sqlite_performance_profile():
+                # a single connection serializes all writes; reads go through
+                # a separate reader engine (see `get_async_session`)
+                engine = create_async_engine(
+                    url,
+                    echo=False,
+                    **{**_get_pool_kwargs(), "pool_size": 1, "max_overflow": 0},
+                )
+                _set_sqlite_pragmas(engine)
+            else:
+                engine = create_async_engine(url, echo=False, **_get_pool_kwargs())
         # Handle other databases (use URL as-is)
         else:
-            engine = create_async_engine(url, echo=False)
+            engine = create_async_engine(url, echo=False, **_get_pool_kwargs())
 
         _async_engine_cache[loop] = engine
 
     return _async_engine_cache[loop]
 
 
+def _get_pool_kwargs() -> dict[str, Any]:
+    """Connection pool arguments for `create_async_engine`, from settings.
+
+    `pool_size` and `max_overflow` only apply to queue-based pools, so they are
+    only passed when configured.
+    """
+    kwargs: dict[str, Any] = {"pool_pre_ping": settings.database_pool_pre_ping}
+    if settings.database_pool_size is not None:
+        kwargs["pool_size"] = settings.database_pool_size
+    if settings.database_max_overflow is not None:
+        kwargs["max_overflow"] = settings.database_max_overflow
+    if settings.database_pool_recycle is not None:
+        kwargs["pool_recycle"] = settings.database_pool_recycle
+    return kwargs
+
+
+# Pragmas applied to every connection by the SQLite "performance" profile
+SQLITE_PERFORMANCE_PRAGMAS: dict[str, str | int] = {
+    # readers don't block writers and writers don't block readers
+    "journal_mode": "WAL",
+    # WAL is still crash-safe with NORMAL; only fsync at checkpoints
+    "synchronous": "NORMAL",
+    # 64 MiB page cache (negative values are in KiB)
+    "cache_size": -64 * 1024,
+    # 256 MiB of memory-mapped I/O
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    # wait for locks held by other processes instead of failing immediately
+    "busy_timeout": 5000,
+}
+
+
+def _use_sqlite_performance_profile() -> bool:
+    """Whether the SQLite performance profile applies to the configured database.
+
+    The profile only applies to file-based databases; in-memory databases
+    already share a single connection.
+    """
+    if settings.database_sqlite_profile != "performance" or not is_sqlite():
+        return False
+    url = settings.database_url or ""
+    path = urlparse(url).path
+    return path not in ("", "/", "/:memory:") and "mode=memory" not in url
+
+
+def _set_sqlite_pragmas(engine: AsyncEngine, *, readonly: bool = False) -> None:
+    """Apply the performance profile pragmas whenever the engine connects."""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PERFORMANCE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _create_sqlite_read_engine() -> AsyncEngine:
+    """Create the reader engine used by the SQLite performance profile."""
+    url = settings.database_url
+    if url is None:
+        raise ValueError("Database URL is not configured")
+    engine = create_async_engine(url, echo=False, **_get_pool_kwargs())
+    _set_sqlite_pragmas(engine, readonly=True)
+    return engine
+
+
 def is_sqlite() -> bool:
     """Check if the configured database is SQLite."""
     url = settings.database_url
@@ -134,6 +251,11 @@ def utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def as_utc(dt: datetime) -> datetime:
+    """Treat naive timestamps (SQLite drops the offset) as UTC."""
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
 class Base(DeclarativeBase):
     """Base class for all database models."""
 
@@ -145,6 +267,9 @@ class DBThread(Base):
 
     id: Mapped[str] = mapped_column(String, primary_key=True)
     parent_thread_id: Mapped[str | None] = mapped_column(ForeignKey("threads.id"))
+    # for forked threads, the last sequence number of the parent's history that
+    # the thread shares
+    fork_seq: Mapped[int | None] = mapped_column(nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=utc_now
     )
@@ -158,6 +283,8 @@ class DBThread(Base):
         session: AsyncSession | None = None,
         id: str | None = None,
         parent_thread_id: str | None = None,
+        fork_seq: int | None = None,
+        if_not_exists: bool = False,
     ) -> "DBThread":
         """Create a new thread record.
 
@@ -165,16 +292,48 @@ class DBThread(Base):
             session: Database session to use
             id: Optional ID to use for the thread. If not provided, a UUID will be generated.
             parent_thread_id: Optional ID of the parent thread
+            fork_seq: For forks, the last sequence number of the parent's
+                history that the thread shares
+            if_not_exists: If True, the thread is inserted with `INSERT ... ON
+                CONFLICT DO NOTHING`, so an existing thread with the same ID is
+                left unchanged instead of raising an error
 
         Returns:
             The created DBThread instance
         """
-        async with get_async_session(session) as session:
-            thread = cls(
-                id=id or str(uuid.uuid4()),
-                parent_thread_id=parent_thread_id,
-            )
-            session.add(thread)
+        thread = cls(
+            id=id or str(uuid.uuid4()),
+            parent_thread_id=parent_thread_id,
+            fork_seq=fork_seq,
+            created_at=utc_now(),
+        )
+
+        queue = get_write_behind_queue() if session is None else None
+        if queue is not None:
+            # buffered threads are inserted with ON CONFLICT DO NOTHING, so
+            # whether the thread is new isn't known until the queue flushes
+            await queue.add_all([thread])
+            created = False
+        else:
+            async with get_async_session(session) as session:
+                if if_not_exists:
+                    values = {
+                        "id": thread.id,
+                        "parent_thread_id": thread.parent_thread_id,
+                        "fork_seq": thread.fork_seq,
+                        "created_at": thread.created_at,
+                    }
+                    created = await _insert_missing(session, cls, [values]) == 1
+                else:
+                    session.add(thread)
+                    created = True
+        mark_thread_known(thread.id)
+
+        # a new thread has no messages, so its sequence numbers start at 1, or
+        # after the shared history of a fork. Otherwise they are loaded from
+        # the database and the write-behind queue when they are first allocated.
+        if created:
+            _advance_message_seq(thread.id, (fork_seq or 0) + 1)
         return thread
 
 
@@ -187,12 +346,21 @@ class DBLLMCallMessage(Base):
     llm_call_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("llm_calls.id"), index=True
     )
-    message_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("messages.id"), index=True)
+    message_id: Mapped[uuid.UUID | None] = mapped_column(
+        ForeignKey("messages.id"), index=True
+    )
+    # Set instead of `message_id` for the summary of a checkpoint, which isn't
+    # stored as a message; see `marvin.thread.Checkpoint.to_message`
+    checkpoint_id: Mapped[uuid.UUID | None] = mapped_column(
+        ForeignKey("checkpoints.id"), default=None
+    )
     in_initial_prompt: Mapped[bool] = mapped_column()
     order: Mapped[int] = mapped_column()  # Track message order within the call
 
     llm_call: Mapped["DBLLMCall"] = relationship(back_populates="message_mappings")
-    message: Mapped["DBMessage"] = relationship(back_populates="llm_call_mappings")
+    message: Mapped["DBMessage | None"] = relationship(
+        back_populates="llm_call_mappings"
+    )
 
 
 class DBMessage(Base):
@@ -204,6 +372,17 @@ class DBMessage(Base):
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=utc_now, server_default=func.now()
     )
+    # Position of the message within its thread, see `allocate_message_seqs`
+    seq: Mapped[int | None] = mapped_column(default=None)
+    # Denormalized from the message so reads can filter by role in SQL
+    role: Mapped[str | None] = mapped_column(
+        String,
+        default=lambda context: message_role(
+            context.get_current_parameters()["message"]
+        ),
+    )
+    # Estimated when the message is stored, see `marvin.utilities.tokens`
+    tokens: Mapped[int | None] = mapped_column(default=None)
 
     # Create a composite index on thread_id and timestamp in descending order
     # Using SQLAlchemy's proper syntax for descending index
@@ -213,6 +392,8 @@ class DBMessage(Base):
             "thread_id",
             created_at.desc(),
         ),
+        Index("ix_messages_thread_id_seq", "thread_id", "seq", unique=True),
+        Index("ix_messages_thread_id_role_seq", "thread_id", "role", "seq"),
     )
 
     thread: Mapped[DBThread] = relationship(back_populates="messages")
@@ -226,24 +407,454 @@ class DBMessage(Base):
         thread_id: str,
         message: PydanticAIMessage,
         created_at: datetime | None = None,
+        seq: int | None = None,
     ) -> "DBMessage":
-        return cls(
+        """Create a message record.
+
+        Large part contents are moved to blobs and binary contents to the
+        attachment store (see `settings.database_blob_min_size`); insert
+        `blob_rows()` along with the message.
+        """
+        message_data = serialize_message(message)
+        data, blobs = _extract_blobs(message_data)
+        data, attachments = _extract_attachments(data)
+        db_message = cls(
+            # assign the id up front so the message can be referenced before
+            # it is flushed (e.g. by the write-behind queue)
+            id=uuid.uuid4(),
             thread_id=thread_id,
-            message=serialize_message(message),
+            message=data,
             created_at=created_at or utc_now(),
+            seq=seq,
+            role=message_role(data),
+            tokens=estimate_message_tokens(message_data),
         )
+        db_message._new_blobs = blobs
+        db_message._new_attachments = attachments
+        db_message._search_text = message_search_text(message_data)
+        return db_message
 
-    def to_message(self) -> "Message":
+    def blob_rows(self) -> list["DBBlob | DBAttachment"]:
+        """Blob records for the contents moved out of this message when it was created.
+
+        Attachments are only included when they are stored in the database;
+        the filesystem store writes them when the message is created.
+        """
+        rows: list[DBBlob | DBAttachment] = [
+            DBBlob(hash=hash, content=content)
+            for hash, content in getattr(self, "_new_blobs", {}).items()
+        ]
+        if _attachment_store() is None:
+            rows.extend(
+                DBAttachment(hash=hash, data=data)
+                for hash, data in getattr(self, "_new_attachments", {}).items()
+            )
+        return rows
+
+    def to_message(self, blobs: Mapping[str, str | bytes] | None = None) -> "Message":
+        """Convert to a thread message, restoring contents that were moved to blobs.
+
+        The message is validated lazily, on first access to `Message.message`.
+        Attachments on the filesystem are also read then.
+
+        Args:
+            blobs: Blob contents by hash, as returned by `load_blobs`.
+        """
         import marvin.thread
 
-        return marvin.thread.Message(
+        message = self.message
+        if _has_blob_refs(message):
+            message = _resolve_blob_refs(
+                message,
+                {
+                    **getattr(self, "_new_blobs", {}),
+                    **getattr(self, "_new_attachments", {}),
+                    **(blobs or {}),
+                },
+                read_attachments=False,
+            )
+
+        return marvin.thread.Message.from_data(
+            message,
             id=self.id,
             thread_id=self.thread_id,
-            message=message_adapter.validate_python(self.message),
             created_at=self.created_at,
+            seq=self.seq,
+            tokens=self.tokens,
         )
 
 
+class DBBlob(Base):
+    """Message contents stored once and referenced by their SHA-256 hash."""
+
+    __tablename__ = "blobs"
+
+    hash: Mapped[str] = mapped_column(String, primary_key=True)
+    content: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), default=utc_now
+    )
+
+
+class DBAttachment(Base):
+    """Binary message contents stored once and referenced by their SHA-256 hash.
+
+    Only used when attachments are stored in the database, see
+    `settings.database_attachment_store`.
+    """
+
+    __tablename__ = "attachments"
+
+    hash: Mapped[str] = mapped_column(String, primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), default=utc_now
+    )
+
+
+class DBCheckpoint(Base):
+    """A summary of a thread's history up to and including `through_seq`.
+
+    Checkpoints let long threads send the summary and the messages after it
+    instead of their full history; see `marvin.engine.context.CompactionPolicy`.
+    Each checkpoint also summarizes the thread's previous checkpoint.
+    """
+
+    __tablename__ = "checkpoints"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    thread_id: Mapped[str] = mapped_column(ForeignKey("threads.id"))
+    through_seq: Mapped[int] = mapped_column()
+    summary: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), default=utc_now
+    )
+
+    __table_args__ = (
+        Index("ix_checkpoints_thread_id_through_seq", "thread_id", "through_seq"),
+    )
+
+    def to_checkpoint(self) -> "Checkpoint":
+        """Convert to a thread checkpoint."""
+        import marvin.thread
+
+        return marvin.thread.Checkpoint(
+            id=self.id,
+            thread_id=self.thread_id,
+            through_seq=self.through_seq,
+            summary=self.summary,
+            created_at=as_utc(self.created_at),
+        )
+
+
+class _BlobCache:
+    """A thread-safe LRU cache of blob contents by hash, bounded in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, hash: str) -> str | None:
+        with self._lock:
+            content = self._entries.get(hash)
+            if content is not None:
+                self._entries.move_to_end(hash)
+            return content
+
+    def put(self, hash: str, content: str) -> None:
+        with self._lock:
+            if hash in self._entries:
+                self._entries.move_to_end(hash)
+                return
+            self._entries[hash] = content
+            self._size += len(content)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def discard(self, hash: str) -> None:
+        with self._lock:
+            content = self._entries.pop(hash, None)
+            if content is not None:
+                self._size -= len(content)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_blob_cache = _BlobCache(max_bytes=32 * 1024 * 1024)
+
+
+class _FileAttachmentStore:
+    """Attachments stored as files named by their hash.
+
+    Files are read with memory mapping, so the OS page cache serves repeated
+    reads of the same attachment.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def _file(self, hash: str) -> Path:
+        return self.path / hash[:2] / hash
+
+    def put(self, hash: str, data: bytes) -> None:
+        file = self._file(hash)
+        if file.exists():
+            return
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so readers never see partial data
+        fd, temp_name = tempfile.mkstemp(dir=file.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_name, file)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+    def delete(self, hash: str) -> None:
+        self._file(hash).unlink(missing_ok=True)
+
+    def get(self, hash: str) -> bytes | None:
+        try:
+            with open(self._file(hash), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return data[:]
+        except FileNotFoundError:
+            return None
+
+
+def _attachment_store() -> _FileAttachmentStore | None:
+    """The filesystem attachment store, or None to store attachments in the database."""
+    store = settings.database_attachment_store
+    if store == "database" or (store == "auto" and not is_sqlite()):
+        return None
+    path = settings.database_attachment_path or settings.home_path / "attachments"
+    return _FileAttachmentStore(Path(path).expanduser())
+
+
+def _extract_blobs(message: dict[str, Any]) -> tuple[dict[str, Any], dict[str, str]]:
+    """Replace large string part contents with references to blobs.
+
+    Returns the message and the extracted contents by hash.
+    """
+    min_size = settings.database_blob_min_size
+    if not min_size:
+        return message, {}
+
+    blobs: dict[str, str] = {}
+    parts: list[dict[str, Any]] = []
+    for part in message.get("parts", []):
+        content = part.get("content")
+        # a character takes at most 4 bytes in UTF-8
+        if isinstance(content, str) and len(content) * 4 >= min_size:
+            encoded = content.encode()
+            if len(encoded) >= min_size:
+                hash = hashlib.sha256(encoded).hexdigest()
+                blobs[hash] = content
+                _blob_cache.put(hash, content)
+                part = {k: v for k, v in part.items() if k != "content"}
+                part["content_blob"] = hash
+        parts.append(part)
+
+    if not blobs:
+        return message, {}
+    return {**message, "parts": parts}, blobs
+
+
+def _extract_attachments(
+    message: dict[str, Any],
+) -> tuple[dict[str, Any], dict[str, bytes]]:
+    """Replace large binary contents with references to attachments.
+
+    Binary contents are serialized as base64 in the message; they are decoded
+    and stored once by hash instead. With the filesystem store they are
+    written right away, which is safe before the message is committed because
+    they are content-addressed.
+
+    Returns the message and the extracted data by hash.
+    """
+    min_size = settings.database_blob_min_size
+    if not min_size:
+        return message, {}
+
+    attachments: dict[str, bytes] = {}
+    parts: list[dict[str, Any]] = []
+    for part in message.get("parts", []):
+        content = part.get("content")
+        if isinstance(content, list) and any(
+            _is_binary_content(item) for item in content
+        ):
+            items = []
+            for item in content:
+                # base64 takes 4 characters for every 3 bytes
+                if _is_binary_content(item) and len(item["data"]) * 3 >= min_size * 4:
+                    # pydantic encodes bytes with the URL-safe alphabet, which
+                    # the URL-safe decoder reads along with the standard one
+                    data = base64.urlsafe_b64decode(item["data"])
+                    hash = hashlib.sha256(data).hexdigest()
+                    attachments[hash] = data
+                    item = {k: v for k, v in item.items() if k != "data"}
+                    item["data_blob"] = hash
+                items.append(item)
+            part = {**part, "content": items}
+        parts.append(part)
+
+    if not attachments:
+        return message, {}
+    if (store := _attachment_store()) is not None:
+        for hash, data in attachments.items():
+            store.put(hash, data)
+    return {**message, "parts": parts}, attachments
+
+
+def _is_binary_content(item: Any) -> bool:
+    return (
+        isinstance(item, dict)
+        and item.get("kind") == "binary"
+        and isinstance(item.get("data"), str)
+    )
+
+
+def _attachment_refs(message: dict[str, Any]) -> Iterable[str]:
+    for part in message.get("parts", []):
+        if isinstance(content := part.get("content"), list):
+            for item in content:
+                if isinstance(item, dict) and "data_blob" in item:
+                    yield item["data_blob"]
+
+
+def _has_blob_refs(message: dict[str, Any]) -> bool:
+    return any(
+        "content_blob" in part
+        or (
+            isinstance(content := part.get("content"), list)
+            and any(isinstance(item, dict) and "data_blob" in item for item in content)
+        )
+        for part in message.get("parts", [])
+    )
+
+
+def _resolve_blob_refs(
+    message: dict[str, Any],
+    blobs: Mapping[str, str | bytes],
+    read_attachments: bool = True,
+) -> dict[str, Any]:
+    """Restore blob contents into a serialized message.
+
+    With `read_attachments=False`, attachments that aren't in `blobs` are left
+    as references, to be read from the attachment store later.
+    """
+    parts: list[dict[str, Any]] = []
+    for part in message.get("parts", []):
+        if (hash := part.get("content_blob")) is not None:
+            content = blobs.get(hash)
+            if content is None:
+                content = _blob_cache.get(hash)
+            if content is None:
+                raise ValueError(
+                    f"Blob {hash} has not been loaded; use `load_blobs` before "
+                    "converting messages"
+                )
+            if isinstance(content, bytes):
+                # an attachment with the same hash holds the same bytes
+                content = content.decode()
+            part = {k: v for k, v in part.items() if k != "content_blob"}
+            part["content"] = content
+        elif isinstance(content := part.get("content"), list):
+            part = {
+                **part,
+                "content": [
+                    _resolve_attachment(item, blobs, read_attachments)
+                    for item in content
+                ],
+            }
+        parts.append(part)
+    return {**message, "parts": parts}
+
+
+def _resolve_attachment(
+    item: Any, blobs: Mapping[str, str | bytes], read_attachments: bool
+) -> Any:
+    if not isinstance(item, dict) or (hash := item.get("data_blob")) is None:
+        return item
+    data = blobs.get(hash)
+    if data is None and (store := _attachment_store()) is not None:
+        if not read_attachments:
+            return item
+        data = store.get(hash)
+    if data is None:
+        raise ValueError(
+            f"Attachment {hash} has not been loaded; use `load_blobs` before "
+            "converting messages"
+        )
+    if isinstance(data, str):
+        # a text blob with the same hash holds the same bytes
+        data = data.encode()
+    item = {k: v for k, v in item.items() if k != "data_blob"}
+    # the adapter decodes base64 from JSON, but takes raw bytes from Python
+    item["data"] = data
+    return item
+
+
+async def load_blobs(
+    session: AsyncSession, db_messages: Iterable[DBMessage]
+) -> dict[str, str | bytes]:
+    """Load the blobs referenced by messages, for `DBMessage.to_message`.
+
+    Blobs are fetched in a single query and cached in memory. Attachments in
+    the database are fetched in a second query; attachments on the filesystem
+    are read when the messages are converted.
+
+    Returns:
+        Blob contents by hash
+    """
+    db_messages = list(db_messages)
+    hashes = {
+        part["content_blob"]
+        for db_message in db_messages
+        for part in db_message.message.get("parts", [])
+        if "content_blob" in part
+    }
+    blobs: dict[str, str | bytes] = {}
+    if _attachment_store() is None:
+        attachment_hashes = {
+            hash
+            for db_message in db_messages
+            for hash in _attachment_refs(db_message.message)
+        }
+        if attachment_hashes:
+            result = await session.execute(
+                select(DBAttachment.hash, DBAttachment.data).where(
+                    DBAttachment.hash.in_(attachment_hashes)
+                )
+            )
+            blobs.update(result.tuples().all())
+
+    missing: list[str] = []
+    for hash in hashes:
+        if (content := _blob_cache.get(hash)) is not None:
+            blobs[hash] = content
+        else:
+            missing.append(hash)
+
+    if missing:
+        result = await session.execute(
+            select(DBBlob.hash, DBBlob.content).where(DBBlob.hash.in_(missing))
+        )
+        for hash, content in result:
+            blobs[hash] = content
+            _blob_cache.put(hash, content)
+    return blobs
+
+
 class UsageType(TypeDecorator[Usage]):
     """Custom type for Usage objects that stores them as JSON in the database."""
 
@@ -267,6 +878,21 @@ class UsageType(TypeDecorator[Usage]):
         return usage_adapter.validate_python(value)
 
 
+# Usage fields that are materialized as integer columns of `llm_calls`. The
+# provider-specific `details` are only stored in the usage JSON.
+USAGE_COLUMNS = (
+    "requests",
+    "tool_calls",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_tokens",
+    "cache_write_tokens",
+    "input_audio_tokens",
+    "cache_audio_read_tokens",
+    "output_audio_tokens",
+)
+
+
 class DBLLMCall(Base):
     __tablename__ = "llm_calls"
 
@@ -277,6 +903,31 @@ class DBLLMCall(Base):
         TIMESTAMP(timezone=True), default=utc_now
     )
 
+    model: Mapped[str | None] = mapped_column(String, default=None)
+
+    # Token counts from `usage`, materialized so they can be summed in SQL
+    requests: Mapped[int] = mapped_column(default=0, server_default="0")
+    tool_calls: Mapped[int] = mapped_column(default=0, server_default="0")
+    input_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    output_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    cache_read_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    cache_write_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    input_audio_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    cache_audio_read_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+    output_audio_tokens: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    # Prompt and completion messages that form a range of thread sequence
+    # numbers are stored as that range rather than as llm_call_messages rows.
+    # Ranges only hold non-system messages; see `DBLLMCall.create`.
+    prompt_start_seq: Mapped[int | None] = mapped_column(default=None)
+    prompt_end_seq: Mapped[int | None] = mapped_column(default=None)
+    completion_start_seq: Mapped[int | None] = mapped_column(default=None)
+    completion_end_seq: Mapped[int | None] = mapped_column(default=None)
+
+    __table_args__ = (
+        Index("ix_llm_calls_thread_id_timestamp", "thread_id", "timestamp"),
+    )
+
     message_mappings: Mapped[list[DBLLMCallMessage]] = relationship(
         back_populates="llm_call"
     )
@@ -290,60 +941,517 @@ class DBLLMCall(Base):
         prompt_messages: list["DBMessage | Message"] | None = None,
         completion_messages: list["DBMessage | Message"] | None = None,
         session: AsyncSession | None = None,
+        prompt_history_start: int | None = None,
+        model: str | None = None,
     ) -> "DBLLMCall":
         """Create a new LLM call record.
 
+        Messages are stored as a range of thread sequence numbers where
+        possible, so a call doesn't need one mapping row per message. Any
+        other messages, such as the system prompt, are mapped individually.
+        Checkpoint summaries are mapped by the ID of their checkpoint.
+
         Args:
             thread_id: ID of the thread this call belongs to
             usage: Usage information from the model
+            prompt_messages: Messages sent to the model, in order
+            completion_messages: Messages returned by the model, in order
             session: Optional database session. If not provided, a new one will be created.
+            prompt_history_start: Index into `prompt_messages` from which the
+                prompt is a stretch of the thread's history without system
+                messages and without gaps, e.g. the end of
+                `Thread.get_messages(include_system_messages=False)`. Those
+                messages are stored as a range even if system messages of the
+                thread fall between them, so any other message that was left
+                out must come before the index.
+            model: Name of the model that was called
 
         Returns:
             The created DBLLMCall instance
         """
         llm_call_id = uuid.uuid4()
-        llm_call = cls(id=llm_call_id, thread_id=thread_id, usage=usage)
+        llm_call = cls(
+            id=llm_call_id,
+            thread_id=thread_id,
+            usage=usage,
+            timestamp=utc_now(),
+            model=model,
+            **{name: getattr(usage, name, 0) or 0 for name in USAGE_COLUMNS},
+        )
+        prompt_messages = prompt_messages or []
+        completion_messages = completion_messages or []
+        prompt_length = len(prompt_messages)
+
+        if prompt_history_start is None:
+            prompt_range_start = 0
+            prompt_range = _get_seq_range(thread_id, prompt_messages)
+        else:
+            prompt_range_start = prompt_history_start
+            prompt_range = _get_seq_range(
+                thread_id,
+                prompt_messages[prompt_history_start:],
+                contiguous=False,
+            )
+        if prompt_range is not None:
+            llm_call.prompt_start_seq, llm_call.prompt_end_seq = prompt_range
+            # only the messages before the range are mapped individually
+            prompt_messages = prompt_messages[:prompt_range_start]
+
+        completion_range = _get_seq_range(thread_id, completion_messages)
+        if completion_range is not None:
+            llm_call.completion_start_seq, llm_call.completion_end_seq = (
+                completion_range
+            )
+            completion_messages = []
 
-        async with get_async_session(session) as session:
-            session.add(llm_call)
+        rows: list[Base] = [llm_call]
 
-            # Add request messages, maintaining their original order
-            for i, message in enumerate(prompt_messages):
-                mapping = DBLLMCallMessage(
+        # Add request messages, maintaining their original order
+        for i, message in enumerate(prompt_messages):
+            checkpoint_id = getattr(message, "checkpoint_id", None)
+            rows.append(
+                DBLLMCallMessage(
+                    id=uuid.uuid4(),
                     llm_call_id=llm_call.id,
-                    message_id=message.id,
+                    message_id=message.id if checkpoint_id is None else None,
+                    checkpoint_id=checkpoint_id,
                     in_initial_prompt=True,
                     order=i,  # Set order based on position in the list
                 )
-                session.add(mapping)
+            )
 
-            # Add response messages, maintaining their original order
-            # Response messages come after request messages in order
-            start_order = len(prompt_messages)
-            for i, message in enumerate(completion_messages):
-                mapping = DBLLMCallMessage(
+        # Add response messages, maintaining their original order
+        # Response messages come after request messages in order
+        start_order = prompt_length
+        for i, message in enumerate(completion_messages):
+            rows.append(
+                DBLLMCallMessage(
+                    id=uuid.uuid4(),
                     llm_call_id=llm_call.id,
                     message_id=message.id,
                     in_initial_prompt=False,
                     order=start_order + i,  # Continue numbering after request messages
                 )
-                session.add(mapping)
+            )
+
+        queue = get_write_behind_queue() if session is None else None
+        if queue is not None:
+            await queue.add_all(rows)
+        else:
+            async with get_async_session(session) as session:
+                await bulk_insert(session, rows)
 
         return llm_call
 
 
+async def bulk_insert(session: AsyncSession, rows: Sequence[Base]) -> None:
+    """Insert new rows with one bulk INSERT per table.
+
+    The rows are inserted with executemany statements rather than through the
+    ORM unit of work, so they are not added to the session. Primary keys must
+    be assigned up front; attributes that are None are left to the column
+    defaults. Tables are inserted in dependency order. Threads, blobs, and
+    attachments that already exist are skipped.
+    """
+    values: dict[type[Base], list[dict[str, Any]]] = {}
+    for row in rows:
+        values.setdefault(type(row), []).append(
+            {
+                attr.key: value
+                for attr in row.__mapper__.column_attrs
+                if (value := row.__dict__.get(attr.key)) is not None
+            }
+        )
+
+    tables = Base.metadata.sorted_tables
+    for model in sorted(values, key=lambda model: tables.index(model.__table__)):
+        if model in (DBThread, DBBlob, DBAttachment):
+            await _insert_missing(session, model, values[model])
+        else:
+            await session.execute(insert(model), values[model])
+
+    # index the text of new messages for `marvin.thread.search_messages`
+    search_rows = [
+        {"message_id": str(row.id), "thread_id": row.thread_id, "text": text}
+        for row in rows
+        if isinstance(row, DBMessage) and (text := getattr(row, "_search_text", None))
+    ]
+    if search_rows:
+        await session.execute(insert(message_search_table), search_rows)
+
+
+async def _insert_missing(
+    session: AsyncSession, model: type[Base], values: list[dict[str, Any]]
+) -> int:
+    """Insert rows, skipping any whose primary key is already stored.
+
+    Blobs and attachments are content-addressed, so an existing row always has
+    the same content. Existing threads are left unchanged.
+
+    Returns:
+        The number of inserted rows, or -1 if the driver doesn't report it
+    """
+    dialect = session.bind.dialect.name if session.bind is not None else None
+    if dialect == "sqlite":
+        statement = sqlite_insert(model.__table__).on_conflict_do_nothing()
+    elif dialect == "postgresql":
+        statement = postgresql_insert(model.__table__).on_conflict_do_nothing()
+    else:
+        (key,) = model.__mapper__.primary_key
+        result = await session.execute(
+            select(key).where(key.in_([v[key.key] for v in values]))
+        )
+        existing = set(result.scalars().all())
+        values = [v for v in values if v[key.key] not in existing]
+        statement = insert(model.__table__)
+
+    if not values:
+        return 0
+    result = await session.execute(statement, values)
+    return result.rowcount
+
+
+def message_role(message: dict[str, Any]) -> str:
+    """The role of a serialized message, as stored in `DBMessage.role`.
+
+    Responses are "assistant" messages. Requests are "system" messages if they
+    hold a system prompt, "tool" messages if they only return tool results or
+    retry prompts, and "user" messages otherwise.
+    """
+    if message.get("kind") == "response":
+        return "assistant"
+    part_kinds = {part.get("part_kind") for part in message.get("parts", [])}
+    if "system-prompt" in part_kinds:
+        return "system"
+    if part_kinds and part_kinds <= {"tool-return", "retry-prompt"}:
+        return "tool"
+    return "user"
+
+
+def is_system_message(message: "DBMessage | Message") -> bool:
+    """Whether a message holds a system prompt."""
+    if isinstance(message, DBMessage):
+        if message.role is not None:
+            return message.role == "system"
+        return message_role(message.message) == "system"
+    return message.kind == "request" and "system-prompt" in message.part_kinds
+
+
+# ------------ Full-text search ------------
+
+# The full-text index of message text. SQLite uses an FTS5 virtual table and
+# PostgreSQL a generated tsvector column with a GIN index. Neither can be
+# described by the ORM, so the table is created with DDL alongside the other
+# tables. Other databases get a plain table that is searched with LIKE.
+MESSAGE_SEARCH_TABLE = "messages_fts"
+message_search_table = table(
+    MESSAGE_SEARCH_TABLE,
+    column("message_id", String),
+    column("thread_id", String),
+    column("text", Text),
+)
+
+_SEARCHABLE_PART_KINDS = {"user-prompt", "text", "tool-return"}
+
+
+def message_search_ddl(dialect: str) -> list[str]:
+    """Statements that create the full-text index table for a dialect."""
+    if dialect == "sqlite":
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {MESSAGE_SEARCH_TABLE} USING fts5("
+            "text, thread_id UNINDEXED, message_id UNINDEXED, "
+            "tokenize='porter unicode61')"
+        ]
+    if dialect == "postgresql":
+        return [
+            f"CREATE TABLE IF NOT EXISTS {MESSAGE_SEARCH_TABLE} ("
+            "message_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, "
+            "text TEXT NOT NULL, tsv TSVECTOR GENERATED ALWAYS AS "
+            "(to_tsvector('english', text)) STORED)",
+            f"CREATE INDEX IF NOT EXISTS ix_{MESSAGE_SEARCH_TABLE}_tsv "
+            f"ON {MESSAGE_SEARCH_TABLE} USING GIN (tsv)",
+            f"CREATE INDEX IF NOT EXISTS ix_{MESSAGE_SEARCH_TABLE}_thread_id "
+            f"ON {MESSAGE_SEARCH_TABLE} (thread_id)",
+        ]
+    return [
+        f"CREATE TABLE IF NOT EXISTS {MESSAGE_SEARCH_TABLE} ("
+        "message_id VARCHAR(36) PRIMARY KEY, thread_id VARCHAR(255) NOT NULL, "
+        "text TEXT NOT NULL)",
+    ]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_message_search_table(target, connection, **kwargs) -> None:
+    for statement in message_search_ddl(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def _drop_message_search_table(target, connection, **kwargs) -> None:
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {MESSAGE_SEARCH_TABLE}")
+
+
+def message_search_text(message: dict[str, Any]) -> str:
+    """The searchable text of a serialized message.
+
+    Only user prompts, model text and tool results are indexed; system prompts,
+    tool calls and binary contents are not.
+    """
+    texts: list[str] = []
+    for part in message.get("parts", []):
+        if part.get("part_kind") not in _SEARCHABLE_PART_KINDS:
+            continue
+        content = part.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(item for item in content if isinstance(item, str))
+    return "\n".join(texts)
+
+
+# ------------ Known threads ------------
+
+# Recently used threads that are known to exist, by (database URL, thread ID),
+# so threads that are resolved again skip the existence check.
+_MAX_KNOWN_THREADS = 10_000
+_known_threads: OrderedDict[tuple[str | None, str], None] = OrderedDict()
+_known_threads_lock = threading.Lock()
+
+
+def mark_thread_known(thread_id: str) -> None:
+    """Record that a thread exists in the database."""
+    key = (settings.database_url, thread_id)
+    with _known_threads_lock:
+        _known_threads[key] = None
+        _known_threads.move_to_end(key)
+        while len(_known_threads) > _MAX_KNOWN_THREADS:
+            _known_threads.popitem(last=False)
+
+
+def is_thread_known(thread_id: str) -> bool:
+    """Whether a thread was recently created or found in the database."""
+    key = (settings.database_url, thread_id)
+    with _known_threads_lock:
+        if key not in _known_threads:
+            return False
+        _known_threads.move_to_end(key)
+        return True
+
+
+def forget_threads(thread_ids: Iterable[str]) -> None:
+    """Remove deleted threads from the known threads."""
+    with _known_threads_lock:
+        for thread_id in thread_ids:
+            _known_threads.pop((settings.database_url, thread_id), None)
+
+
+# ------------ Message sequence numbers ------------
+
+# The next sequence number of recently used threads, by (database URL, thread
+# ID). Sequence numbers are allocated in-process; inserts that collide with
+# another process writing to the same thread are renumbered and retried.
+_MAX_TRACKED_THREAD_SEQS = 10_000
+_next_message_seqs: OrderedDict[tuple[str | None, str], int] = OrderedDict()
+_next_message_seqs_lock = threading.Lock()
+
+
+def _advance_message_seq(thread_id: str, next_seq: int) -> None:
+    """Make sure the next sequence number of a thread is at least `next_seq`."""
+    key = (settings.database_url, thread_id)
+    with _next_message_seqs_lock:
+        _next_message_seqs[key] = max(_next_message_seqs.get(key, 0), next_seq)
+        _next_message_seqs.move_to_end(key)
+        while len(_next_message_seqs) > _MAX_TRACKED_THREAD_SEQS:
+            _next_message_seqs.popitem(last=False)
+
+
+async def allocate_message_seqs(
+    thread_id: str, count: int, *, refresh: bool = False
+) -> int:
+    """Reserve `count` consecutive sequence numbers for new messages in a thread.
+
+    The next sequence number is loaded from the database the first time a
+    thread is used, or when `refresh` is True.
+
+    Returns:
+        The first reserved sequence number
+    """
+    key = (settings.database_url, thread_id)
+    if refresh or key not in _next_message_seqs:
+        async with get_async_session(readonly=True) as session:
+            result = await session.execute(
+                select(
+                    select(func.max(DBMessage.seq))
+                    .where(DBMessage.thread_id == thread_id)
+                    .scalar_subquery(),
+                    select(DBThread.fork_seq)
+                    .where(DBThread.id == thread_id)
+                    .scalar_subquery(),
+                )
+            )
+            last_seq, fork_seq = result.one()
+        # a fork's own messages are numbered after the history it shares
+        next_seq = max(last_seq or 0, fork_seq or 0) + 1
+        if (queue := get_write_behind_queue()) is not None:
+            for message in queue.pending_messages(thread_id):
+                if message.seq is not None:
+                    next_seq = max(next_seq, message.seq + 1)
+            for thread in queue.pending_threads(thread_id):
+                next_seq = max(next_seq, (thread.fork_seq or 0) + 1)
+        _advance_message_seq(thread_id, next_seq)
+
+    with _next_message_seqs_lock:
+        # the entry may have been evicted in the meantime
+        first_seq = _next_message_seqs.get(key, 1)
+        _next_message_seqs[key] = first_seq + count
+        _next_message_seqs.move_to_end(key)
+    return first_seq
+
+
+def _get_seq_range(
+    thread_id: str,
+    messages: Sequence["DBMessage | Message"],
+    contiguous: bool = True,
+) -> tuple[int, int] | None:
+    """The range of thread sequence numbers that holds exactly these messages.
+
+    Ranges only hold non-system messages. With `contiguous=False`, the caller
+    guarantees that any sequence numbers skipped by the messages belong to
+    system messages.
+    """
+    if not messages:
+        return None
+    seqs = [m.seq for m in messages]
+    if any(
+        seq is None or m.thread_id != thread_id or is_system_message(m)
+        for m, seq in zip(messages, seqs)
+    ):
+        return None
+    if any(b <= a for a, b in zip(seqs, seqs[1:])):
+        return None
+    if contiguous and seqs[-1] - seqs[0] != len(seqs) - 1:
+        return None
+    return seqs[0], seqs[-1]
+
+
+@dataclass
+class DatabaseStats:
+    """Counters for database activity in this process."""
+
+    sessions_opened: int = 0
+    schema_checks: int = 0
+
+
+database_stats = DatabaseStats()
+
+
+@dataclass
+class _EngineState:
+    """The session factory and schema status of an engine.
+
+    With the SQLite performance profile, the state also holds the reader
+    engine for read-only sessions and the lock that queues writers for the
+    engine's single connection.
+    """
+
+    engine: AsyncEngine
+    session_factory: async_sessionmaker[AsyncSession]
+    schema_ready: bool = False
+    schema_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    read_engine: AsyncEngine | None = None
+    read_session_factory: async_sessionmaker[AsyncSession] | None = None
+    write_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def dispose(self) -> None:
+        """Dispose the engines of this state."""
+        await self.engine.dispose()
+        if self.read_engine is not None:
+            await self.read_engine.dispose()
+
+
+def _get_engine_state(engine: AsyncEngine) -> _EngineState:
+    """Get the state for an engine, creating its session factory once.
+
+    States are cached by event loop, like engines, and are replaced when the
+    loop's engine changes.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    state = _engine_state_cache.get(loop)
+    if state is None or state.engine is not engine:
+        state = _EngineState(
+            engine=engine,
+            session_factory=async_sessionmaker(engine, expire_on_commit=False),
+        )
+        if _use_sqlite_performance_profile():
+            state.read_engine = _create_sqlite_read_engine()
+            state.read_session_factory = async_sessionmaker(
+                state.read_engine, expire_on_commit=False
+            )
+        _engine_state_cache[loop] = state
+    return state
+
+
+async def _ensure_schema(state: _EngineState) -> None:
+    """Create missing tables the first time a database is used.
+
+    Each database is checked once per process, no matter how many engines use
+    it. Existing tables are left as they are, so databases managed with
+    migrations are unaffected.
+    """
+    async with state.schema_lock:
+        if state.schema_ready:
+            return
+        url = settings.database_url
+        if url not in _initialized_databases:
+            # poll rather than block, so the lock is only ever taken on the
+            # event loop and a cancelled task can't leave it held
+            while not _initialize_lock.acquire(blocking=False):
+                await asyncio.sleep(0.01)
+            try:
+                if url not in _initialized_databases:
+                    database_stats.schema_checks += 1
+                    if is_sqlite():
+                        ensure_sqlite_directory()
+                    async with state.engine.begin() as conn:
+                        await conn.run_sync(Base.metadata.create_all)
+                    logger.debug("Verified database tables on first access")
+                    _initialized_databases.add(url)
+            finally:
+                _initialize_lock.release()
+        state.schema_ready = True
+
+
+def ensure_sqlite_directory() -> None:
+    """Create the parent directory of a file-based SQLite database."""
+    database = make_url(settings.database_url or "").database
+    if database and database != ":memory:" and not database.startswith("file:"):
+        Path(database).expanduser().parent.mkdir(parents=True, exist_ok=True)
+
+
 @asynccontextmanager
 async def get_async_session(
     session: AsyncSession | None = None,
+    *,
+    readonly: bool = False,
 ) -> AsyncGenerator[AsyncSession, None]:
     """Get an async database session.
 
     This uses the async_sessionmaker pattern for more consistent session management.
     If a session is provided, it is returned as-is.
 
+    With the SQLite performance profile, read-only sessions use a separate
+    reader pool and all other sessions wait their turn for the single writer
+    connection. Write sessions must not be nested.
+
     Args:
         session: An optional existing session to use. If provided, this function
             will yield it directly instead of creating a new one.
+        readonly: Whether the session will only read. Read-only sessions may
+            not see writes from sessions that are still open.
 
     Yields:
         An async SQLAlchemy session
@@ -353,28 +1461,34 @@ async def get_async_session(
         yield session
         return
 
-    # Try to get the engine - if this fails because tables don't exist,
-    # make sure to create them before proceeding
     engine = get_async_engine()
-    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    state = _get_engine_state(engine)
+
+    # make sure tables exist the first time this engine is used
+    if not state.schema_ready:
+        await _ensure_schema(state)
+
+    database_stats.sessions_opened += 1
+
+    if state.read_session_factory is None:
+        async with _open_session(state.session_factory) as session:
+            yield session
+    elif readonly:
+        async with _open_session(state.read_session_factory) as session:
+            yield session
+    else:
+        # queue writers for the single writer connection
+        async with state.write_lock:
+            async with _open_session(state.session_factory) as session:
+                yield session
+
 
-    # Create a session
+@asynccontextmanager
+async def _open_session(
+    session_factory: async_sessionmaker[AsyncSession],
+) -> AsyncGenerator[AsyncSession, None]:
     async with session_factory() as session:
         try:
-            # Check if tables exist by attempting a simple query
-            if is_sqlite():
-                try:
-                    # Try to query the threads table to see if it exists
-                    await session.execute(select(DBThread).limit(1))
-                except Exception as e:
-                    if "no such table" in str(e).lower():
-                        # Tables don't exist, create them
-                        logger.warning("Database tables don't exist, creating them now")
-                        async with engine.begin() as conn:
-                            await conn.run_sync(Base.metadata.create_all)
-                            logger.info("Created database tables on first access")
-
-            # Now yield the session
             yield session
             await session.commit()
         except Exception:
@@ -384,6 +1498,576 @@ async def get_async_session(
             await session.close()
 
 
+# ------------ Write-behind persistence ------------
+
+# Write-behind queues are cached by asyncio event loop, like engines
+_write_behind_queues: dict[Any, "WriteBehindQueue"] = {}
+_write_behind_atexit_registered = False
+
+
+class WriteBehindQueue:
+    """Buffers inserts from all threads and commits them in group commits.
+
+    Rows are committed in a single transaction once `max_batch_size` rows are
+    pending or `max_latency` seconds after the first buffered row, whichever
+    comes first. Rows stay visible through `pending_messages()` until their
+    transaction commits, so a thread can always read its own writes.
+
+    If a group commit fails, its rows are retried one at a time so a bad row,
+    such as one that violates a constraint, can't hold back the others.
+    Messages whose sequence number was taken by another writer are renumbered,
+    along with the thread's later buffered messages, and inserted again. Rows
+    that fail for other reasons are kept for the next flush and dropped, with
+    an error logged, once they have failed `max_attempts` flushes.
+    """
+
+    def __init__(self, max_batch_size: int, max_latency: float, max_attempts: int = 3):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_attempts = max_attempts
+        self._pending: list[Base] = []
+        self._flushing: list[Base] = []
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Task[None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    def _rows(self) -> list[Base]:
+        return self._flushing + self._pending
+
+    def has_thread(self, thread_id: str) -> bool:
+        """Whether a thread record is buffered but not yet committed."""
+        return any(
+            isinstance(row, DBThread) and row.id == thread_id for row in self._rows()
+        )
+
+    def pending_messages(self, thread_id: str) -> list[DBMessage]:
+        """Buffered messages for a thread, in insertion order."""
+        return [
+            row
+            for row in self._rows()
+            if isinstance(row, DBMessage) and row.thread_id == thread_id
+        ]
+
+    def pending_threads(self, thread_id: str) -> list[DBThread]:
+        """Buffered thread rows with the given ID."""
+        return [
+            row
+            for row in self._rows()
+            if isinstance(row, DBThread) and row.id == thread_id
+        ]
+
+    async def add_all(self, rows: Sequence[Base]) -> None:
+        """Buffer rows for insertion."""
+        self._pending.extend(rows)
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_after_latency()
+            )
+
+    async def _flush_after_latency(self) -> None:
+        await asyncio.sleep(self.max_latency)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush failed, will retry: {e}")
+
+    async def flush(self) -> None:
+        """Commit all buffered rows in a single transaction."""
+        async with self._lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, []
+            try:
+                await _insert_rows(self._flushing)
+            except Exception as e:
+                logger.warning(
+                    f"Write-behind group commit of {len(self._flushing)} rows"
+                    f" failed, retrying them one at a time: {e}"
+                )
+                # keep the failed rows, in order, so the next flush retries them
+                self._pending[:0] = await self._insert_one_at_a_time(self._flushing)
+            finally:
+                self._flushing = []
+
+    async def _insert_one_at_a_time(self, rows: list[Base]) -> list[Base]:
+        """Insert rows in separate transactions and return those to retry."""
+        retry: list[Base] = []
+        for i, row in enumerate(rows):
+            try:
+                await self._insert_row(row, rows[i + 1 :])
+            except _SeqCollision:
+                # still colliding with another writer, which isn't the row's fault
+                retry.append(row)
+            except Exception as e:
+                # counted on the row itself, so it moves with the row between queues
+                attempts = getattr(row, "_write_behind_attempts", 0) + 1
+                if attempts < self.max_attempts:
+                    row._write_behind_attempts = attempts
+                    retry.append(row)
+                else:
+                    logger.error(
+                        f"Dropping buffered {type(row).__name__} after"
+                        f" {attempts} failed write-behind flushes: {e}"
+                    )
+        return retry
+
+    async def _insert_row(self, row: Base, later_rows: Sequence[Base]) -> None:
+        """Insert a row, renumbering it if another writer took its sequence number.
+
+        Raises:
+            _SeqCollision: If the row still collided after `max_attempts`
+                renumberings
+        """
+        for _ in range(self.max_attempts):
+            try:
+                await _insert_rows([row])
+                return
+            except IntegrityError:
+                if not isinstance(row, DBMessage) or not await _is_seq_taken(row):
+                    raise
+            messages = [
+                m
+                for m in [row, *later_rows, *self._pending]
+                if isinstance(m, DBMessage) and m.thread_id == row.thread_id
+            ]
+            await _renumber_messages(messages)
+        raise _SeqCollision(row.thread_id)
+
+    def drain(self) -> list[Base]:
+        """Remove and return all buffered rows without committing them."""
+        rows, self._pending = self._pending, []
+        return rows
+
+
+class _SeqCollision(Exception):
+    """A buffered message kept colliding with messages of other writers."""
+
+
+async def _insert_rows(rows: Sequence[Base]) -> None:
+    async with get_async_session() as session:
+        await bulk_insert(session, rows)
+
+
+async def _is_seq_taken(message: DBMessage) -> bool:
+    """Whether another message of the thread already has the message's seq."""
+    async with get_async_session(readonly=True) as session:
+        result = await session.execute(
+            select(DBMessage.id)
+            .where(
+                DBMessage.thread_id == message.thread_id,
+                DBMessage.seq == message.seq,
+                DBMessage.id != message.id,
+            )
+            .limit(1)
+        )
+        return result.first() is not None
+
+
+async def _renumber_messages(messages: Sequence[DBMessage]) -> None:
+    """Give buffered messages of one thread new sequence numbers, in order.
+
+    The thread messages returned for them by `Thread.add_messages_async` are
+    renumbered as well.
+    """
+    # numbered after all buffered messages, including these, so reads in the
+    # meantime never see two messages with the same number
+    first_seq = await allocate_message_seqs(
+        messages[0].thread_id, len(messages), refresh=True
+    )
+    for i, message in enumerate(messages):
+        message.seq = first_seq + i
+        if (added := getattr(message, "_added_message", None)) is not None:
+            added.seq = message.seq
+
+
+def get_write_behind_queue() -> WriteBehindQueue | None:
+    """Get the write-behind queue for the running event loop.
+
+    Returns None unless `settings.database_write_behind` is enabled.
+    """
+    global _write_behind_atexit_registered
+
+    if not settings.database_write_behind:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if loop not in _write_behind_queues:
+        _write_behind_queues[loop] = WriteBehindQueue(
+            max_batch_size=settings.database_write_behind_max_batch_size,
+            max_latency=settings.database_write_behind_max_latency,
+        )
+        if not _write_behind_atexit_registered:
+            atexit.register(_flush_write_behind_queues_at_exit)
+            _write_behind_atexit_registered = True
+
+    queue = _write_behind_queues[loop]
+    _adopt_idle_queues(loop, queue)
+    return queue
+
+
+def _adopt_idle_queues(loop: Any, queue: WriteBehindQueue) -> None:
+    """Move rows buffered on event loops that aren't running into `queue`.
+
+    Sync calls and tests may buffer rows on a loop that then stops or closes
+    before they are committed. The running loop takes them over, ahead of its
+    own rows, so they stay visible to reads and are committed by its flushes.
+    """
+    for other_loop, other_queue in list(_write_behind_queues.items()):
+        if other_loop is loop or other_loop.is_running():
+            continue
+        if rows := other_queue.drain():
+            queue._pending[:0] = rows
+        if other_loop.is_closed():
+            del _write_behind_queues[other_loop]
+
+
+async def flush_write_behind() -> None:
+    """Commit any writes buffered by the write-behind queue of the running loop."""
+    loop = asyncio.get_running_loop()
+    queue = _write_behind_queues.get(loop)
+    if queue is None:
+        # rows may still be buffered on a loop that is no longer running
+        queue = get_write_behind_queue() if _write_behind_queues else None
+    else:
+        _adopt_idle_queues(loop, queue)
+    if queue is not None:
+        await queue.flush()
+
+
+def _flush_write_behind_queues_at_exit() -> None:
+    rows = [row for queue in _write_behind_queues.values() for row in queue.drain()]
+    if not rows:
+        return
+
+    async def flush_rows() -> None:
+        await _insert_rows(rows)
+        # dispose the engine so its aiosqlite worker thread doesn't keep the
+        # interpreter alive
+        await dispose_async_engine()
+
+    try:
+        asyncio.run(flush_rows())
+    except Exception as e:
+        logger.error(f"Failed to flush {len(rows)} buffered rows at exit: {e}")
+
+
+# ------------ Compaction ------------
+
+
+@dataclass
+class CompactionResult:
+    """The number of records deleted by `compact_database`."""
+
+    threads: int = 0
+    messages: int = 0
+    llm_calls: int = 0
+    blobs: int = 0
+    attachments: int = 0
+
+
+async def compact_database_async(
+    older_than: timedelta | None = None,
+    max_messages_per_thread: int | None = None,
+    batch_size: int = 500,
+    vacuum: bool = True,
+) -> CompactionResult:
+    """Delete old threads and messages and reclaim the space they used.
+
+    Deletes run in batches, each in its own transaction, so writers are never
+    blocked for long. LLM calls and their message mappings are deleted with
+    their threads and messages, and blobs and attachments that are no longer
+    referenced are deleted afterwards. Messages written while blobs are being
+    deleted may lose contents they share with deleted messages, so run this
+    when the database is idle.
+
+    Args:
+        older_than: Delete threads whose newest message, or creation if they
+            have no messages, is older than this. Threads are kept while other
+            threads reference them as their parent.
+        max_messages_per_thread: Keep only this many of the newest messages of
+            each thread. Forks also lose the shared messages that are deleted.
+        batch_size: The number of threads or messages deleted per transaction
+        vacuum: Whether to reclaim free space afterwards. SQLite databases are
+            vacuumed, incrementally if `auto_vacuum` is incremental. Other
+            databases reuse the space after their own vacuuming, e.g.
+            PostgreSQL's autovacuum.
+
+    Returns:
+        The number of records deleted
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if max_messages_per_thread is not None and max_messages_per_thread < 0:
+        raise ValueError("max_messages_per_thread must not be negative")
+
+    await flush_write_behind()
+    result = CompactionResult()
+    # blobs and attachments referenced by deleted messages
+    hashes: tuple[set[str], set[str]] = (set(), set())
+
+    if older_than is not None:
+        cutoff = utc_now() - older_than
+        while thread_ids := await _get_expired_thread_ids(cutoff, batch_size):
+            async with get_async_session() as session:
+                await _delete_threads(session, thread_ids, result, hashes)
+
+    if max_messages_per_thread is not None:
+        for thread_id in await _get_threads_over_cap(max_messages_per_thread):
+            while message_ids := await _get_excess_message_ids(
+                thread_id, max_messages_per_thread, batch_size
+            ):
+                async with get_async_session() as session:
+                    await _delete_messages(session, message_ids, result, hashes)
+
+    await _delete_unreferenced_blobs(*hashes, result=result, batch_size=batch_size)
+    if vacuum and is_sqlite():
+        await _vacuum_sqlite()
+
+    logger.debug(f"Compacted database: {result}")
+    return result
+
+
+def compact_database(
+    older_than: timedelta | None = None,
+    max_messages_per_thread: int | None = None,
+    batch_size: int = 500,
+    vacuum: bool = True,
+) -> CompactionResult:
+    """Delete old threads and messages and reclaim the space they used.
+
+    See `compact_database_async`.
+    """
+    from marvin.utilities.asyncio import run_sync
+
+    return run_sync(
+        compact_database_async(
+            older_than=older_than,
+            max_messages_per_thread=max_messages_per_thread,
+            batch_size=batch_size,
+            vacuum=vacuum,
+        )
+    )
+
+
+async def _get_expired_thread_ids(cutoff: datetime, limit: int) -> list[str]:
+    child = aliased(DBThread)
+    last_message_at = (
+        select(func.max(DBMessage.created_at))
+        .where(DBMessage.thread_id == DBThread.id)
+        .scalar_subquery()
+    )
+    async with get_async_session(readonly=True) as session:
+        result = await session.execute(
+            select(DBThread.id)
+            .where(
+                func.coalesce(last_message_at, DBThread.created_at) < cutoff,
+                ~exists().where(child.parent_thread_id == DBThread.id),
+            )
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+async def _get_threads_over_cap(max_messages: int) -> list[str]:
+    async with get_async_session(readonly=True) as session:
+        result = await session.execute(
+            select(DBMessage.thread_id)
+            .group_by(DBMessage.thread_id)
+            .having(func.count() > max_messages)
+        )
+        return list(result.scalars().all())
+
+
+async def _get_excess_message_ids(
+    thread_id: str, max_messages: int, limit: int
+) -> list[uuid.UUID]:
+    """The oldest messages of a thread beyond its newest `max_messages`."""
+    async with get_async_session(readonly=True) as session:
+        newest = (
+            select(DBMessage.id)
+            .where(DBMessage.thread_id == thread_id)
+            .order_by(DBMessage.seq.desc().nulls_first(), DBMessage.created_at.desc())
+            .limit(max_messages)
+        )
+        result = await session.execute(
+            select(DBMessage.id)
+            .where(DBMessage.thread_id == thread_id, DBMessage.id.not_in(newest))
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+async def _delete(session: AsyncSession, statement: Any) -> int:
+    """Run a bulk delete without syncing the session, returning the row count."""
+    result = await session.execute(
+        statement, execution_options={"synchronize_session": False}
+    )
+    return result.rowcount
+
+
+def _add_blob_refs(message: dict[str, Any], hashes: tuple[set[str], set[str]]) -> None:
+    hashes[0].update(
+        part["content_blob"]
+        for part in message.get("parts", [])
+        if "content_blob" in part
+    )
+    hashes[1].update(_attachment_refs(message))
+
+
+async def _collect_blob_refs(
+    session: AsyncSession, condition: Any, hashes: tuple[set[str], set[str]]
+) -> None:
+    # only messages with references are loaded; their JSON mentions "_blob"
+    result = await session.execute(
+        select(DBMessage.message).where(
+            condition, cast(DBMessage.message, Text).contains("_blob")
+        )
+    )
+    for (message,) in result:
+        _add_blob_refs(message, hashes)
+
+
+async def _collect_all_blob_refs(batch_size: int) -> tuple[set[str], set[str]]:
+    """Collect the blobs and attachments that the remaining messages reference."""
+    hashes: tuple[set[str], set[str]] = (set(), set())
+    last_id: uuid.UUID | None = None
+    while True:
+        query = (
+            select(DBMessage.id, DBMessage.message)
+            .where(cast(DBMessage.message, Text).contains("_blob"))
+            .order_by(DBMessage.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(DBMessage.id > last_id)
+        async with get_async_session(readonly=True) as session:
+            rows = (await session.execute(query)).all()
+        for _, message in rows:
+            _add_blob_refs(message, hashes)
+        if len(rows) < batch_size:
+            return hashes
+        last_id = rows[-1][0]
+
+
+async def _delete_threads(
+    session: AsyncSession,
+    thread_ids: list[str],
+    result: CompactionResult,
+    hashes: tuple[set[str], set[str]],
+) -> None:
+    await _collect_blob_refs(session, DBMessage.thread_id.in_(thread_ids), hashes)
+    message_ids = select(DBMessage.id).where(DBMessage.thread_id.in_(thread_ids))
+    llm_call_ids = select(DBLLMCall.id).where(DBLLMCall.thread_id.in_(thread_ids))
+    await _delete(
+        session,
+        delete(DBLLMCallMessage).where(
+            or_(
+                DBLLMCallMessage.llm_call_id.in_(llm_call_ids),
+                DBLLMCallMessage.message_id.in_(message_ids),
+            )
+        ),
+    )
+    result.llm_calls += await _delete(
+        session, delete(DBLLMCall).where(DBLLMCall.thread_id.in_(thread_ids))
+    )
+    await _delete(
+        session,
+        delete(message_search_table).where(
+            message_search_table.c.thread_id.in_(thread_ids)
+        ),
+    )
+    result.messages += await _delete(
+        session, delete(DBMessage).where(DBMessage.thread_id.in_(thread_ids))
+    )
+    await _delete(
+        session, delete(DBCheckpoint).where(DBCheckpoint.thread_id.in_(thread_ids))
+    )
+    result.threads += await _delete(
+        session, delete(DBThread).where(DBThread.id.in_(thread_ids))
+    )
+    forget_threads(thread_ids)
+
+
+async def _delete_messages(
+    session: AsyncSession,
+    message_ids: list[uuid.UUID],
+    result: CompactionResult,
+    hashes: tuple[set[str], set[str]],
+) -> None:
+    await _collect_blob_refs(session, DBMessage.id.in_(message_ids), hashes)
+    await _delete(
+        session,
+        delete(DBLLMCallMessage).where(DBLLMCallMessage.message_id.in_(message_ids)),
+    )
+    await _delete(
+        session,
+        delete(message_search_table).where(
+            message_search_table.c.message_id.in_([str(id) for id in message_ids])
+        ),
+    )
+    result.messages += await _delete(
+        session, delete(DBMessage).where(DBMessage.id.in_(message_ids))
+    )
+
+
+async def _delete_unreferenced_blobs(
+    blob_hashes: set[str],
+    attachment_hashes: set[str],
+    *,
+    result: CompactionResult,
+    batch_size: int,
+) -> None:
+    """Delete blobs and attachments that no remaining message references."""
+    if not blob_hashes and not attachment_hashes:
+        return
+    # one pass over the remaining messages finds the hashes that are still used
+    referenced = await _collect_all_blob_refs(batch_size)
+    blobs = sorted(blob_hashes - referenced[0])
+    attachments = sorted(attachment_hashes - referenced[1])
+
+    for start in range(0, len(blobs), batch_size):
+        batch = blobs[start : start + batch_size]
+        async with get_async_session() as session:
+            result.blobs += await _delete(
+                session, delete(DBBlob).where(DBBlob.hash.in_(batch))
+            )
+        for hash in batch:
+            _blob_cache.discard(hash)
+
+    store = _attachment_store()
+    if store is not None:
+        for hash in attachments:
+            store.delete(hash)
+        result.attachments += len(attachments)
+        return
+    for start in range(0, len(attachments), batch_size):
+        batch = attachments[start : start + batch_size]
+        async with get_async_session() as session:
+            result.attachments += await _delete(
+                session, delete(DBAttachment).where(DBAttachment.hash.in_(batch))
+            )
+
+
+async def _vacuum_sqlite() -> None:
+    """Merge the full-text index and return free pages to the filesystem."""
+    engine = get_async_engine()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql(
+            f"INSERT INTO {MESSAGE_SEARCH_TABLE}({MESSAGE_SEARCH_TABLE}) "
+            "VALUES('optimize')"
+        )
+        auto_vacuum = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+        if auto_vacuum == 2:
+            await conn.exec_driver_sql("PRAGMA incremental_vacuum")
+        else:
+            await conn.exec_driver_sql("VACUUM")
+
+
 def _run_migrations(alembic_log_level: str = "WARNING") -> bool:
     """Run Alembic migrations.
 
@@ -429,136 +2113,65 @@ async def create_db_and_tables(
             Python from exiting.
     """
     engine = get_async_engine()
+    if is_sqlite():
+        ensure_sqlite_directory()
 
     async with engine.begin() as conn:
         if force:
             await conn.run_sync(Base.metadata.drop_all)
+            with _known_threads_lock:
+                _known_threads.clear()
             logger.debug("Database tables dropped.")
 
         await conn.run_sync(Base.metadata.create_all)
         logger.debug("Database tables created.")
+    _initialized_databases.add(settings.database_url)
 
     if dispose_engine:
-        await engine.dispose()
-        # Remove the engine from the cache since it's disposed
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-        _async_engine_cache.pop(loop, None)
+        await dispose_async_engine()
 
 
-def init_database_if_necessary():
-    """Initialize the database file if necessary.
+async def dispose_async_engine() -> None:
+    """Dispose the engines of the running event loop and remove them from the cache.
 
-    This function only handles creating the database file and parent directories,
-    it does not create tables. Tables are created by ensure_db_tables_exist().
+    This ensures aiosqlite worker threads don't prevent Python from exiting.
     """
-    global db_initialized
-    if not db_initialized:
-        if is_sqlite():
-            # For file-based SQLite, check if file exists
-            url = settings.database_url
-            if url is None:
-                return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    engine = _async_engine_cache.pop(loop, None)
+    state = _engine_state_cache.pop(loop, None)
+    if state is not None:
+        await state.dispose()
+    if engine is not None and (state is None or state.engine is not engine):
+        await engine.dispose()
 
-            parsed_url = urlparse(url)
-            if parsed_url.path and parsed_url.path != ":memory:":
-                # Strip the leading slash if present
-                path = parsed_url.path
-                if path.startswith("/"):
-                    path = path[1:]
 
-                db_file = Path(path)
-                if not db_file.exists():
-                    # Create parent directories if needed
-                    db_file.parent.mkdir(parents=True, exist_ok=True)
-                    # Create empty file
-                    db_file.touch()
-                    logger.debug(f"Created new SQLite database file at {path}")
+async def warmup_async() -> None:
+    """Initialize the database and open a pooled connection.
 
-        db_initialized = True
+    Marvin initializes the database lazily on first access. Services that
+    prefer to pay that cost at startup can call this instead.
+    """
+    async with get_async_session(readonly=True) as session:
+        await session.execute(select(1))
 
 
-def ensure_db_tables_exist():
-    """Ensure database tables exist, creating them if necessary.
+def warmup() -> None:
+    """Initialize the database and open a pooled connection.
 
-    This function creates all database tables directly without using migrations,
-    which is more reliable than using Alembic migrations.
+    See `warmup_async`.
     """
-    # First initialize the database file if needed
-    init_database_if_necessary()
-
-    # Now create tables
-    import asyncio
-    import sqlite3
-    import threading
+    from marvin.utilities.asyncio import run_sync
 
-    # Define a lock for thread safety
-    _create_tables_lock = threading.Lock()
+    run_sync(warmup_async())
 
-    # Check if we're already in an event loop
-    try:
-        asyncio.get_running_loop()
-        in_async_context = True
-    except RuntimeError:
-        in_async_context = False
 
-    # Thread-local check to avoid recursion in async context
-    if in_async_context:
-        # If we're in an async context, we need to use a synchronous approach
-        # Otherwise, we'll get "Event loop is already running" errors
-        try:
-            # For SQLite, we can directly check if tables exist
-            if is_sqlite():
-                url = settings.database_url
-                if url is None:
-                    return
-
-                # Parse the URL to get the database path
-                parsed_url = urlparse(url)
-                if parsed_url.path and parsed_url.path != ":memory:":
-                    # Strip the leading slash if present
-                    path = parsed_url.path
-                    if path.startswith("/"):
-                        path = path[1:]
-
-                    # Direct SQLite connection to check tables
-                    try:
-                        with _create_tables_lock:
-                            conn = sqlite3.connect(path)
-                            cursor = conn.cursor()
-                            # Check if the threads table exists
-                            cursor.execute(
-                                "SELECT name FROM sqlite_master WHERE type='table' AND name='threads'"
-                            )
-                            result = cursor.fetchone()
-
-                            if not result:
-                                # Tables don't exist, we'll need to create them later
-                                logger.warning(
-                                    "Database tables don't exist, but we're in an async context. "
-                                    "Tables will be created on first database access."
-                                )
-                            else:
-                                logger.debug("Database tables already exist.")
-
-                            conn.close()
-                    except sqlite3.Error as e:
-                        logger.error(f"Error checking database tables: {e}")
-
-            return  # Return early if in async context
-        except Exception as e:
-            logger.error(f"Error ensuring database tables exist: {e}")
-            return
-
-    # Create tables synchronously using asyncio.run() if we're not in an async context
-    try:
-        with _create_tables_lock:
-            # Use dispose_engine=True to clean up the aiosqlite worker thread
-            # after table creation. Without this, the cached engine's worker
-            # thread could prevent Python from exiting cleanly.
-            asyncio.run(create_db_and_tables(dispose_engine=True))
-            logger.debug("Database tables created successfully.")
-    except Exception as e:
-        logger.error(f"Failed to create database tables: {e}")
+@deprecated_callable(
+    start_date=datetime(2026, 10, 16),
+    help="Tables are created on first access; use `warmup()` to create them early.",
+)
+def ensure_db_tables_exist() -> None:
+    """Create missing database tables."""
+    warmup()
@@ -1,29 +1,67 @@
 from contextlib import contextmanager
-from dataclasses import dataclass
-from typing import Any, TypedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, TypedDict
 
-from pydantic_ai.models import KnownModelName, Model
 from typing_extensions import NotRequired, Unpack
 
 import marvin
-from marvin import Agent
+
+if TYPE_CHECKING:
+    from pydantic_ai.models import KnownModelName, Model
+
+    from marvin.agents.agent import Agent
+    from marvin.tasks.cache import ResultCache
+    from marvin.tasks.semantic_cache import SemanticCache
+
+_NOTSET: Any = object()
 
 
 class _Defaults(TypedDict):
-    agent: NotRequired[Agent]
-    model: NotRequired[KnownModelName | Model]
+    agent: NotRequired["Agent"]
+    model: NotRequired["KnownModelName | Model"]
     memory_provider: NotRequired[str]
+    task_cache: NotRequired["ResultCache | None"]
+    semantic_cache: NotRequired["SemanticCache | None"]
 
 
 @dataclass
 class Defaults:
-    agent: Agent
-    model: KnownModelName | Model
+    model: "KnownModelName | Model"
     memory_provider: str
+    _agent: "Agent | None" = field(default=None, repr=False)
+    _task_cache: "ResultCache | None" = field(default=_NOTSET, repr=False)
+    # reuses results of classify, cast, and extract calls with similar inputs
+    semantic_cache: "SemanticCache | None" = field(default=None, repr=False)
+
+    @property
+    def agent(self) -> "Agent":
+        # the default agent is created on first use so that importing marvin
+        # doesn't import the agent machinery
+        if self._agent is None:
+            from marvin.agents.agent import Agent
+
+            self._agent = Agent(name="Marvin")
+        return self._agent
+
+    @agent.setter
+    def agent(self, agent: "Agent") -> None:
+        self._agent = agent
+
+    @property
+    def task_cache(self) -> "ResultCache | None":
+        # configured by `settings.task_cache` unless set explicitly
+        if self._task_cache is _NOTSET:
+            from marvin.tasks.cache import get_default_cache
+
+            return get_default_cache()
+        return self._task_cache
+
+    @task_cache.setter
+    def task_cache(self, task_cache: "ResultCache | None") -> None:
+        self._task_cache = task_cache
 
 
 defaults = Defaults(
-    agent=Agent(name="Marvin"),
     model=marvin.settings.agent_model,
     memory_provider=marvin.settings.memory_provider,
 )
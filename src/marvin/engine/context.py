@@ -0,0 +1,422 @@
+"""Context window policies for the thread history sent to the model."""
+
+import asyncio
+import contextvars
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from marvin.settings import settings
+from marvin.thread import Checkpoint, Message, Thread
+from marvin.utilities.logging import get_logger
+from marvin.utilities.tokens import count_message_tokens
+
+if TYPE_CHECKING:
+    from marvin.agents.agent import Agent
+
+logger = get_logger(__name__)
+
+# requests that only carry tool results belong to the response that called the
+# tools, and some providers reject one without the other
+_TOOL_RESULT_PART_KINDS = {"tool-return", "retry-prompt"}
+
+
+DEFAULT_COMPACTION_INSTRUCTIONS = """
+The data is the transcript of the earlier part of a conversation, which may
+start with a summary of the part before it. Summarize it so that the
+conversation can continue from the summary alone. Keep the user's goals and
+preferences, decisions that were made, facts and results that were
+established, and open questions. Leave out pleasantries and repetition.
+"""
+
+
+@dataclass(kw_only=True)
+class CompactionPolicy:
+    """Summarizes old thread history into checkpoints.
+
+    When the history after the thread's latest checkpoint grows past
+    `max_tokens`, everything but the newest `keep_tokens` of it is summarized,
+    together with the previous checkpoint, into a new checkpoint. Turns then
+    send the checkpoint's summary and the history after it instead of the full
+    history, which stays in the database.
+
+    Each checkpoint only summarizes the turns since the previous one. By
+    default, summaries are written in the background so that they never delay
+    a turn; the turn that triggers one sends the previous checkpoint. Runs
+    wait for their background summaries before they return.
+    """
+
+    max_tokens: int = field(
+        metadata={
+            "description": "The size of the history after the latest checkpoint"
+            " that triggers a new checkpoint"
+        },
+    )
+    keep_tokens: int | None = field(
+        default=None,
+        metadata={
+            "description": "The size of the newest history that is left out of"
+            " a new checkpoint. Defaults to half of max_tokens."
+        },
+    )
+    agent: "Agent | None" = field(
+        default=None,
+        repr=False,
+        metadata={
+            "description": "The agent that writes summaries, typically one with"
+            " a cheaper model. Defaults to the default agent."
+        },
+    )
+    instructions: str = field(
+        default=DEFAULT_COMPACTION_INSTRUCTIONS,
+        repr=False,
+        metadata={"description": "Instructions for writing summaries"},
+    )
+    background: bool = field(
+        default=True,
+        metadata={
+            "description": "Whether to write summaries in the background instead"
+            " of waiting for them"
+        },
+    )
+
+    def __post_init__(self):
+        if self.max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        if self.keep_tokens is None:
+            self.keep_tokens = self.max_tokens // 2
+        if not 0 <= self.keep_tokens < self.max_tokens:
+            raise ValueError("keep_tokens must be between 0 and max_tokens")
+
+    async def apply(
+        self, thread: Thread, messages: Sequence[Message]
+    ) -> tuple[Checkpoint | None, list[Message]]:
+        """Drop the history covered by the thread's latest checkpoint.
+
+        Starts a new checkpoint if the history after the checkpoint is too long.
+
+        Args:
+            thread: The thread the history belongs to
+            messages: The thread history, oldest first
+
+        Returns:
+            The checkpoint to send in place of the dropped history, if any,
+            and the history after it
+        """
+        checkpoint = await thread.get_checkpoint_async()
+        messages = _after_checkpoint(messages, checkpoint)
+
+        if sum(count_message_tokens(m) for m in messages) > self.max_tokens:
+            if self.background:
+                schedule_compaction(thread, self, messages, checkpoint)
+            elif new_checkpoint := await compact(thread, self, messages, checkpoint):
+                checkpoint = new_checkpoint
+                messages = _after_checkpoint(messages, checkpoint)
+
+        return checkpoint, messages
+
+
+@dataclass(kw_only=True)
+class ContextPolicy:
+    """Limits the thread history that is sent to the model on each turn.
+
+    The newest messages that fit in `max_tokens` are sent, along with the
+    `keep_first` oldest and `keep_last` newest messages, which are always sent.
+    A response that calls tools and the request that returns their results are
+    always sent or dropped together. The full history stays in the database.
+
+    Providers cache prompts by prefix, and dropping the oldest message on every
+    turn changes the prefix on every turn. With `cache_prefix`, history is
+    dropped in steps of `cache_step_tokens` instead, so the prompt keeps the
+    same prefix until the history grows by another step, and the end of the
+    prompt is marked as a cache breakpoint for providers that need one.
+
+    Token counts are estimates; see `marvin.utilities.tokens`.
+    """
+
+    max_tokens: int | None = field(
+        default=None,
+        metadata={
+            "description": "The token budget for the prompt, including the"
+            " system prompt and user prompt. None sends the full history."
+        },
+    )
+    keep_first: int = field(
+        default=0,
+        metadata={"description": "The number of oldest messages to always send"},
+    )
+    keep_last: int = field(
+        default=1,
+        metadata={"description": "The number of newest messages to always send"},
+    )
+    compaction: CompactionPolicy | None = field(
+        default=None,
+        metadata={
+            "description": "Summarizes old history into checkpoints, which are"
+            " applied before the token budget"
+        },
+    )
+    cache_prefix: bool = field(
+        default=False,
+        metadata={
+            "description": "Keep the start of the prompt the same across turns"
+            " so that providers can cache it"
+        },
+    )
+    cache_step_tokens: int | None = field(
+        default=None,
+        metadata={
+            "description": "With cache_prefix, the amount of history dropped at"
+            " a time. Defaults to a quarter of max_tokens."
+        },
+    )
+
+    def __post_init__(self):
+        if self.max_tokens is not None and self.max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        if self.keep_first < 0 or self.keep_last < 0:
+            raise ValueError("keep_first and keep_last must not be negative")
+        if self.cache_step_tokens is None and self.max_tokens is not None:
+            self.cache_step_tokens = max(1, self.max_tokens // 4)
+        if self.cache_step_tokens is not None and self.cache_step_tokens < 1:
+            raise ValueError("cache_step_tokens must be at least 1")
+
+    def apply(
+        self, messages: Sequence[Message], reserved_tokens: int = 0
+    ) -> list[Message]:
+        """Select the messages to send, in their original order.
+
+        Args:
+            messages: The thread history, oldest first
+            reserved_tokens: Tokens of the prompt that are always sent, such
+                as the system prompt and the user prompt
+        """
+        if self.max_tokens is None:
+            return list(messages)
+
+        groups = _group_tool_calls(messages)
+        first = _take_messages(groups, self.keep_first)
+        last = len(groups) - _take_messages(groups[first:][::-1], self.keep_last)
+
+        budget = self.max_tokens - reserved_tokens
+        budget -= sum(_count_tokens(group) for group in groups[:first])
+        budget -= sum(_count_tokens(group) for group in groups[last:])
+
+        if self.cache_prefix:
+            start = _drop_in_steps(groups, first, last, budget, self.cache_step_tokens)
+        else:
+            # fill the rest of the budget with the newest history, without gaps
+            start = last
+            while start > first:
+                tokens = _count_tokens(groups[start - 1])
+                if tokens > budget:
+                    break
+                budget -= tokens
+                start -= 1
+
+        return [m for group in groups[:first] + groups[start:] for m in group]
+
+    async def apply_async(
+        self, thread: Thread, messages: Sequence[Message], reserved_tokens: int = 0
+    ) -> list[Message]:
+        """Select the messages to send, applying compaction first.
+
+        A checkpoint's summary is always sent and counts against the budget.
+
+        Args:
+            thread: The thread the history belongs to
+            messages: The thread history, oldest first
+            reserved_tokens: Tokens of the prompt that are always sent, such
+                as the system prompt and the user prompt
+        """
+        if self.compaction is None:
+            return self.apply(messages, reserved_tokens)
+
+        checkpoint, messages = await self.compaction.apply(thread, messages)
+        if checkpoint is None:
+            return self.apply(messages, reserved_tokens)
+
+        summary = checkpoint.to_message()
+        reserved_tokens += count_message_tokens(summary)
+        return [summary, *self.apply(messages, reserved_tokens)]
+
+
+def _group_tool_calls(messages: Sequence[Message]) -> list[list[Message]]:
+    """Group each request that returns tool results with the preceding message."""
+    groups: list[list[Message]] = []
+    for message in messages:
+        part_kinds = set(message.part_kinds)
+        if (
+            groups
+            and message.kind == "request"
+            and part_kinds
+            and part_kinds <= _TOOL_RESULT_PART_KINDS
+        ):
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+def _drop_in_steps(
+    groups: list[list[Message]], first: int, last: int, budget: int, step: int
+) -> int:
+    """The first group to send when the oldest history is dropped in steps.
+
+    The amount dropped is the overflow rounded up to a multiple of `step`, so
+    it only changes when the history grows by about `step` tokens.
+    """
+    overflow = sum(_count_tokens(group) for group in groups[first:last]) - budget
+    if overflow <= 0:
+        return first
+    to_drop = -(-overflow // step) * step
+
+    start = first
+    while start < last and to_drop > 0:
+        to_drop -= _count_tokens(groups[start])
+        start += 1
+    return start
+
+
+def _take_messages(groups: list[list[Message]], count: int) -> int:
+    """The number of leading groups needed to cover `count` messages."""
+    taken = 0
+    while count > 0 and taken < len(groups):
+        count -= len(groups[taken])
+        taken += 1
+    return taken
+
+
+def _count_tokens(group: list[Message]) -> int:
+    return sum(count_message_tokens(m) for m in group)
+
+
+def _after_checkpoint(
+    messages: Sequence[Message], checkpoint: Checkpoint | None
+) -> list[Message]:
+    if checkpoint is None:
+        return list(messages)
+    return [m for m in messages if m.seq is None or m.seq > checkpoint.through_seq]
+
+
+async def compact(
+    thread: Thread,
+    policy: CompactionPolicy,
+    messages: Sequence[Message],
+    checkpoint: Checkpoint | None = None,
+) -> Checkpoint | None:
+    """Summarize the older part of a thread's history into a new checkpoint.
+
+    Args:
+        thread: The thread the history belongs to
+        policy: The compaction policy
+        messages: The thread history after `checkpoint`, oldest first
+        checkpoint: The thread's latest checkpoint, which the new one extends
+
+    Returns:
+        The new checkpoint, or None if there was nothing to summarize
+    """
+    from marvin.fns.summarize import summarize_async
+
+    # summarize whole tool call groups, leaving at least the newest one
+    groups = _group_tool_calls(messages)
+    end = len(groups) - 1
+    kept_tokens = _count_tokens(groups[end]) if groups else 0
+    while end > 0 and kept_tokens + _count_tokens(groups[end - 1]) <= (
+        policy.keep_tokens
+    ):
+        end -= 1
+        kept_tokens += _count_tokens(groups[end])
+
+    summarized = [m for group in groups[:end] for m in group]
+    if not summarized or any(m.seq is None for m in summarized):
+        return None
+
+    transcript = _format_transcript(summarized)
+    if checkpoint is not None:
+        transcript = f"Summary of the earlier conversation:\n{checkpoint.summary}\n\n{transcript}"
+
+    summary = await summarize_async(
+        transcript,
+        instructions=policy.instructions,
+        agent=policy.agent,
+        # summaries are written on their own thread, without reporting events
+        thread=Thread(),
+        handlers=[],
+    )
+    return await thread.add_checkpoint_async(summary, summarized[-1].seq)
+
+
+# Background compactions by (database URL, thread ID). Holding the tasks keeps
+# them from being garbage collected and keeps one compaction per thread.
+_compactions: dict[tuple[str | None, str], asyncio.Task[Any]] = {}
+# set inside background compactions, whose summaries run their own orchestrator
+_compacting: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "compacting", default=False
+)
+
+
+def schedule_compaction(
+    thread: Thread,
+    policy: CompactionPolicy,
+    messages: Sequence[Message],
+    checkpoint: Checkpoint | None = None,
+) -> asyncio.Task[Any] | None:
+    """Start `compact` in the background unless the thread is already compacting.
+
+    Background compactions run on the current event loop. Failures are logged
+    and the next turn that needs a checkpoint tries again.
+    """
+    key = (settings.database_url, thread.id)
+    if key in _compactions:
+        return None
+
+    async def run() -> None:
+        _compacting.set(True)
+        try:
+            await compact(thread, policy, messages, checkpoint)
+        except Exception as e:
+            logger.warning(f"Failed to compact thread {thread.id}: {e}")
+        finally:
+            _compactions.pop(key, None)
+
+    # run in a fresh context so the summary doesn't join the current thread
+    # or orchestrator
+    task = contextvars.Context().run(asyncio.create_task, run())
+    _compactions[key] = task
+    return task
+
+
+async def wait_for_compactions() -> None:
+    """Wait for the background compactions on the current event loop.
+
+    Does nothing inside a background compaction, which would otherwise wait
+    for itself.
+    """
+    if _compacting.get():
+        return
+    loop = asyncio.get_running_loop()
+    tasks = [task for task in _compactions.values() if task.get_loop() is loop]
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def _format_transcript(messages: Sequence[Message]) -> str:
+    """Render messages as a plain-text transcript for summarizing."""
+    lines = []
+    for message in messages:
+        for part in message.message.parts:
+            if part.part_kind == "user-prompt":
+                content = part.content
+                if not isinstance(content, str):
+                    content = " ".join(c for c in content if isinstance(c, str))
+                lines.append(f"User: {content}")
+            elif part.part_kind == "text":
+                lines.append(f"Assistant: {part.content}")
+            elif part.part_kind == "tool-call":
+                lines.append(f"Tool call {part.tool_name}: {part.args_as_json_str()}")
+            elif part.part_kind == "tool-return":
+                lines.append(
+                    f"Tool result {part.tool_name}: {part.model_response_str()}"
+                )
+    return "\n\n".join(lines)
@@ -8,7 +8,7 @@ from typing import Any, Literal, Sequence, TypeVar
 
 from pydantic_ai.agent import AgentRunResult
 from pydantic_ai.mcp import MCPServer
-from pydantic_ai.messages import UserContent
+from pydantic_ai.messages import CachePoint, ModelResponse, UserContent
 
 import marvin
 from marvin._internal.integrations.mcp import (
@@ -17,7 +17,8 @@ from marvin._internal.integrations.mcp import (
 )
 from marvin.agents.actor import Actor
 from marvin.agents.agent import Agent
-from marvin.database import DBLLMCall
+from marvin.database import DBLLMCall, database_stats, flush_write_behind
+from marvin.engine.context import ContextPolicy, wait_for_compactions
 from marvin.engine.end_turn import EndTurn
 from marvin.engine.events import (
     ActorEndTurnEvent,
@@ -29,18 +30,25 @@ from marvin.engine.events import (
 )
 from marvin.engine.streaming import handle_agentlet_events
 from marvin.handlers import AsyncHandler, Handler
-from marvin.handlers.print_handler import PrintHandler
 from marvin.instructions import get_instructions
 from marvin.memory.memory import Memory
 from marvin.prompts import Template
 from marvin.tasks.task import Task
 from marvin.thread import Message, Thread, get_current_thread, get_thread
 from marvin.utilities.logging import get_logger
+from marvin.utilities.tokens import count_message_tokens
 
 T = TypeVar("T")
 
 logger = get_logger(__name__)
 
+# Cache the system prompt and tool definitions for providers that need
+# explicit cache breakpoints. Other providers ignore these settings.
+CACHE_MODEL_SETTINGS: dict[str, Any] = {
+    "anthropic_cache_instructions": True,
+    "anthropic_cache_tool_definitions": True,
+}
+
 # Global context var for current orchestrator
 _current_orchestrator: ContextVar["Orchestrator|None"] = ContextVar(
     "current_orchestrator",
@@ -62,18 +70,24 @@ class Orchestrator:
     tasks: list[Task[Any]]
     thread: Thread
     handlers: list[Handler | AsyncHandler]
+    context_policy: ContextPolicy | None
 
     def __init__(
         self,
         tasks: list[Task[Any]],
         thread: Thread | str | None = None,
         handlers: list[Handler | AsyncHandler] | None = None,
+        context_policy: ContextPolicy | None = None,
     ):
         self.tasks = tasks
         self.thread = get_thread(thread)
+        # overrides the context policy of the agents
+        self.context_policy = context_policy
 
         if handlers is None:
             if marvin.settings.enable_default_print_handler:
+                from marvin.handlers.print_handler import PrintHandler
+
                 handlers = [PrintHandler()]
             else:
                 handlers = []
@@ -143,6 +157,8 @@ class Orchestrator:
         if not tasks:
             raise ValueError("No tasks to run")
 
+        sessions_opened = database_stats.sessions_opened
+
         if actor is None:
             actor = tasks[0].get_actor()
 
@@ -169,21 +185,22 @@ class Orchestrator:
                 await task.mark_running(thread=self.thread)
         await self.start_turn(actor=actor)
 
-        # --- get tools
-        tools: set[Callable[..., Any]] = set()
+        # --- get tools, deduplicated in a stable order so that tool
+        # definitions are the same on every turn (see `ContextPolicy.cache_prefix`)
+        tools: dict[Callable[..., Any], None] = {}
         for t in assigned_tasks:
-            tools.update(t.get_tools())
+            tools.update(dict.fromkeys(t.get_tools()))
 
         # --- get end turn tools
-        end_turn_tools: set[EndTurn] = set()
+        end_turn_tools: dict[EndTurn, None] = {}
         for t in assigned_tasks:
-            end_turn_tools.update(t.get_end_turn_tools())
+            end_turn_tools.update(dict.fromkeys(t.get_end_turn_tools()))
 
         # --- get memories
         await self._check_memories(actor=actor, assigned_tasks=assigned_tasks)
 
         # --- get messages
-        user_prompt, prompt_messages = await self._get_messages(
+        user_prompt, prompt_messages, prompt_history_start = await self._get_messages(
             actor=actor, assigned_tasks=assigned_tasks
         )
 
@@ -194,10 +211,14 @@ class Orchestrator:
             active_mcp_servers=active_mcp_servers,
         )
 
+        policy = self.get_context_policy(actor)
         with actor:
             async with agentlet.iter(
                 user_prompt,
                 message_history=[m.message for m in prompt_messages],
+                model_settings=CACHE_MODEL_SETTINGS
+                if policy is not None and policy.cache_prefix
+                else None,
             ) as run:
                 async for event in handle_agentlet_events(
                     agentlet=agentlet,
@@ -214,16 +235,36 @@ class Orchestrator:
             new_messages[1:]
         )
 
+        usage = run.usage()
+        if usage.cache_read_tokens or usage.cache_write_tokens:
+            logger.debug(
+                f"Prompt cache read {usage.cache_read_tokens} and wrote"
+                f" {usage.cache_write_tokens} of {usage.input_tokens} input tokens"
+            )
+
         await DBLLMCall.create(
             thread_id=self.thread.id,
-            usage=run.usage(),
+            usage=usage,
             prompt_messages=prompt_messages,
             completion_messages=completion_messages,
+            prompt_history_start=prompt_history_start,
+            model=next(
+                (
+                    m.model_name
+                    for m in reversed(new_messages)
+                    if isinstance(m, ModelResponse)
+                ),
+                None,
+            ),
         )
 
         # --- end turn
         await self.end_turn(result=run.result, actor=actor)
 
+        logger.debug(
+            f"Turn opened {database_stats.sessions_opened - sessions_opened} database sessions"
+        )
+
         return run
 
     async def start_turn(self, actor: Actor):
@@ -306,6 +347,10 @@ class Orchestrator:
                         await self.handle_event(OrchestratorEndEvent())
         finally:
             _current_orchestrator.reset(token)
+            # finish background compactions before a sync caller closes the loop
+            await wait_for_compactions()
+            # commit anything the write-behind queue is still holding for this run
+            await flush_write_behind()
             # Clean up MCP servers if this was the outermost Thread context.
             # After Thread.__exit__, get_current_thread() returns None if no outer Thread exists.
             if get_current_thread() is None:
@@ -338,7 +383,12 @@ class Orchestrator:
 
     async def _get_messages(
         self, actor: Actor, assigned_tasks: list[Task[Any]]
-    ) -> tuple[str | Sequence[UserContent], list[Message]]:
+    ) -> tuple[str | Sequence[UserContent], list[Message], int | None]:
+        """The user prompt and the messages to send before it.
+
+        Also returns the index from which the messages are a gapless stretch of
+        the thread history, see `DBLLMCall.create`, or None if there is none.
+        """
         system_prompt = await self.thread.add_system_message_async(
             SystemPrompt(
                 actor=actor,
@@ -352,22 +402,50 @@ class Orchestrator:
         )
 
         # attempt to extract the user message from the last message, if it represents a user prompt
+        user_message = None
         if (
             message_history
-            and message_history[-1].message.kind == "request"
-            and message_history[-1].message.parts[0].part_kind == "user-prompt"
+            and message_history[-1].kind == "request"
+            and message_history[-1].part_kinds[:1] == ["user-prompt"]
         ):
-            message_history, user_prompt = (
-                message_history[:-1],
-                message_history[-1].message.parts[0].content,
-            )
+            message_history, user_message = message_history[:-1], message_history[-1]
+            user_prompt = user_message.message.parts[0].content
 
         # otherwise, use a minimal viable user prompt. Pydantic AI requires a
         # user prompt and some providers do not allow empty prompts.
         else:
             user_prompt = " "
 
-        return user_prompt, [system_prompt] + message_history
+        # send only the history that fits the context policy
+        full_history = message_history
+        if (policy := self.get_context_policy(actor)) is not None:
+            reserved_tokens = count_message_tokens(system_prompt)
+            if user_message is not None:
+                reserved_tokens += count_message_tokens(user_message)
+            message_history = await policy.apply_async(
+                self.thread, message_history, reserved_tokens
+            )
+            # mark the end of the prompt so the next turn can reuse all of it
+            if policy.cache_prefix:
+                if isinstance(user_prompt, str):
+                    user_prompt = [user_prompt]
+                user_prompt = [*user_prompt, CachePoint()]
+
+        # the system prompt comes first, so the history starts at index 1
+        history_start = _get_gapless_start(message_history, full_history)
+        return (
+            user_prompt,
+            [system_prompt] + message_history,
+            history_start + 1 if history_start is not None else None,
+        )
+
+    def get_context_policy(self, actor: Actor) -> ContextPolicy | None:
+        """The context policy for a turn of the given actor."""
+        if self.context_policy is not None:
+            return self.context_policy
+        if isinstance(actor, Agent):
+            return actor.context_policy
+        return None
 
     @classmethod
     def get_current(cls) -> "Orchestrator | None":
@@ -375,6 +453,26 @@ class Orchestrator:
         return _current_orchestrator.get()
 
 
+def _get_gapless_start(
+    messages: Sequence[Message], history: Sequence[Message]
+) -> int | None:
+    """The index from which `messages` are a stretch of `history` without gaps.
+
+    Context policies may drop messages from the middle of the history, and
+    only the stretch after the last dropped message can be stored as a range.
+    """
+    positions = {m.id: i for i, m in enumerate(history)}
+    start = len(messages)
+    while start > 0:
+        position = positions.get(messages[start - 1].id)
+        if position is None or (
+            start < len(messages) and positions[messages[start].id] != position + 1
+        ):
+            break
+        start -= 1
+    return start if start < len(messages) else None
+
+
 def get_current_orchestrator() -> Orchestrator | None:
     """Get the currently active orchestrator from context.
 
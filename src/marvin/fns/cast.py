@@ -8,6 +8,7 @@ from typing import Any, TypeVar
 import marvin
 from marvin.agents.agent import Agent
 from marvin.handlers.handlers import AsyncHandler, Handler
+from marvin.tasks.semantic_cache import run_with_semantic_cache
 from marvin.thread import Thread
 from marvin.utilities.asyncio import run_sync
 from marvin.utilities.types import TargetType
@@ -96,7 +97,9 @@ async def cast_async(
         agents=[agent] if agent else None,
     )
 
-    return await task.run_async(thread=thread, handlers=handlers)
+    return await run_with_semantic_cache(
+        task, "Data to transform", thread=thread, handlers=handlers
+    )
 
 
 def cast(
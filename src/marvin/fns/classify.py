@@ -5,6 +5,7 @@ from typing import Any, Literal, TypeVar, overload
 import marvin
 from marvin.agents.agent import Agent
 from marvin.handlers.handlers import AsyncHandler, Handler
+from marvin.tasks.semantic_cache import run_with_semantic_cache
 from marvin.thread import Thread
 from marvin.utilities.asyncio import run_sync
 from marvin.utilities.types import Labels, issubclass_safe
@@ -155,7 +156,9 @@ async def classify_async(
         agents=[agent] if agent else None,
     )
 
-    return await task.run_async(thread=thread, handlers=handlers)  # type: ignore
+    return await run_with_semantic_cache(
+        task, "Data to classify", thread=thread, handlers=handlers
+    )
 
 
 @overload
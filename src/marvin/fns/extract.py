@@ -3,6 +3,7 @@ from typing import Any, TypeVar
 import marvin
 from marvin.agents.agent import Agent
 from marvin.handlers.handlers import AsyncHandler, Handler
+from marvin.tasks.semantic_cache import run_with_semantic_cache
 from marvin.thread import Thread
 from marvin.utilities.asyncio import run_sync
 from marvin.utilities.types import TargetType
@@ -81,7 +82,9 @@ async def extract_async(
         agents=[agent] if agent else None,
     )
 
-    return await task.run_async(thread=thread, handlers=handlers)
+    return await run_with_semantic_cache(
+        task, "Data to extract", thread=thread, handlers=handlers
+    )
 
 
 def extract(
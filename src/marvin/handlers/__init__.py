@@ -1,3 +1,16 @@
+from typing import TYPE_CHECKING, Any
+
 from .handlers import Handler, AsyncHandler
 from .queue_handler import QueueHandler
-from .print_handler import PrintHandler
+
+if TYPE_CHECKING:
+    from .print_handler import PrintHandler
+
+
+def __getattr__(name: str) -> Any:
+    # the print handler imports rich, so it is only imported when used
+    if name == "PrintHandler":
+        from .print_handler import PrintHandler
+
+        return PrintHandler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
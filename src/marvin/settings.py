@@ -4,8 +4,13 @@ import os
 from pathlib import Path
 from typing import Literal
 
-from pydantic import Field, ValidationInfo, field_validator, model_validator
-from pydantic_ai.models import KnownModelName
+from pydantic import (
+    Field,
+    TypeAdapter,
+    ValidationInfo,
+    field_validator,
+    model_validator,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing_extensions import Self
 
@@ -36,10 +41,8 @@ class Settings(BaseSettings):
     @field_validator("home_path")
     @classmethod
     def validate_home_path(cls, v: Path) -> Path:
-        """Ensure the home path exists."""
-        path = Path(v).expanduser().resolve()
-        path.mkdir(parents=True, exist_ok=True)
-        return path
+        """Resolve the home path. Directories are created when they are used."""
+        return Path(v).expanduser().resolve()
 
     database_url: str | None = Field(
         default=None,
@@ -80,6 +83,140 @@ class Settings(BaseSettings):
 
         return f"sqlite+aiosqlite:///{home_path_val}/marvin.db"
 
+    # ------------ Database settings ------------
+
+    database_pool_size: int | None = Field(
+        default=None,
+        ge=1,
+        description="The number of connections to keep open in the database connection pool. Uses the SQLAlchemy default if not set.",
+    )
+
+    database_max_overflow: int | None = Field(
+        default=None,
+        ge=0,
+        description="The number of connections the pool may open beyond `database_pool_size`. Uses the SQLAlchemy default if not set.",
+    )
+
+    database_pool_pre_ping: bool = Field(
+        default=False,
+        description="Whether to test pooled connections for liveness before using them.",
+    )
+
+    database_pool_recycle: int | None = Field(
+        default=None,
+        description="Recycle pooled connections after this many seconds. Connections are never recycled if not set.",
+    )
+
+    database_sqlite_profile: Literal["default", "performance"] = Field(
+        default="default",
+        description="""
+        Connection profile for SQLite databases. "performance" enables WAL
+        journaling, `synchronous=NORMAL`, a larger page cache, memory-mapped
+        I/O, and a busy timeout, and routes all writes through a single writer
+        connection so reads use a separate reader pool and never wait on
+        writers.""",
+    )
+
+    database_write_behind: bool = Field(
+        default=False,
+        description="""
+        Whether to buffer thread, message, and LLM call inserts and commit them
+        in periodic group commits instead of one transaction per write. A
+        thread always reads its own buffered writes. Buffered writes are
+        flushed when an orchestrator run finishes and at interpreter exit.""",
+    )
+
+    database_write_behind_max_batch_size: int = Field(
+        default=500,
+        ge=1,
+        description="The number of buffered rows that triggers an immediate group commit.",
+    )
+
+    database_write_behind_max_latency: float = Field(
+        default=0.05,
+        ge=0,
+        description="The maximum number of seconds a buffered row waits before it is committed.",
+    )
+
+    database_blob_min_size: int = Field(
+        default=1024,
+        ge=0,
+        description="""
+        Message contents of at least this many bytes, such as system prompts,
+        are stored once in a content-addressed blobs table and referenced by
+        hash, so repeated contents are not stored again. Set to 0 to store all
+        contents inline.""",
+    )
+
+    database_attachment_store: Literal["auto", "filesystem", "database"] = Field(
+        default="auto",
+        description="""
+        Where binary message contents, such as images and documents, are
+        stored. They are stored once by content hash and referenced from the
+        message instead of being inlined as base64. "filesystem" stores them as
+        files under `database_attachment_path` and reads them with memory
+        mapping; "database" stores them in an attachments table, for databases
+        shared by several hosts. "auto" uses the filesystem for SQLite and the
+        database otherwise. Contents smaller than `database_blob_min_size`
+        stay inline.""",
+    )
+
+    database_attachment_path: Path | None = Field(
+        default=None,
+        description="The directory for the filesystem attachment store. Defaults to `{{home_path}}/attachments`.",
+    )
+
+    thread_history_cache_max_threads: int = Field(
+        default=128,
+        ge=0,
+        description="""
+        The number of thread histories to keep decoded in memory so repeated
+        reads only fetch new messages. A thread's history with and without
+        system messages are cached separately. Set to 0 to disable the
+        cache.""",
+    )
+
+    thread_history_cache_max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        ge=0,
+        description="The approximate memory budget, in bytes of serialized messages, for the thread history cache.",
+    )
+
+    # ------------ Task cache settings ------------
+
+    task_cache: Literal["memory", "sqlite"] | None = Field(
+        default=None,
+        description="""
+        Cache task results by a fingerprint of the task and its agent, so
+        repeated calls such as `marvin.cast` on the same input skip the model.
+        "memory" keeps results for the life of the process; "sqlite" stores
+        them in `task_cache_path`. Only tasks without tools or memories that
+        don't run in an existing thread are cached. None disables the cache.""",
+    )
+
+    task_cache_path: Path | None = Field(
+        default=None,
+        description="The SQLite file for the task cache. Defaults to `{{home_path}}/task_cache.db`.",
+    )
+
+    task_cache_ttl: float | None = Field(
+        default=None,
+        gt=0,
+        description="The number of seconds a cached task result stays valid. Results never expire if not set.",
+    )
+
+    task_cache_max_entries: int = Field(
+        default=10_000,
+        ge=1,
+        description="The number of task results to cache before the least recently used are evicted.",
+    )
+
+    task_cache_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        ge=1,
+        description="The total size of cached task results before the least recently used are evicted.",
+    )
+
     # ------------ Logging settings ------------
 
     log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = Field(
@@ -114,11 +251,21 @@ class Settings(BaseSettings):
 
     # ------------ Agent settings ------------
 
-    agent_model: KnownModelName = Field(
+    agent_model: str = Field(
         default="openai:gpt-4o",
-        description="The default model for agents.",
+        description="The default model for agents, one of pydantic-ai's known model names.",
+        validate_default=False,
     )
 
+    @field_validator("agent_model")
+    @classmethod
+    def _validate_agent_model(cls, v: str) -> str:
+        # pydantic-ai's models module imports httpx and rich, so it is only
+        # loaded when a model is configured rather than on `import marvin`
+        from pydantic_ai.models import KnownModelName
+
+        return TypeAdapter(KnownModelName).validate_python(v)
+
     agent_temperature: float | None = Field(
         default=None,
         description="The temperature for the agent.",
@@ -0,0 +1,409 @@
+"""Caches of task results.
+
+A task's result is cached under a fingerprint of everything that determines
+it: the model and model settings, the agent's and task's instructions, the
+task's context and attachments, the result type's JSON schema, the global
+instructions, and the Marvin version. Running an identical task again returns
+the cached result without calling the model.
+
+Caching is opt-in; see `settings.task_cache`. Only tasks whose results depend
+on nothing but their fingerprint are cached: tasks with tools, memories, or
+MCP servers, planning or CLI tasks, and tasks that run in an existing thread
+always run.
+
+Results are stored as JSON of the task's result type and validated against it
+when they are read, so an entry that doesn't validate is a miss.
+"""
+
+import abc
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Collection, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from pydantic_core import PydanticSerializationError, to_json
+
+import marvin
+from marvin.utilities.logging import get_logger
+
+if TYPE_CHECKING:
+    from marvin.tasks.task import Task
+
+logger = get_logger(__name__)
+
+_bypass: ContextVar[bool] = ContextVar("bypass_task_cache", default=False)
+
+
+@contextmanager
+def bypass_task_cache() -> Iterator[None]:
+    """Run tasks in this context without reading or writing the task cache.
+
+    Example:
+        >>> with bypass_task_cache():
+        ...     marvin.cast("three", int)  # always calls the model
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+@dataclass(kw_only=True)
+class ResultCache(abc.ABC):
+    """Stores serialized task results by key."""
+
+    ttl: float | None = field(
+        default=None,
+        metadata={
+            "description": "Seconds until an entry expires, unless set per entry."
+            " None keeps entries until they are evicted."
+        },
+    )
+    max_entries: int = field(
+        default=10_000,
+        metadata={"description": "The number of entries to keep"},
+    )
+    max_bytes: int = field(
+        default=256 * 1024 * 1024,
+        metadata={"description": "The total size of the entries to keep"},
+    )
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """Get an entry, or None if it is missing or expired."""
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        """Store an entry, evicting the least recently used entries to make room.
+
+        Args:
+            key: The entry's key
+            value: The serialized result
+            ttl: Seconds until the entry expires. Defaults to the cache's `ttl`.
+        """
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """Delete an entry if it exists."""
+
+    @abc.abstractmethod
+    async def clear(self) -> None:
+        """Delete all entries."""
+
+    def _expires_at(self, ttl: float | None) -> float | None:
+        ttl = ttl if ttl is not None else self.ttl
+        return None if ttl is None else time.time() + ttl
+
+
+@dataclass(kw_only=True)
+class MemoryResultCache(ResultCache):
+    """A least recently used cache in process memory."""
+
+    _entries: OrderedDict[str, tuple[bytes, float | None]] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+    _size: int = field(default=0, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    async def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, self._expires_at(ttl))
+            self._size += len(value)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    async def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    async def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+@dataclass(kw_only=True)
+class SQLiteResultCache(ResultCache):
+    """A least recently used cache in a SQLite file, shared across processes.
+
+    The file is opened on first use. Queries run in a worker thread so they
+    don't block the event loop.
+    """
+
+    path: Path = field(metadata={"description": "The SQLite file"})
+
+    _connection: sqlite3.Connection | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await asyncio.to_thread(self._set, key, value, self._expires_at(ttl))
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM results WHERE key = ?", key)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM results")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_results_accessed_at"
+                " ON results (accessed_at)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, *params: Any) -> None:
+        with self._lock:
+            self._connect().execute(sql, params)
+
+    def _get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            connection.execute(
+                "UPDATE results SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return value
+
+    def _set(self, key: str, value: bytes, expires_at: float | None) -> None:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results"
+                    " (key, value, size, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), expires_at, now),
+                )
+                connection.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Delete the least recently used entries beyond the cache's limits."""
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+
+        evicted: list[tuple[str]] = []
+        for key, entry_size in connection.execute(
+            "SELECT key, size FROM results ORDER BY accessed_at"
+        ):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+
+@cache
+def _get_cache(
+    backend: str,
+    path: Path,
+    ttl: float | None,
+    max_entries: int,
+    max_bytes: int,
+) -> ResultCache:
+    if backend == "sqlite":
+        return SQLiteResultCache(
+            path=path, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes
+        )
+    return MemoryResultCache(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+
+
+def get_default_cache() -> ResultCache | None:
+    """The cache configured by `settings.task_cache`, if any."""
+    settings = marvin.settings
+    if settings.task_cache is None:
+        return None
+    return _get_cache(
+        settings.task_cache,
+        settings.task_cache_path or settings.home_path / "task_cache.db",
+        settings.task_cache_ttl,
+        settings.task_cache_max_entries,
+        settings.task_cache_max_bytes,
+    )
+
+
+def get_task_cache(task: "Task[Any]") -> ResultCache | None:
+    """The cache for a task's result, or None if it shouldn't be cached."""
+    if _bypass.get() or task.cache is False:
+        return None
+    if isinstance(task.cache, ResultCache):
+        return task.cache
+    return marvin.defaults.task_cache
+
+
+def fingerprint_task(
+    task: "Task[Any]", exclude_context: Collection[str] = ()
+) -> str | None:
+    """A key for a task's result, or None if it depends on more than the task.
+
+    Tasks with side effects or outside inputs, such as tools, memories, and
+    MCP servers, are never cached.
+
+    Args:
+        task: The task
+        exclude_context: Context keys to leave out, e.g. to key tasks that
+            only differ by their input data together
+    """
+    from marvin.agents.agent import Agent
+    from marvin.instructions import get_instructions
+
+    agent = task.get_actor()
+    if (
+        not isinstance(agent, Agent)
+        or task.get_tools()
+        or task.memories
+        or task.plan
+        or agent.get_tools()
+        or agent.get_memories()
+        or agent.mcp_servers
+    ):
+        return None
+
+    model = agent.get_model()
+    if not isinstance(model, str):
+        model = f"{model.system}:{model.model_name}"
+
+    fingerprint = {
+        "marvin": _marvin_version(),
+        "model": model,
+        "model_settings": agent.get_model_settings(),
+        "agent": [agent.name, agent.instructions, agent.description, agent.prompt],
+        "instructions": get_instructions(),
+        "task": [
+            task.name,
+            task.instructions,
+            task.prompt_template,
+            task.allow_fail,
+            task.allow_skip,
+        ],
+        "context": {k: v for k, v in task.context.items() if k not in exclude_context},
+        "attachments": hashlib.sha256(
+            to_json(list(task.attachments), fallback=repr)
+        ).hexdigest(),
+        "result_type": task.get_result_type_str(),
+        "result_validator": getattr(task.result_validator, "__qualname__", None),
+    }
+    return hashlib.sha256(to_json(fingerprint, fallback=repr)).hexdigest()
+
+
+def dump_result(task: "Task[Any]", result: Any) -> bytes | None:
+    """Serialize a task's result as JSON, or None if it can't be serialized.
+
+    Classifier results are stored as the indices of their labels.
+    """
+    from marvin.tasks.task import get_type_adapter
+    from marvin.utilities.types import as_classifier
+
+    # results that don't match the result type, e.g. from a custom result
+    # validator, raise rather than being stored as something else
+    try:
+        if task.is_classifier():
+            labels = as_classifier(task.result_type).labels
+            result = (
+                [labels.index(r) for r in result]
+                if isinstance(result, list)
+                else labels.index(result)
+            )
+        return get_type_adapter(task.get_result_type()).dump_json(
+            result, warnings="error"
+        )
+    except (PydanticSerializationError, ValueError) as e:
+        logger.debug(f"Not caching the result of task {task.id}: {e}")
+        return None
+
+
+def load_result(task: "Task[Any]", data: bytes) -> Any:
+    """Validate a task's result from its JSON.
+
+    Raises:
+        ValueError: If the data isn't a valid result for the task
+    """
+    from marvin.tasks.task import get_type_adapter
+    from marvin.utilities.types import as_classifier
+
+    result = get_type_adapter(task.get_result_type()).validate_json(data)
+    if task.is_classifier():
+        return as_classifier(task.result_type).validate(result)
+    return result
+
+
+@cache
+def _marvin_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("marvin")
+    except PackageNotFoundError:
+        return "unknown"
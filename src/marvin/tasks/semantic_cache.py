@@ -0,0 +1,208 @@
+"""A cache of task results for similar, not just identical, inputs.
+
+`marvin.classify`, `marvin.cast`, and `marvin.extract` look up their input
+among the inputs that earlier calls answered. Calls are only compared with
+calls that match in everything but the input (see
+`marvin.tasks.cache.fingerprint_task`), such as the labels or target type, the
+instructions, and the model. If the most similar earlier input is at least
+`threshold` similar, its result is returned without calling the model.
+
+The semantic cache is opt-in; set `marvin.defaults.semantic_cache`. It obeys
+`bypass_task_cache` and the same rules as the task cache for which tasks can
+be cached.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from pydantic_core import to_json
+
+import marvin
+import marvin.thread
+from marvin.tasks.cache import _bypass, fingerprint_task
+from marvin.utilities.embeddings import Embedder, HashingEmbedder, dot
+from marvin.utilities.logging import get_logger
+
+if TYPE_CHECKING:
+    from marvin.handlers.handlers import AsyncHandler, Handler
+    from marvin.tasks.task import Task
+    from marvin.thread import Thread
+
+logger = get_logger(__name__)
+
+# returned by `SemanticCache.lookup` when no input is similar enough
+MISS: Any = object()
+
+
+@dataclass(kw_only=True)
+class SemanticCacheStats:
+    """Lookup counts of a semantic cache."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The share of lookups that returned a cached result."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass(kw_only=True)
+class _Entry:
+    vector: list[float]
+    result: Any
+
+
+@dataclass(kw_only=True)
+class SemanticCache:
+    """Caches task results by the similarity of their inputs.
+
+    Entries are kept in process memory and compared by brute force, so each
+    group of matching calls is limited to `max_entries`; the least recently
+    used entries are evicted first. Results are copied in and out of the
+    cache, so callers can't change a cached result.
+    """
+
+    embedder: Embedder = field(
+        default_factory=HashingEmbedder,
+        metadata={
+            "description": "Embeds inputs. Defaults to a local hashing embedder,"
+            " which only measures shared wording."
+        },
+    )
+    threshold: float = field(
+        default=0.9,
+        metadata={
+            "description": "The similarity, between 0 and 1, an earlier input"
+            " needs for its result to be returned"
+        },
+    )
+    max_entries: int = field(
+        default=1000,
+        metadata={"description": "The number of inputs to keep per group"},
+    )
+    stats: SemanticCacheStats = field(default_factory=SemanticCacheStats)
+
+    _groups: dict[str, OrderedDict[str, _Entry]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        if not 0 < self.threshold <= 1:
+            raise ValueError("threshold must be between 0 and 1")
+
+    async def lookup(self, key: str, text: str) -> tuple[Any, list[float] | None]:
+        """Find the result for the input most similar to `text`.
+
+        Identical inputs are found without embedding `text`.
+
+        Args:
+            key: The group of calls to search, see `fingerprint_task`
+            text: The input
+
+        Returns:
+            The cached result, or `MISS`, and the embedding of `text` if it
+            was computed
+        """
+        with self._lock:
+            group = self._groups.get(key)
+            if group is not None and (entry := group.get(text)) is not None:
+                group.move_to_end(text)
+                self.stats.hits += 1
+                return copy.deepcopy(entry.result), None
+
+        [vector] = await self.embedder.embed([text])
+
+        best_text, best_similarity = None, self.threshold
+        with self._lock:
+            group = self._groups.get(key, {})
+            for entry_text, entry in group.items():
+                similarity = dot(vector, entry.vector)
+                if similarity >= best_similarity:
+                    best_text, best_similarity = entry_text, similarity
+
+            if best_text is None:
+                self.stats.misses += 1
+                return MISS, vector
+
+            entry = group[best_text]
+            group.move_to_end(best_text)
+            self.stats.hits += 1
+
+        logger.debug(f"Semantic cache hit with similarity {best_similarity:.3f}")
+        return copy.deepcopy(entry.result), vector
+
+    async def add(
+        self, key: str, text: str, result: Any, vector: list[float] | None = None
+    ) -> None:
+        """Store the result for an input.
+
+        Args:
+            key: The group of calls the input belongs to
+            text: The input
+            result: The result
+            vector: The embedding of `text`, if it was already computed
+        """
+        if vector is None:
+            [vector] = await self.embedder.embed([text])
+        with self._lock:
+            group = self._groups.setdefault(key, OrderedDict())
+            group[text] = _Entry(vector=vector, result=copy.deepcopy(result))
+            group.move_to_end(text)
+            while len(group) > self.max_entries:
+                group.popitem(last=False)
+
+    def clear(self) -> None:
+        """Delete all entries and reset the stats."""
+        with self._lock:
+            self._groups.clear()
+            self.stats = SemanticCacheStats()
+
+
+async def run_with_semantic_cache(
+    task: "Task[Any]",
+    data_key: str,
+    thread: "Thread | str | None" = None,
+    handlers: "list[Handler | AsyncHandler] | None" = None,
+) -> Any:
+    """Run a task, reusing the result of a task with a similar input.
+
+    Args:
+        task: The task
+        data_key: The key of the task's input in its context
+        thread: The thread to run the task in
+        handlers: Handlers for the task's events
+    """
+    cache = marvin.defaults.semantic_cache
+    key = None
+    if (
+        cache is not None
+        and not _bypass.get()
+        and task.cache is not False
+        and thread is None
+        and marvin.thread.get_current_thread() is None
+    ):
+        key = fingerprint_task(task, exclude_context=(data_key,))
+
+    if cache is None or key is None:
+        return await task.run_async(thread=thread, handlers=handlers)
+
+    data = task.context[data_key]
+    text = data if isinstance(data, str) else to_json(data, fallback=repr).decode()
+
+    result, vector = await cache.lookup(key, text)
+    if result is not MISS:
+        await task.mark_successful(result, validate_result=False)
+        return task.result
+
+    result = await task.run_async(thread=thread, handlers=handlers)
+    if task.is_successful():
+        await cache.add(key, text, result, vector)
+    return result
@@ -32,8 +32,16 @@ from marvin.agents.actor import Actor
 from marvin.agents.team import Swarm, Team
 from marvin.memory.memory import Memory
 from marvin.prompts import Template
+from marvin.tasks.cache import (
+    ResultCache,
+    dump_result,
+    fingerprint_task,
+    get_task_cache,
+    load_result,
+)
 from marvin.thread import Thread
 from marvin.utilities.asyncio import run_sync
+from marvin.utilities.logging import get_logger
 from marvin.utilities.types import Labels, as_classifier, is_classifier
 
 if TYPE_CHECKING:
@@ -41,6 +49,8 @@ if TYPE_CHECKING:
     from marvin.engine.events import Event
     from marvin.handlers.handlers import AsyncHandler, Handler
 
+logger = get_logger(__name__)
+
 T = TypeVar("T")
 NOTSET: Literal["__NOTSET__"] = "__NOTSET__"
 
@@ -212,6 +222,14 @@ class Task(Generic[T]):
         },
     )
 
+    cache: "bool | ResultCache | None" = field(
+        default=None,
+        metadata={
+            "description": "Whether to cache the task's result. None uses the default cache, if one is configured (see `settings.task_cache`); False always runs the task; a ResultCache uses that cache.",
+        },
+        repr=False,
+    )
+
     # Add _tokens field for context management
     _tokens: list[Any] = field(default_factory=list, init=False, repr=False)
 
@@ -235,6 +253,7 @@ class Task(Generic[T]):
         verbose: bool = False,
         cli: bool = False,
         plan: bool = False,
+        cache: "bool | ResultCache | None" = None,
     ) -> None:
         """Initialize a Task.
 
@@ -258,6 +277,8 @@ class Task(Generic[T]):
             verbose: Whether to print additional status messages to the active thread
             cli: Whether to enable CLI interaction tools
             plan: Whether to enable a tool for planning subtasks
+            cache: Whether to cache the result. None uses the default cache,
+                if one is configured; False always runs the task.
 
         """
         # required fields
@@ -287,6 +308,7 @@ class Task(Generic[T]):
         self.cli = cli
         self.plan = plan
         self.verbose = verbose
+        self.cache = cache
         # key fields
         self.id = uuid.uuid4().hex[:8]
         self.state = TaskState.PENDING
@@ -479,12 +501,37 @@ class Task(Generic[T]):
         raise_on_failure: bool = True,
         handlers: list["Handler | AsyncHandler"] | None = None,
     ) -> T:
-        await marvin.fns.run.run_tasks_async(
+        # results only depend on the task when it doesn't continue a thread
+        cache = key = None
+        if thread is None and marvin.thread.get_current_thread() is None:
+            cache = get_task_cache(self)
+            key = fingerprint_task(self) if cache is not None else None
+
+        if cache is not None and key is not None:
+            if (data := await cache.get(key)) is not None:
+                try:
+                    result = load_result(self, data)
+                except ValueError as e:
+                    logger.debug(
+                        f"Ignoring invalid cached result of task {self.id}: {e}"
+                    )
+                else:
+                    await self.mark_successful(result, validate_result=False)
+                    return self.result
+
+        # `marvin` loads its submodules lazily, so import the runner explicitly
+        from marvin.fns.run import run_tasks_async
+
+        await run_tasks_async(
             [self],
             thread=thread,
             raise_on_failure=raise_on_failure,
             handlers=handlers,
         )
+
+        if cache is not None and key is not None and self.is_successful():
+            if (data := dump_result(self, self.result)) is not None:
+                await cache.set(key, data)
         return self.result
 
     def run(
@@ -507,7 +554,9 @@ class Task(Generic[T]):
         raise_on_failure: bool = True,
         handlers: list["Handler | AsyncHandler"] | None = None,
     ) -> AsyncGenerator["Event", None]:
-        return marvin.fns.run.run_tasks_stream(
+        from marvin.fns.run import run_tasks_stream
+
+        return run_tasks_stream(
             [self],
             thread=thread,
             raise_on_failure=raise_on_failure,
@@ -3,26 +3,56 @@
 This module provides the Thread class for managing conversation context.
 """
 
+import threading
 import uuid
+from collections import OrderedDict
 from contextvars import ContextVar
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Any, Sequence
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Literal, Sequence
 
 from pydantic import TypeAdapter
-from pydantic_ai.messages import UserContent
+from pydantic_ai.messages import ModelRequest, UserContent, UserPromptPart
 from pydantic_ai.usage import Usage
-from sqlalchemy import select
+from pydantic_core import to_json
+from sqlalchemy import (
+    ColumnElement,
+    Date,
+    Integer,
+    Select,
+    and_,
+    cast,
+    func,
+    literal_column,
+    or_,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from marvin.database import (
+    USAGE_COLUMNS,
+    DBCheckpoint,
     DBLLMCall,
     DBLLMCallMessage,
     DBMessage,
     DBThread,
+    allocate_message_seqs,
+    as_utc,
+    bulk_insert,
+    deserialize_message,
+    flush_write_behind,
     get_async_session,
+    get_write_behind_queue,
+    is_system_message,
+    is_thread_known,
+    load_blobs,
+    message_search_table,
     utc_now,
 )
-from marvin.engine.llm import ModelRequest
+from marvin.settings import settings
 from marvin.utilities.asyncio import run_sync
 
 from .engine.llm import AgentMessage, PydanticAIMessage, SystemMessage, UserMessage
@@ -32,13 +62,68 @@ message_adapter: TypeAdapter[PydanticAIMessage | list[PydanticAIMessage]] = Type
     PydanticAIMessage | list[PydanticAIMessage]
 )
 
+# Attempts to insert messages when their sequence numbers collide with another
+# process writing to the same thread
+_MAX_INSERT_ATTEMPTS = 3
+
+# Filters out system messages in queries
+_NOT_SYSTEM = DBMessage.role != "system"
+
 
 @dataclass(kw_only=True)
 class Message:
+    """A message in a thread.
+
+    Messages read from the database keep their serialized form and are only
+    validated into pydantic-ai messages when `message` is first accessed.
+    `kind` and `part_kinds` are available without validating.
+    """
+
     id: uuid.UUID = field(default_factory=uuid.uuid4)
     thread_id: str = field(default=None)
     message: PydanticAIMessage
     created_at: datetime = field(default_factory=utc_now)
+    seq: int | None = None
+    # the estimated token count, stored with the message when it was added
+    tokens: int | None = None
+    # the checkpoint whose summary this message is, see `Checkpoint.to_message`
+    checkpoint_id: uuid.UUID | None = None
+    _data: dict[str, Any] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def from_data(cls, data: dict[str, Any], **kwargs: Any) -> "Message":
+        """Create a message that validates its serialized form on first access."""
+        message = cls(message=None, **kwargs)
+        del message.message
+        message._data = data
+        return message
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for missing attributes, i.e. `message` before it is decoded
+        data = self.__dict__.get("_data")
+        if name != "message" or data is None:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        self.message = deserialize_message(data)
+        self._data = None
+        return self.message
+
+    @property
+    def kind(self) -> str:
+        """The message kind, "request" or "response"."""
+        if self._data is not None:
+            return self._data["kind"]
+        return self.message.kind
+
+    @property
+    def part_kinds(self) -> list[str]:
+        """The kinds of the message's parts, e.g. "system-prompt" or "tool-call"."""
+        if self._data is not None:
+            return [part["part_kind"] for part in self._data.get("parts", [])]
+        return [part.part_kind for part in self.message.parts]
 
 
 @dataclass(kw_only=True)
@@ -47,6 +132,83 @@ class LLMCallMessages:
     completion: list[Message]
 
 
+UsageGroup = Literal["thread", "model", "day"]
+
+
+@dataclass(kw_only=True)
+class SearchResult:
+    """A message that matched a full-text search."""
+
+    thread_id: str
+    message_id: uuid.UUID
+    snippet: str
+    rank: float
+
+
+@dataclass(kw_only=True)
+class Checkpoint:
+    """A summary of a thread's history up to and including `through_seq`."""
+
+    id: uuid.UUID
+    thread_id: str
+    through_seq: int
+    summary: str
+    created_at: datetime
+
+    def to_message(self) -> Message:
+        """The message that stands in for the summarized history in prompts.
+
+        The message has no sequence number because it isn't stored in the
+        thread. It has the checkpoint's ID and timestamp, so it is the same
+        every time.
+        """
+        return Message(
+            id=self.id,
+            thread_id=self.thread_id,
+            message=ModelRequest(
+                parts=[
+                    UserPromptPart(
+                        content=f"Summary of the earlier conversation:\n\n{self.summary}",
+                        timestamp=self.created_at,
+                    )
+                ]
+            ),
+            created_at=self.created_at,
+            checkpoint_id=self.id,
+        )
+
+
+@dataclass(kw_only=True)
+class TokenCount:
+    """A message's token count and the running total of a window up to it."""
+
+    message_id: uuid.UUID
+    seq: int
+    tokens: int
+    cumulative_tokens: int
+
+
+@dataclass(kw_only=True)
+class UsageSummary:
+    """Usage summed over the LLM calls of a group.
+
+    Group fields that weren't grouped by are None.
+    """
+
+    usage: Usage
+    llm_calls: int
+    thread_id: str | None = None
+    model: str | None = None
+    day: date | None = None
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """The share of input tokens that were read from the provider's prompt cache."""
+        if not self.usage.input_tokens:
+            return 0.0
+        return self.usage.cache_read_tokens / self.usage.input_tokens
+
+
 @dataclass(kw_only=True)
 class LLMCall:
     """Represents an LLM call."""
@@ -61,17 +223,31 @@ class LLMCall:
         return run_sync(self.get_messages_async())
 
     async def get_messages_async(self) -> LLMCallMessages:
-        """Get the messages for this LLM call."""
-        async with get_async_session() as session:
+        """Get the messages for this LLM call.
+
+        Messages stored as a range of thread sequence numbers fill the
+        positions that aren't taken by individually mapped messages.
+        """
+        await flush_write_behind()
+
+        async with get_async_session(readonly=True) as session:
+            db_llm_call = await session.get(DBLLMCall, self.id)
+            if db_llm_call is None:
+                return LLMCallMessages(prompt=[], completion=[])
+
             # Query the llm_call_messages table to get all messages associated with this LLM call
 
             # Get all message associations for this LLM call ordered by their sequence
             query = (
-                select(DBLLMCallMessage, DBMessage)
-                .join(
+                select(DBLLMCallMessage, DBMessage, DBCheckpoint)
+                .outerjoin(
                     DBMessage,
                     DBLLMCallMessage.message_id == DBMessage.id,
                 )
+                .outerjoin(
+                    DBCheckpoint,
+                    DBLLMCallMessage.checkpoint_id == DBCheckpoint.id,
+                )
                 .where(DBLLMCallMessage.llm_call_id == self.id)
                 .order_by(DBLLMCallMessage.order)
             )
@@ -80,19 +256,271 @@ class LLMCall:
 
             # Map the database enum values to our new terminology
             # REQUEST -> prompt, RESPONSE -> completion
-            messages_by_role = {"prompt": [], "completion": []}
-
-            for llm_call_message, db_message in result:
-                if llm_call_message.in_initial_prompt:
-                    messages_by_role["prompt"].append(db_message.to_message())
+            messages_by_role: dict[str, dict[int, Message]] = {
+                "prompt": {},
+                "completion": {},
+            }
+
+            rows = result.all()
+            blobs = await load_blobs(
+                session, [db_message for _, db_message, _ in rows if db_message]
+            )
+            for llm_call_message, db_message, db_checkpoint in rows:
+                role = "prompt" if llm_call_message.in_initial_prompt else "completion"
+                if db_message is not None:
+                    message = db_message.to_message(blobs)
+                elif db_checkpoint is not None:
+                    message = db_checkpoint.to_checkpoint().to_message()
                 else:
-                    messages_by_role["completion"].append(db_message.to_message())
-
-            return LLMCallMessages(
-                prompt=messages_by_role["prompt"],
-                completion=messages_by_role["completion"],
+                    continue
+                messages_by_role[role][llm_call_message.order] = message
+
+            prompt_range = await _get_messages_in_seq_range(
+                session,
+                self.thread_id,
+                db_llm_call.prompt_start_seq,
+                db_llm_call.prompt_end_seq,
+            )
+            completion_range = await _get_messages_in_seq_range(
+                session,
+                self.thread_id,
+                db_llm_call.completion_start_seq,
+                db_llm_call.completion_end_seq,
             )
 
+        prompt = _fill_positions(messages_by_role["prompt"], prompt_range)
+        completion = _fill_positions(
+            messages_by_role["completion"], completion_range, start=len(prompt)
+        )
+        return LLMCallMessages(prompt=prompt, completion=completion)
+
+
+async def _get_messages_in_seq_range(
+    session: AsyncSession,
+    thread_id: str,
+    start_seq: int | None,
+    end_seq: int | None,
+) -> list[Message]:
+    """The non-system messages of a thread within a range of sequence numbers."""
+    if start_seq is None or end_seq is None:
+        return []
+    result = await session.execute(
+        select(DBMessage)
+        .where(
+            DBMessage.thread_id == thread_id,
+            DBMessage.seq >= start_seq,
+            DBMessage.seq <= end_seq,
+            _NOT_SYSTEM,
+        )
+        .order_by(DBMessage.seq)
+    )
+    db_messages = list(result.scalars().all())
+    blobs = await load_blobs(session, db_messages)
+    return [db_message.to_message(blobs) for db_message in db_messages]
+
+
+def _fill_positions(
+    positioned: dict[int, Message], messages: list[Message], start: int = 0
+) -> list[Message]:
+    """Place messages at their positions and fill the gaps with `messages`, in order."""
+    positioned = dict(positioned)
+    remaining = iter(messages)
+    result: list[Message] = []
+    position = start
+    while positioned:
+        if position in positioned:
+            result.append(positioned.pop(position))
+        elif (message := next(remaining, None)) is not None:
+            result.append(message)
+        else:
+            # messages missing from the range, e.g. because they were deleted
+            result.extend(m for _, m in sorted(positioned.items()))
+            break
+        position += 1
+    result.extend(remaining)
+    return result
+
+
+def _merge_pending_messages(
+    db_messages: list[DBMessage],
+    pending: list[DBMessage],
+    before: datetime | None = None,
+    after: datetime | None = None,
+    limit: int | None = None,
+) -> list[DBMessage]:
+    """Merge committed messages with buffered ones, applying the same filters."""
+    if not pending:
+        return db_messages
+
+    seen = {m.id for m in db_messages}
+    pending = [
+        m
+        for m in pending
+        if m.id not in seen
+        and (before is None or as_utc(m.created_at) < as_utc(before))
+        and (after is None or as_utc(m.created_at) > as_utc(after))
+    ]
+    merged = sorted(db_messages + pending, key=_history_sort_key)
+    if limit is not None:
+        merged = merged[-limit:] if limit else []
+    return merged
+
+
+def _history_order(descending: bool = False) -> tuple:
+    """Order messages by sequence number, falling back to creation time.
+
+    Rows written before sequence numbers existed have no `seq` and sort after
+    numbered rows in chronological order.
+    """
+    if descending:
+        return (DBMessage.seq.desc().nulls_first(), DBMessage.created_at.desc())
+    return (DBMessage.seq.asc().nulls_last(), DBMessage.created_at.asc())
+
+
+def _history_sort_key(db_message: DBMessage) -> tuple:
+    return (
+        db_message.seq is None,
+        db_message.seq or 0,
+        as_utc(db_message.created_at),
+    )
+
+
+# The threads whose messages make up a thread's history, as (thread ID, last
+# shared sequence number) pairs starting with the thread itself, whose bound is
+# None. Forks share their parent's history up to the fork point.
+Lineage = list[tuple[str, int | None]]
+
+
+def _history_filter(lineage: Lineage) -> ColumnElement[bool]:
+    """Select the messages of a thread's history, including shared ones."""
+    clauses = [
+        DBMessage.thread_id == thread_id
+        if bound is None
+        else and_(DBMessage.thread_id == thread_id, DBMessage.seq <= bound)
+        for thread_id, bound in lineage
+    ]
+    return clauses[0] if len(clauses) == 1 else or_(*clauses)
+
+
+def _estimate_size(db_message: DBMessage) -> int:
+    return len(to_json(db_message.message))
+
+
+@dataclass
+class _CachedHistory:
+    messages: list[Message] = field(default_factory=list)
+    ids: set[uuid.UUID] = field(default_factory=set)
+    size: int = 0
+
+    @property
+    def last_seq(self) -> int | None:
+        return max((m.seq for m in self.messages if m.seq is not None), default=None)
+
+
+# cached histories are keyed by database URL, thread ID, and whether they
+# include system messages
+_HistoryKey = tuple[str | None, str, bool]
+
+
+class ThreadHistoryCache:
+    """A bounded, process-wide LRU cache of decoded thread histories.
+
+    Each entry holds the messages of a thread in chronological order, with or
+    without its system messages. Threads update their entries when they add
+    messages, and reads only fetch rows newer than the cached tail. Reads also
+    compare the thread's row count against the cache to detect writes from
+    other processes, in which case the entry is dropped and the history is
+    reloaded.
+
+    Limits default to `settings.thread_history_cache_max_threads` and
+    `settings.thread_history_cache_max_bytes`.
+    """
+
+    def __init__(self, max_threads: int | None = None, max_bytes: int | None = None):
+        self._max_threads = max_threads
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[_HistoryKey, _CachedHistory] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_threads(self) -> int:
+        if self._max_threads is None:
+            return settings.thread_history_cache_max_threads
+        return self._max_threads
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is None:
+            return settings.thread_history_cache_max_bytes
+        return self._max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_threads > 0 and self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: _HistoryKey) -> _CachedHistory | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: _HistoryKey, messages: list[tuple[Message, int]]) -> None:
+        """Replace the cached history of a thread."""
+        with self._lock:
+            self._pop(key)
+            entry = _CachedHistory()
+            self._entries[key] = entry
+            self._extend(entry, messages)
+            self._evict()
+
+    def extend(self, key: _HistoryKey, messages: list[tuple[Message, int]]) -> None:
+        """Append new messages to a cached history, if there is one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._extend(entry, messages)
+            self._evict()
+
+    def invalidate(self, key: _HistoryKey) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _extend(self, entry: _CachedHistory, messages: list[tuple[Message, int]]):
+        for message, size in messages:
+            # concurrent readers may fetch the same tail, so skip known messages
+            if message.id in entry.ids:
+                continue
+            entry.messages.append(message)
+            entry.ids.add(message.id)
+            entry.size += size
+            self._size += size
+
+    def _pop(self, key: _HistoryKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_threads or self._size > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+
+
+_history_cache = ThreadHistoryCache()
+
 
 # Global context var for current thread
 _current_thread: ContextVar["Thread | None"] = ContextVar(
@@ -112,6 +540,7 @@ class Thread:
     parent_id: str | None = None
     _db_thread: bool = field(default=False, init=False, repr=False)
     _tokens: list[Any] = field(default_factory=list, init=False, repr=False)
+    _lineage: Lineage | None = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
         if not isinstance(self.id, str):
@@ -122,30 +551,22 @@ class Thread:
         if self._db_thread:
             return
 
-        # First, ensure tables are created in case of missing initialization
-        try:
-            from marvin.database import ensure_db_tables_exist
-
-            ensure_db_tables_exist()
-        except Exception as e:
-            from marvin.utilities.logging import get_logger
-
-            logger = get_logger(__name__)
-            logger.warning(f"Failed to ensure DB tables exist: {e}")
+        if is_thread_known(self.id):
+            self._db_thread = True
+            return
 
-        # Now we can safely create the thread
         try:
-            async with get_async_session() as session:
-                db_thread = await session.get(DBThread, self.id)
-                if db_thread is not None:
-                    self._db_thread = True
-                else:
-                    await DBThread.create(
-                        session=session,
-                        id=self.id,
-                        parent_thread_id=self.parent_id,
-                    )
-                    self._db_thread = True
+            queue = get_write_behind_queue()
+            if queue is not None and queue.has_thread(self.id):
+                self._db_thread = True
+                return
+
+            # an upsert leaves an existing thread unchanged, so there is no
+            # need to check for it first
+            await DBThread.create(
+                id=self.id, parent_thread_id=self.parent_id, if_not_exists=True
+            )
+            self._db_thread = True
         except Exception as e:
             from marvin.utilities.logging import get_logger
 
@@ -154,6 +575,81 @@ class Thread:
             # Re-raise to fail fast rather than letting downstream code handle DB errors
             raise
 
+    async def _get_lineage_async(self) -> Lineage:
+        """The threads whose messages make up this thread's history.
+
+        Fork points never change, so the lineage is loaded once per instance.
+        """
+        if self._lineage is not None:
+            return self._lineage
+
+        queue = get_write_behind_queue()
+        if queue is not None and queue.has_thread(self.id):
+            await flush_write_behind()
+
+        lineage: Lineage = [(self.id, None)]
+        bound = None
+        async with get_async_session(readonly=True) as session:
+            db_thread = await session.get(DBThread, self.id)
+            while db_thread is not None and db_thread.fork_seq is not None:
+                # a fork of a fork can't see past either fork point
+                bound = (
+                    db_thread.fork_seq
+                    if bound is None
+                    else min(bound, db_thread.fork_seq)
+                )
+                lineage.append((db_thread.parent_thread_id, bound))
+                db_thread = await session.get(DBThread, db_thread.parent_thread_id)
+
+        self._lineage = lineage
+        return lineage
+
+    def fork(self, at: Message | None = None) -> "Thread":
+        """Create a child thread that shares this thread's history.
+
+        Args:
+            at: The last message to share. Defaults to the latest message.
+
+        Returns:
+            The new thread
+        """
+        return run_sync(self.fork_async(at=at))
+
+    async def fork_async(self, at: Message | None = None) -> "Thread":
+        """Create a child thread that shares this thread's history.
+
+        The child references this thread's messages up to the fork point
+        instead of copying them, so forking takes constant time and storage
+        however long the history is. Messages added to either thread after the
+        fork are not seen by the other.
+
+        Args:
+            at: The last message to share. Defaults to the latest message.
+
+        Returns:
+            The new thread
+        """
+        await self._ensure_thread_exists()
+        # shared messages must be committed before the fork can reference them
+        await flush_write_behind()
+
+        if at is None:
+            fork_seq = await allocate_message_seqs(self.id, 0) - 1
+        elif at.seq is None:
+            raise ValueError("Threads can only be forked at a numbered message")
+        else:
+            fork_seq = at.seq
+
+        lineage = await self._get_lineage_async()
+        child = Thread(parent_id=self.id)
+        await DBThread.create(id=child.id, parent_thread_id=self.id, fork_seq=fork_seq)
+        child._db_thread = True
+        child._lineage = [(child.id, None)] + [
+            (thread_id, fork_seq if bound is None else min(bound, fork_seq))
+            for thread_id, bound in lineage
+        ]
+        return child
+
     def add_messages(self, messages: list[PydanticAIMessage]) -> list[Message]:
         """Add multiple messages to the thread.
 
@@ -173,20 +669,74 @@ class Thread:
             messages: List of messages to add (UserMessage, AssistantMessage, etc.)
             llm_call_id: Optional ID of the LLM call that generated these messages
 
+        Returns:
+            The added messages, which hold the given message objects rather
+            than copies
         """
         await self._ensure_thread_exists()
 
-        async with get_async_session() as session:
-            # Create DB message records
-            db_messages = [
-                DBMessage.from_message(thread_id=self.id, message=message)
-                for message in messages
-            ]
-            session.add_all(db_messages)
-
-            await session.commit()
-
-        return [db_m.to_message() for db_m in db_messages]
+        # Create DB message records
+        first_seq = await allocate_message_seqs(self.id, len(messages))
+        db_messages = [
+            DBMessage.from_message(
+                thread_id=self.id, message=message, seq=first_seq + i
+            )
+            for i, message in enumerate(messages)
+        ]
+        # large contents are stored once, whichever message they appear in
+        blob_rows = {
+            (type(blob), blob.hash): blob
+            for db_m in db_messages
+            for blob in db_m.blob_rows()
+        }
+        rows = [*blob_rows.values(), *db_messages]
+
+        # return the caller's message objects rather than decoding them again
+        new_messages = [
+            Message(
+                id=db_m.id,
+                thread_id=self.id,
+                message=message,
+                created_at=db_m.created_at,
+                seq=db_m.seq,
+                tokens=db_m.tokens,
+            )
+            for message, db_m in zip(messages, db_messages)
+        ]
+
+        queue = get_write_behind_queue()
+        if queue is not None:
+            # the queue renumbers both if another writer takes their seqs
+            for db_m, new_message in zip(db_messages, new_messages):
+                db_m._added_message = new_message
+            await queue.add_all(rows)
+        else:
+            for attempt in range(_MAX_INSERT_ATTEMPTS):
+                try:
+                    async with get_async_session() as session:
+                        await bulk_insert(session, rows)
+                    break
+                except IntegrityError:
+                    if attempt == _MAX_INSERT_ATTEMPTS - 1:
+                        raise
+                    # another process wrote to this thread; renumber and retry
+                    first_seq = await allocate_message_seqs(
+                        self.id, len(messages), refresh=True
+                    )
+                    for i, (db_m, new_message) in enumerate(
+                        zip(db_messages, new_messages)
+                    ):
+                        db_m.seq = new_message.seq = first_seq + i
+
+        added = [
+            (m, _estimate_size(db_m)) for m, db_m in zip(new_messages, db_messages)
+        ]
+        _history_cache.extend(self._cache_key(include_system_messages=True), added)
+        _history_cache.extend(
+            self._cache_key(include_system_messages=False),
+            [(m, size) for m, size in added if not is_system_message(m)],
+        )
+        return new_messages
 
     def add_system_message(self, message: str) -> Message:
         """Add a system message to the thread."""
@@ -274,17 +824,30 @@ class Thread:
         """
         await self._ensure_thread_exists()
 
-        async with get_async_session() as session:
+        # filtered reads are served by the database, which only returns the
+        # rows they need
+        if (
+            _history_cache.enabled
+            and before is None
+            and after is None
+            and limit is None
+        ):
+            return list(await self._get_history_async(include_system_messages))
+
+        lineage = await self._get_lineage_async()
+        async with get_async_session(readonly=True) as session:
             query = (
                 select(DBMessage)
-                .where(DBMessage.thread_id == self.id)
-                .order_by(DBMessage.created_at.desc())
+                .where(_history_filter(lineage))
+                .order_by(*_history_order(descending=True))
             )
 
             if before is not None:
                 query = query.where(DBMessage.created_at < before)
             if after is not None:
                 query = query.where(DBMessage.created_at > after)
+            if not include_system_messages:
+                query = query.where(_NOT_SYSTEM)
 
             if limit is not None:
                 query = query.limit(limit)
@@ -294,16 +857,166 @@ class Thread:
             db_messages = list(result.scalars().all())
             db_messages.reverse()
 
-            messages = [db_m.to_message() for db_m in db_messages]
+            # merge in writes that are still buffered by the write-behind queue
+            if (queue := get_write_behind_queue()) is not None:
+                pending = queue.pending_messages(self.id)
+                if not include_system_messages:
+                    pending = [m for m in pending if not is_system_message(m)]
+                db_messages = _merge_pending_messages(
+                    db_messages,
+                    pending,
+                    before=before,
+                    after=after,
+                    limit=limit,
+                )
+
+            blobs = await load_blobs(session, db_messages)
+            return [db_m.to_message(blobs) for db_m in db_messages]
 
+    async def iter_messages(
+        self,
+        *,
+        reverse: bool = False,
+        after_seq: int | None = None,
+        before_seq: int | None = None,
+        include_system_messages: bool = False,
+        page_size: int = 500,
+    ) -> AsyncIterator[Message]:
+        """Iterate over the messages in this thread, one page at a time.
+
+        Pages are fetched with keyset pagination on the message sequence
+        number, so memory use is bounded by `page_size` however long the
+        thread is, and each page is an index range scan. Each page is read in
+        its own session, so messages added during iteration are included if
+        they sort after the current position.
+
+        Args:
+            reverse: Iterate from the newest message to the oldest
+            after_seq: Only yield messages with a sequence number above this
+            before_seq: Only yield messages with a sequence number below this
+            include_system_messages: Whether to include system messages
+            page_size: The number of rows to fetch per query
+
+        Yields:
+            Messages in chronological order, or reverse chronological order if
+            `reverse` is True
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+
+        await self._ensure_thread_exists()
+        await flush_write_behind()
+
+        lineage = await self._get_lineage_async()
+        while True:
+            query = select(DBMessage).where(
+                _history_filter(lineage), DBMessage.seq.is_not(None)
+            )
+            if after_seq is not None:
+                query = query.where(DBMessage.seq > after_seq)
+            if before_seq is not None:
+                query = query.where(DBMessage.seq < before_seq)
             if not include_system_messages:
-                for m in messages:
-                    if isinstance(m.message, ModelRequest) and any(
-                        p.part_kind == "system-prompt" for p in m.message.parts
-                    ):
-                        messages.remove(m)
+                query = query.where(_NOT_SYSTEM)
+            query = query.order_by(
+                DBMessage.seq.desc() if reverse else DBMessage.seq
+            ).limit(page_size)
+
+            async with get_async_session(readonly=True) as session:
+                result = await session.execute(query)
+                db_messages = list(result.scalars().all())
+                blobs = await load_blobs(session, db_messages)
+
+            for db_m in db_messages:
+                yield db_m.to_message(blobs)
+
+            if len(db_messages) < page_size:
+                return
+            if reverse:
+                before_seq = db_messages[-1].seq
+            else:
+                after_seq = db_messages[-1].seq
+
+    def _cache_key(self, include_system_messages: bool = False) -> _HistoryKey:
+        return (settings.database_url, self.id, include_system_messages)
+
+    async def _get_history_async(
+        self, include_system_messages: bool = False
+    ) -> list[Message]:
+        """Get the full history of this thread.
+
+        Served from the thread history cache, fetching only messages that are
+        newer than the cached tail. System messages are filtered out by the
+        query unless `include_system_messages` is True.
+        """
+        key = self._cache_key(include_system_messages)
+        lineage = await self._get_lineage_async()
+        history_filter = _history_filter(lineage)
+        if not include_system_messages:
+            history_filter = and_(history_filter, _NOT_SYSTEM)
+        queue = get_write_behind_queue()
+        pending = queue.pending_messages(self.id) if queue is not None else []
+        if not include_system_messages:
+            pending = [m for m in pending if not is_system_message(m)]
+
+        async with get_async_session(readonly=True) as session:
+            entry = _history_cache.get(key)
+            if entry is not None:
+                tail = await self._get_history_tail(
+                    session, history_filter, entry, pending
+                )
+                if tail is not None:
+                    blobs = await load_blobs(session, tail)
+                    _history_cache.extend(
+                        key,
+                        [
+                            (db_m.to_message(blobs), _estimate_size(db_m))
+                            for db_m in tail
+                        ],
+                    )
+                    return entry.messages
+                _history_cache.invalidate(key)
+
+            result = await session.execute(
+                select(DBMessage).where(history_filter).order_by(*_history_order())
+            )
+            db_messages = _merge_pending_messages(list(result.scalars().all()), pending)
+            blobs = await load_blobs(session, db_messages)
 
-            return messages
+        history = [
+            (db_m.to_message(blobs), _estimate_size(db_m)) for db_m in db_messages
+        ]
+        _history_cache.put(key, history)
+        return [m for m, _ in history]
+
+    async def _get_history_tail(
+        self,
+        session: AsyncSession,
+        history_filter: ColumnElement[bool],
+        entry: _CachedHistory,
+        pending: list[DBMessage],
+    ) -> list[DBMessage] | None:
+        """Fetch committed messages that are newer than a cached history.
+
+        Returns None if the database no longer agrees with the cache, e.g.
+        because another process wrote to or deleted from the thread.
+        """
+        query = select(DBMessage).where(history_filter)
+        if (last_seq := entry.last_seq) is not None:
+            query = query.where(DBMessage.seq > last_seq)
+        result = await session.execute(query.order_by(*_history_order()))
+        tail = [m for m in result.scalars().all() if m.id not in entry.ids]
+
+        result = await session.execute(
+            select(func.count()).select_from(DBMessage).where(history_filter)
+        )
+        committed = len(entry.messages)
+        if pending:
+            pending_ids = {m.id for m in pending}
+            committed -= sum(1 for m in entry.messages if m.id in pending_ids)
+        if result.scalar_one() != committed + len(tail):
+            return None
+        return tail
 
     async def get_llm_calls_async(
         self,
@@ -322,8 +1035,9 @@ class Thread:
             List of LLM calls in chronological order
         """
         await self._ensure_thread_exists()
+        await flush_write_behind()
 
-        async with get_async_session() as session:
+        async with get_async_session(readonly=True) as session:
             query = select(DBLLMCall).where(DBLLMCall.thread_id == self.id)
 
             if before is not None:
@@ -383,13 +1097,10 @@ class Thread:
         """
         await self._ensure_thread_exists()
 
-        usage = Usage()
-
-        llm_calls = await self.get_llm_calls_async(before=before, after=after)
-        for llm_call in llm_calls:
-            usage.incr(llm_call.usage)
-
-        return usage
+        [summary] = await get_usage_summary_async(
+            thread_id=self.id, before=before, after=after
+        )
+        return summary.usage
 
     def get_usage(
         self,
@@ -407,6 +1118,147 @@ class Thread:
         """
         return run_sync(self.get_usage_async(before=before, after=after))
 
+    async def get_token_counts_async(
+        self,
+        *,
+        reverse: bool = False,
+        after_seq: int | None = None,
+        before_seq: int | None = None,
+        include_system_messages: bool = False,
+    ) -> list[TokenCount]:
+        """Get the stored token counts of a window of this thread's messages.
+
+        Running totals are computed in SQL with a window function, so no
+        messages are loaded or tokenized.
+
+        Args:
+            reverse: Sum from the newest message to the oldest, e.g. to find
+                how much recent history fits in a budget
+            after_seq: Only include messages with a sequence number above this
+            before_seq: Only include messages with a sequence number below this
+            include_system_messages: Whether to include system messages
+
+        Returns:
+            Token counts in chronological order, or reverse chronological order
+            if `reverse` is True
+        """
+        await self._ensure_thread_exists()
+        await flush_write_behind()
+
+        lineage = await self._get_lineage_async()
+        order = DBMessage.seq.desc() if reverse else DBMessage.seq
+        tokens = func.coalesce(DBMessage.tokens, 0)
+        query = select(
+            DBMessage.id,
+            DBMessage.seq,
+            tokens,
+            func.sum(tokens).over(order_by=order),
+        ).where(_history_filter(lineage), DBMessage.seq.is_not(None))
+        if after_seq is not None:
+            query = query.where(DBMessage.seq > after_seq)
+        if before_seq is not None:
+            query = query.where(DBMessage.seq < before_seq)
+        if not include_system_messages:
+            query = query.where(_NOT_SYSTEM)
+
+        async with get_async_session(readonly=True) as session:
+            result = await session.execute(query.order_by(order))
+            rows = result.all()
+
+        return [
+            TokenCount(
+                message_id=message_id,
+                seq=seq,
+                tokens=count,
+                cumulative_tokens=cumulative,
+            )
+            for message_id, seq, count, cumulative in rows
+        ]
+
+    def get_token_counts(
+        self,
+        *,
+        reverse: bool = False,
+        after_seq: int | None = None,
+        before_seq: int | None = None,
+        include_system_messages: bool = False,
+    ) -> list[TokenCount]:
+        """Get the stored token counts of a window of this thread's messages.
+
+        See `get_token_counts_async`.
+        """
+        return run_sync(
+            self.get_token_counts_async(
+                reverse=reverse,
+                after_seq=after_seq,
+                before_seq=before_seq,
+                include_system_messages=include_system_messages,
+            )
+        )
+
+    async def get_checkpoint_async(self) -> Checkpoint | None:
+        """Get the thread's latest checkpoint, if it has one."""
+        await self._ensure_thread_exists()
+        await flush_write_behind()
+
+        async with get_async_session(readonly=True) as session:
+            result = await session.execute(
+                select(DBCheckpoint)
+                .where(DBCheckpoint.thread_id == self.id)
+                .order_by(DBCheckpoint.through_seq.desc())
+                .limit(1)
+            )
+            db_checkpoint = result.scalar_one_or_none()
+
+        if db_checkpoint is None:
+            return None
+        return db_checkpoint.to_checkpoint()
+
+    def get_checkpoint(self) -> Checkpoint | None:
+        """Get the thread's latest checkpoint, if it has one.
+
+        See `get_checkpoint_async`.
+        """
+        return run_sync(self.get_checkpoint_async())
+
+    async def add_checkpoint_async(self, summary: str, through_seq: int) -> Checkpoint:
+        """Store a summary of the thread's history.
+
+        Args:
+            summary: The summary, which should cover any previous checkpoint
+            through_seq: The sequence number of the last summarized message
+
+        Returns:
+            The new checkpoint
+        """
+        await self._ensure_thread_exists()
+        await flush_write_behind()
+
+        db_checkpoint = DBCheckpoint(
+            id=uuid.uuid4(),
+            thread_id=self.id,
+            through_seq=through_seq,
+            summary=summary,
+            created_at=utc_now(),
+        )
+        async with get_async_session() as session:
+            session.add(db_checkpoint)
+
+        return Checkpoint(
+            id=db_checkpoint.id,
+            thread_id=self.id,
+            through_seq=through_seq,
+            summary=summary,
+            created_at=db_checkpoint.created_at,
+        )
+
+    def add_checkpoint(self, summary: str, through_seq: int) -> Checkpoint:
+        """Store a summary of the thread's history.
+
+        See `add_checkpoint_async`.
+        """
+        return run_sync(self.add_checkpoint_async(summary, through_seq))
+
     def __enter__(self):
         """Set this thread as the current thread in context."""
         token = _current_thread.set(self)
@@ -462,3 +1314,285 @@ def get_thread(thread: Thread | str | None) -> Thread:
         return Thread(id=thread)
     else:
         return get_current_thread() or Thread()
+
+
+async def get_usage_summary_async(
+    group_by: UsageGroup | Sequence[UsageGroup] | None = None,
+    thread_id: str | None = None,
+    before: datetime | None = None,
+    after: datetime | None = None,
+) -> list[UsageSummary]:
+    """Sum LLM usage in the database, across all threads or per group.
+
+    Provider-specific `details` are summed on SQLite and PostgreSQL and left
+    empty on other databases.
+
+    Args:
+        group_by: Group by "thread", "model", and/or "day" (the calendar day
+            of each call's timestamp). If not provided, returns a single
+            summary of all matching calls.
+        thread_id: Only include calls from this thread
+        before: Only include calls before this timestamp
+        after: Only include calls after this timestamp
+
+    Returns:
+        One summary per group, ordered by group
+    """
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    group_by = list(group_by or [])
+
+    await flush_write_behind()
+
+    async with get_async_session(readonly=True) as session:
+        dialect = session.bind.dialect.name if session.bind is not None else None
+        group_columns = {
+            "thread": DBLLMCall.thread_id,
+            "model": DBLLMCall.model,
+            # SQLite stores timestamps as text, which can't be cast to a date
+            "day": func.date(DBLLMCall.timestamp)
+            if dialect == "sqlite"
+            else cast(DBLLMCall.timestamp, Date),
+        }
+        if invalid := set(group_by) - group_columns.keys():
+            raise ValueError(f"Invalid usage group: {', '.join(sorted(invalid))}")
+
+        keys = [group_columns[group].label(group) for group in group_by]
+        query = select(
+            *keys,
+            func.count().label("llm_calls"),
+            *[
+                func.coalesce(func.sum(getattr(DBLLMCall, name)), 0).label(name)
+                for name in USAGE_COLUMNS
+            ],
+        )
+        query = _filter_llm_calls(
+            query, thread_id=thread_id, before=before, after=after
+        )
+        if keys:
+            query = query.group_by(*keys).order_by(*keys)
+
+        result = await session.execute(query)
+        rows = result.mappings().all()
+
+        details: dict[tuple[Any, ...], dict[str, int]] = {}
+        details_query = _usage_details_query(dialect, keys)
+        if details_query is not None:
+            details_query = _filter_llm_calls(
+                details_query, thread_id=thread_id, before=before, after=after
+            )
+            result = await session.execute(details_query)
+            for *group, name, value in result.all():
+                details.setdefault(tuple(group), {})[name] = value
+
+    return [
+        UsageSummary(
+            usage=Usage(
+                **{name: row[name] for name in USAGE_COLUMNS},
+                details=details.get(tuple(row[group] for group in group_by), {}),
+            ),
+            llm_calls=row["llm_calls"],
+            thread_id=row.get("thread"),
+            model=row.get("model"),
+            day=_as_date(row.get("day")),
+        )
+        for row in rows
+    ]
+
+
+def get_usage_summary(
+    group_by: UsageGroup | Sequence[UsageGroup] | None = None,
+    thread_id: str | None = None,
+    before: datetime | None = None,
+    after: datetime | None = None,
+) -> list[UsageSummary]:
+    """Sum LLM usage in the database, across all threads or per group.
+
+    Provider-specific `details` are summed on SQLite and PostgreSQL and left
+    empty on other databases.
+
+    Args:
+        group_by: Group by "thread", "model", and/or "day" (the calendar day
+            of each call's timestamp). If not provided, returns a single
+            summary of all matching calls.
+        thread_id: Only include calls from this thread
+        before: Only include calls before this timestamp
+        after: Only include calls after this timestamp
+
+    Returns:
+        One summary per group, ordered by group
+    """
+    return run_sync(
+        get_usage_summary_async(
+            group_by=group_by, thread_id=thread_id, before=before, after=after
+        )
+    )
+
+
+def _usage_details_query(
+    dialect: str | None, keys: Sequence[ColumnElement[Any]]
+) -> Select[Any] | None:
+    """Sum the provider-specific usage details of LLM calls per group and name.
+
+    Returns None if the database can't expand the stored usage JSON.
+    """
+    if dialect == "sqlite":
+        # SQLite correlates table-valued functions without LATERAL
+        details = func.json_each(DBLLMCall.usage, "$.details").table_valued(
+            "key", "value"
+        )
+    elif dialect == "postgresql":
+        details = (
+            func.json_each_text(DBLLMCall.usage["details"])
+            .table_valued("key", "value")
+            .lateral()
+        )
+    else:
+        return None
+
+    return (
+        select(*keys, details.c.key, func.sum(cast(details.c.value, Integer)))
+        .select_from(DBLLMCall)
+        .join(details, true())
+        .group_by(*keys, details.c.key)
+    )
+
+
+def _filter_llm_calls(
+    query: Select[Any],
+    thread_id: str | None = None,
+    before: datetime | None = None,
+    after: datetime | None = None,
+) -> Select[Any]:
+    if thread_id is not None:
+        query = query.where(DBLLMCall.thread_id == thread_id)
+    if before is not None:
+        query = query.where(DBLLMCall.timestamp < before)
+    if after is not None:
+        query = query.where(DBLLMCall.timestamp > after)
+    return query
+
+
+def _as_date(value: date | str | None) -> date | None:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+async def search_messages_async(
+    query: str,
+    thread_id: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchResult]:
+    """Search the text of stored messages.
+
+    Messages match if they contain every word of the query. System prompts,
+    tool calls and binary contents are not searched.
+
+    Args:
+        query: The words to search for
+        thread_id: Only search messages of this thread
+        limit: Maximum number of results to return
+        offset: Number of results to skip, for pagination
+
+    Returns:
+        Matching messages, most relevant first, with a snippet of the matched
+        text. Higher ranks are more relevant.
+    """
+    words = query.split()
+    if not words:
+        return []
+    await flush_write_behind()
+
+    params = {"thread_id": thread_id, "limit": limit, "offset": offset}
+    thread_filter = "AND thread_id = :thread_id" if thread_id is not None else ""
+    async with get_async_session(readonly=True) as session:
+        dialect = session.bind.dialect.name
+        if dialect == "sqlite":
+            # quote each word so FTS5 doesn't parse it as query syntax
+            params["query"] = " ".join(
+                '"' + word.replace('"', '""') + '"' for word in words
+            )
+            statement = text(f"""
+                SELECT thread_id, message_id,
+                    snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet,
+                    -bm25(messages_fts) AS rank
+                FROM messages_fts
+                WHERE messages_fts MATCH :query {thread_filter}
+                ORDER BY rank DESC
+                LIMIT :limit OFFSET :offset
+            """)
+        elif dialect == "postgresql":
+            params["query"] = query
+            statement = text(f"""
+                SELECT thread_id, message_id,
+                    ts_headline('english', text, q,
+                        'StartSel=[, StopSel=], MaxWords=16, MinWords=8') AS snippet,
+                    ts_rank(tsv, q) AS rank
+                FROM messages_fts, plainto_tsquery('english', :query) AS q
+                WHERE tsv @@ q {thread_filter}
+                ORDER BY rank DESC
+                LIMIT :limit OFFSET :offset
+            """)
+        else:
+            table = message_search_table
+            statement = (
+                select(
+                    table.c.thread_id,
+                    table.c.message_id,
+                    func.substr(table.c.text, 1, 200).label("snippet"),
+                    literal_column("0.0").label("rank"),
+                )
+                .where(
+                    *(
+                        func.lower(table.c.text).contains(word.lower(), autoescape=True)
+                        for word in words
+                    )
+                )
+                .order_by(table.c.message_id)
+                .limit(limit)
+                .offset(offset)
+            )
+            if thread_id is not None:
+                statement = statement.where(table.c.thread_id == thread_id)
+            params = {}
+
+        result = await session.execute(statement, params)
+        return [
+            SearchResult(
+                thread_id=row.thread_id,
+                message_id=uuid.UUID(row.message_id),
+                snippet=row.snippet,
+                rank=float(row.rank),
+            )
+            for row in result
+        ]
+
+
+def search_messages(
+    query: str,
+    thread_id: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchResult]:
+    """Search the text of stored messages.
+
+    Messages match if they contain every word of the query. System prompts,
+    tool calls and binary contents are not searched.
+
+    Args:
+        query: The words to search for
+        thread_id: Only search messages of this thread
+        limit: Maximum number of results to return
+        offset: Number of results to skip, for pagination
+
+    Returns:
+        Matching messages, most relevant first, with a snippet of the matched
+        text. Higher ranks are more relevant.
+    """
+    return run_sync(
+        search_messages_async(query, thread_id=thread_id, limit=limit, offset=offset)
+    )
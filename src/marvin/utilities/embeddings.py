@@ -0,0 +1,79 @@
+"""Text embeddings for similarity lookups."""
+
+import abc
+import hashlib
+import math
+import operator
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass(kw_only=True)
+class Embedder(abc.ABC):
+    """Embeds texts as vectors whose dot products measure similarity.
+
+    Implementations should return unit-length vectors so that the dot product
+    is the cosine similarity.
+    """
+
+    @abc.abstractmethod
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        """Embed each text as a unit-length vector."""
+
+
+@dataclass(kw_only=True)
+class HashingEmbedder(Embedder):
+    """A local embedder that hashes words and character n-grams into a vector.
+
+    It needs no model or network access, so it is fast and deterministic, but
+    it only measures how much text two inputs share, not what they mean. It
+    is meant for tests and for inputs that differ by wording, casing, and
+    typos, such as "Reset my password" and "reset password pls".
+    """
+
+    dimensions: int = field(
+        default=1024,
+        metadata={"description": "The length of the vectors"},
+    )
+    ngram_size: int = field(
+        default=3,
+        metadata={"description": "The length of the character n-grams"},
+    )
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        return [self.embed_text(text) for text in texts]
+
+    def embed_text(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return normalize(vector)
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD.findall(text.lower())
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f" {word} "
+            features.extend(
+                f"c:{padded[i : i + self.ngram_size]}"
+                for i in range(max(1, len(padded) - self.ngram_size + 1))
+            )
+        return features
+
+
+def normalize(vector: list[float]) -> list[float]:
+    """Scale a vector to unit length, leaving zero vectors unchanged."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        return vector
+    return [x / norm for x in vector]
+
+
+def dot(a: Sequence[float], b: Sequence[float]) -> float:
+    """The dot product of two vectors, i.e. the cosine similarity of unit vectors."""
+    return sum(map(operator.mul, a, b))
@@ -2,8 +2,6 @@ import logging
 from functools import lru_cache
 from typing import TYPE_CHECKING, Any
 
-from rich.logging import RichHandler
-
 import marvin
 
 if TYPE_CHECKING:
@@ -54,6 +52,27 @@ def get_logger(name: str | None = None) -> logging.Logger:
     return logger
 
 
+class _RichHandler(logging.Handler):
+    """Emits records through a `rich.logging.RichHandler`.
+
+    The rich handler is created when the first record is emitted, so rich is
+    only imported if something is logged.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__()
+        self._kwargs = kwargs
+        self._handler: logging.Handler | None = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._handler is None:
+            from rich.logging import RichHandler
+
+            self._handler = RichHandler(**self._kwargs)
+            self._handler.setFormatter(self.formatter)
+        self._handler.emit(record)
+
+
 def setup_logging(settings: "marvin.settings.Settings") -> None:
     logger = get_logger()
 
@@ -61,7 +80,7 @@ def setup_logging(settings: "marvin.settings.Settings") -> None:
 
     logger.handlers.clear()
 
-    handler = RichHandler(rich_tracebacks=True, markup=False)
+    handler = _RichHandler(rich_tracebacks=True, markup=False)
     formatter = logging.Formatter("%(name)s: %(message)s")
     handler.setFormatter(formatter)
     logger.addHandler(handler)
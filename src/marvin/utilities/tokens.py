@@ -0,0 +1,199 @@
+"""Fast token estimates for text and messages.
+
+By default, estimates use a characters-per-token heuristic rather than a model
+tokenizer, so they are cheap enough to run on every turn. A model tokenizer can
+be installed with `set_tokenizer`. Estimates are meant for budgeting, not
+billing.
+
+Messages are counted once, when they are stored, and the count is saved with
+the message; see `marvin.thread.Message.tokens`.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from pydantic_core import to_json
+
+if TYPE_CHECKING:
+    from marvin.engine.llm import PydanticAIMessage
+    from marvin.thread import Message
+
+# English text averages about four characters per token across common tokenizers
+CHARS_PER_TOKEN = 4
+
+# tokens used by the role and separators that wrap every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# a rough, flat cost for images, audio, documents, and video
+MEDIA_TOKENS = 1000
+MEDIA_KINDS = {"binary", "image-url", "audio-url", "document-url", "video-url"}
+
+# the part fields that are sent to the model
+_PART_FIELDS = ("content", "args", "tool_name")
+
+
+# counts the tokens in a string
+Tokenizer = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a string."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+_tokenizer: Tokenizer = estimate_tokens
+
+
+def get_tokenizer() -> Tokenizer:
+    """The tokenizer used to count message tokens."""
+    return _tokenizer
+
+
+def set_tokenizer(tokenizer: Tokenizer | None) -> None:
+    """Set the tokenizer used to count message tokens.
+
+    Counts that were already stored with messages are not recomputed.
+
+    Args:
+        tokenizer: A function that counts the tokens in a string, such as one
+            returned by `model_tokenizer`. None restores the heuristic.
+    """
+    global _tokenizer
+    _tokenizer = tokenizer or estimate_tokens
+    _message_token_cache.clear()
+
+
+def tiktoken_tokenizer(encoding: str = "o200k_base") -> Tokenizer:
+    """A tokenizer that uses a tiktoken encoding.
+
+    Requires the `tiktoken` package.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        raise ImportError(
+            "To count tokens with tiktoken, please install the `tiktoken` package."
+        )
+
+    tiktoken_encoding = tiktoken.get_encoding(encoding)
+    return lambda text: len(tiktoken_encoding.encode(text, disallowed_special=()))
+
+
+def model_tokenizer(model_name: str) -> Tokenizer:
+    """The tokenizer for a model, or the heuristic if none is available.
+
+    Models known to tiktoken use its encoding when the `tiktoken` package is
+    installed.
+
+    Args:
+        model_name: A model name, optionally with a provider prefix such as
+            "openai:gpt-4o"
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+
+    try:
+        encoding = tiktoken.encoding_for_model(model_name.split(":")[-1])
+    except KeyError:
+        return estimate_tokens
+    return tiktoken_tokenizer(encoding.name)
+
+
+def estimate_message_tokens(
+    message: "PydanticAIMessage | dict[str, Any]",
+    tokenizer: Tokenizer | None = None,
+) -> int:
+    """Estimate the number of tokens in a message.
+
+    Accepts a pydantic-ai message or its serialized form, so messages that
+    haven't been decoded yet can be estimated without decoding them.
+
+    Args:
+        message: The message
+        tokenizer: Counts the tokens in text. Defaults to the current tokenizer.
+    """
+    tokenizer = tokenizer or _tokenizer
+    if isinstance(message, dict):
+        parts = message.get("parts", [])
+    else:
+        parts = message.parts
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in parts:
+        for name in _PART_FIELDS:
+            if isinstance(part, dict):
+                value = part.get(name)
+            else:
+                value = getattr(part, name, None)
+            tokens += _estimate_value_tokens(value, tokenizer)
+    return tokens
+
+
+def _estimate_value_tokens(value: Any, tokenizer: Tokenizer) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return tokenizer(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_value_tokens(item, tokenizer) for item in value)
+    if isinstance(value, dict):
+        kind = value.get("kind")
+    else:
+        kind = getattr(value, "kind", None)
+    if kind in MEDIA_KINDS:
+        return MEDIA_TOKENS
+    return tokenizer(to_json(value, fallback=str).decode())
+
+
+class _MessageTokenCache:
+    """A bounded LRU cache of message token estimates, by message ID.
+
+    Messages never change once they are stored, so each message is only
+    estimated once no matter how many turns send it.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._entries: OrderedDict[uuid.UUID, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, message_id: uuid.UUID) -> int | None:
+        with self._lock:
+            tokens = self._entries.get(message_id)
+            if tokens is not None:
+                self._entries.move_to_end(message_id)
+            return tokens
+
+    def put(self, message_id: uuid.UUID, tokens: int) -> None:
+        with self._lock:
+            self._entries[message_id] = tokens
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_message_token_cache = _MessageTokenCache()
+
+
+def count_message_tokens(message: "Message") -> int:
+    """Estimate the number of tokens in a thread message.
+
+    Uses the count stored with the message if it has one, and caches the
+    estimate otherwise.
+    """
+    if message.tokens is not None:
+        return message.tokens
+    tokens = _message_token_cache.get(message.id)
+    if tokens is None:
+        data = message._data
+        tokens = estimate_message_tokens(data if data is not None else message.message)
+        _message_token_cache.put(message.id, tokens)
+    return tokens
@@ -1,15 +1,47 @@
 import asyncio
+import os
+import subprocess
+import sys
 import threading
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select
+import pytest
+from pydantic_ai.messages import BinaryContent, ModelRequest, ToolReturnPart
+from pydantic_ai.usage import Usage
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import selectinload
 
+from marvin import database
 from marvin.database import (
+    Base,
+    DBAttachment,
+    DBBlob,
+    DBLLMCall,
+    DBLLMCallMessage,
     DBMessage,
     DBThread,
     _async_engine_cache,
+    _blob_cache,
+    _engine_state_cache,
+    _initialize_lock,
+    _initialized_databases,
+    _next_message_seqs,
+    _write_behind_queues,
+    bulk_insert,
+    compact_database_async,
     create_db_and_tables,
+    database_stats,
+    dispose_async_engine,
+    flush_write_behind,
+    get_async_engine,
+    get_async_session,
+    get_write_behind_queue,
+    warmup_async,
 )
+from marvin.engine.llm import AgentMessage, SystemMessage, UserMessage
+from marvin.settings import settings
+from marvin.thread import Thread, _history_cache, search_messages_async
 
 
 async def test_async_session(session):
@@ -115,10 +147,9 @@ def test_create_db_and_tables_with_dispose_cleans_up_engine():
 
     Regression test for issue #1255: process hangs on exit after importing marvin.
 
-    When create_db_and_tables is called with dispose_engine=True (as it is from
-    ensure_db_tables_exist), the engine should be disposed and removed from
-    the cache. This ensures the aiosqlite worker thread is cleaned up and
-    doesn't prevent Python from exiting.
+    When create_db_and_tables is called with dispose_engine=True, the engine
+    should be disposed and removed from the cache. This ensures the aiosqlite
+    worker thread is cleaned up and doesn't prevent Python from exiting.
     """
 
     def get_non_daemon_threads():
@@ -145,3 +176,658 @@ def test_create_db_and_tables_with_dispose_cleans_up_engine():
         f"expected {initial_threads} non-daemon threads, "
         f"found {len(current_threads)}: {[t.name for t in current_threads]}"
     )
+
+
+async def test_sessions_share_a_factory_and_check_schema_once():
+    sessions_opened = database_stats.sessions_opened
+    schema_checks = database_stats.schema_checks
+
+    for _ in range(3):
+        async with get_async_session() as session:
+            await session.execute(select(DBThread))
+
+    assert database_stats.sessions_opened - sessions_opened == 3
+    assert database_stats.schema_checks - schema_checks <= 1
+    assert len(_engine_state_cache) >= 1
+
+
+async def test_missing_tables_are_created_on_first_session():
+    engine = get_async_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    _engine_state_cache.clear()
+    _initialized_databases.clear()
+
+    async with get_async_session() as session:
+        session.add(DBThread(id="test-thread"))
+
+    async with get_async_session() as session:
+        assert await session.get(DBThread, "test-thread") is not None
+
+
+async def test_missing_tables_are_created_for_any_database(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    engine = get_async_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    _engine_state_cache.clear()
+    _initialized_databases.clear()
+    monkeypatch.setattr(database, "is_sqlite", lambda: False)
+
+    async with get_async_session() as session:
+        assert await session.scalar(select(func.count(DBThread.id))) == 0
+
+
+async def test_cancelled_schema_check_releases_the_lock():
+    _engine_state_cache.clear()
+    _initialized_databases.clear()
+
+    # another thread is checking the schema
+    _initialize_lock.acquire()
+    try:
+        task = asyncio.create_task(warmup_async())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    finally:
+        _initialize_lock.release()
+
+    await asyncio.wait_for(warmup_async(), timeout=5)
+    assert not _initialize_lock.locked()
+
+
+async def test_warmup_creates_the_database(tmp_path, monkeypatch):
+    path = tmp_path / "nested" / "marvin.db"
+    url = f"sqlite+aiosqlite:///{path}"
+    await dispose_async_engine()
+    monkeypatch.setenv("MARVIN_DATABASE_URL", url)
+    monkeypatch.setattr(settings, "database_url", url)
+    try:
+        await warmup_async()
+        assert path.exists()
+        async with get_async_session() as session:
+            assert await session.scalar(select(func.count(DBThread.id))) == 0
+    finally:
+        await dispose_async_engine()
+
+
+def test_import_does_not_initialize_the_database(tmp_path):
+    env = {**os.environ, "MARVIN_HOME_PATH": str(tmp_path / "home")}
+    env.pop("MARVIN_DATABASE_URL", None)
+    subprocess.run([sys.executable, "-c", "import marvin"], env=env, check=True)
+    assert not (tmp_path / "home" / "marvin.db").exists()
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+async def test_llm_call_messages_are_bulk_inserted():
+    thread = Thread()
+    # system messages are never stored as a range, so each one is mapped
+    messages = await thread.add_messages_async(
+        [SystemMessage(f"Message {i}") for i in range(20)]
+    )
+
+    statements: list[str] = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = get_async_engine()
+    event.listen(engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        llm_call = await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(),
+            prompt_messages=messages[:15],
+            completion_messages=messages[15:],
+        )
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record_statement)
+
+    inserts = [s for s in statements if s.startswith("INSERT INTO llm_call_messages")]
+    assert len(inserts) == 1
+
+    async with get_async_session() as session:
+        result = await session.execute(
+            select(DBLLMCallMessage)
+            .where(DBLLMCallMessage.llm_call_id == llm_call.id)
+            .order_by(DBLLMCallMessage.order)
+        )
+        mappings = result.scalars().all()
+    assert [m.message_id for m in mappings] == [m.id for m in messages]
+    assert [m.in_initial_prompt for m in mappings] == [True] * 15 + [False] * 5
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+class TestLLMCallProvenance:
+    async def _mapped_message_ids(self, llm_call_id) -> list:
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(DBLLMCallMessage.message_id)
+                .where(DBLLMCallMessage.llm_call_id == llm_call_id)
+                .order_by(DBLLMCallMessage.order)
+            )
+            return list(result.scalars().all())
+
+    async def test_messages_are_numbered_per_thread(self):
+        thread = Thread()
+        first = await thread.add_messages_async(
+            [UserMessage("Hello"), AgentMessage("Hi")]
+        )
+        second = await thread.add_messages_async([UserMessage("How are you?")])
+        other = await Thread().add_messages_async([UserMessage("Hello")])
+
+        assert [m.seq for m in first + second] == [1, 2, 3]
+        assert [m.seq for m in other] == [1]
+        assert [m.seq for m in await thread.get_messages_async()] == [1, 2, 3]
+
+    async def test_history_is_stored_as_a_range(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello")])
+        await thread.add_system_message_async("Previous system prompt")
+        await thread.add_messages_async([AgentMessage("Hi"), UserMessage("Bye")])
+        system_prompt = await thread.add_system_message_async("System prompt")
+        history = await thread.get_messages_async(include_system_messages=False)
+        completion = await thread.add_messages_async([AgentMessage("Goodbye")])
+
+        llm_call = await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(),
+            prompt_messages=[system_prompt] + history,
+            completion_messages=completion,
+            prompt_history_start=1,
+        )
+
+        assert (llm_call.prompt_start_seq, llm_call.prompt_end_seq) == (1, 4)
+        assert (llm_call.completion_start_seq, llm_call.completion_end_seq) == (6, 6)
+        assert await self._mapped_message_ids(llm_call.id) == [system_prompt.id]
+
+        [call] = await thread.get_llm_calls_async()
+        call_messages = await call.get_messages_async()
+        assert [m.id for m in call_messages.prompt] == [system_prompt.id] + [
+            m.id for m in history
+        ]
+        assert [m.id for m in call_messages.completion] == [m.id for m in completion]
+
+    async def test_messages_outside_a_range_are_mapped(self):
+        thread = Thread()
+        messages = await thread.add_messages_async(
+            [UserMessage("Hello"), AgentMessage("Hi"), UserMessage("Bye")]
+        )
+        prompt = [messages[2], messages[0]]
+
+        llm_call = await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(),
+            prompt_messages=prompt,
+            completion_messages=[messages[1]],
+        )
+
+        assert llm_call.prompt_start_seq is None
+        assert await self._mapped_message_ids(llm_call.id) == [m.id for m in prompt]
+
+        [call] = await thread.get_llm_calls_async()
+        call_messages = await call.get_messages_async()
+        assert [m.id for m in call_messages.prompt] == [m.id for m in prompt]
+        assert [m.id for m in call_messages.completion] == [messages[1].id]
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+class TestMessageRoles:
+    async def test_roles_are_stored_on_insert(self):
+        thread = Thread()
+        await thread.add_messages_async(
+            [
+                SystemMessage("Be brief"),
+                UserMessage("Hi"),
+                AgentMessage("Hello"),
+                ModelRequest(
+                    parts=[
+                        ToolReturnPart(tool_name="t", content="ok", tool_call_id="1")
+                    ]
+                ),
+            ]
+        )
+
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(DBMessage.role)
+                .where(DBMessage.thread_id == thread.id)
+                .order_by(DBMessage.seq)
+            )
+            assert list(result.scalars()) == ["system", "user", "assistant", "tool"]
+
+    async def test_roles_default_from_the_message(self):
+        async with get_async_session() as session:
+            session.add(DBThread(id="role-thread"))
+            session.add(
+                DBMessage(
+                    thread_id="role-thread",
+                    message={"kind": "response", "parts": []},
+                )
+            )
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(DBMessage.role).where(DBMessage.thread_id == "role-thread")
+            )
+            assert result.scalar_one() == "assistant"
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+class TestBlobs:
+    async def _stored_messages(self, thread_id: str) -> list[DBMessage]:
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(DBMessage).where(DBMessage.thread_id == thread_id)
+            )
+            return list(result.scalars().all())
+
+    async def _count_blobs(self) -> int:
+        async with get_async_session() as session:
+            result = await session.execute(select(func.count()).select_from(DBBlob))
+            return result.scalar_one()
+
+    async def test_repeated_system_prompts_are_stored_once(self):
+        thread = Thread()
+        prompt = "You are a helpful assistant. " * 100
+        for _ in range(3):
+            await thread.add_system_message_async(prompt)
+
+        assert await self._count_blobs() == 1
+        stored = await self._stored_messages(thread.id)
+        assert all("content" not in m.message["parts"][0] for m in stored)
+
+        # contents are restored from the database
+        _blob_cache.clear()
+        _history_cache.clear()
+        messages = await thread.get_messages_async(include_system_messages=True)
+        assert [m.message.parts[0].content for m in messages] == [prompt] * 3
+
+    async def test_small_contents_are_stored_inline(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello")])
+
+        assert await self._count_blobs() == 0
+        [stored] = await self._stored_messages(thread.id)
+        assert stored.message["parts"][0]["content"] == "Hello"
+
+    async def test_blobs_can_be_disabled(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(settings, "database_blob_min_size", 0)
+        thread = Thread()
+        await thread.add_system_message_async("You are a helpful assistant. " * 100)
+
+        assert await self._count_blobs() == 0
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+class TestAttachments:
+    IMAGE = bytes(range(256)) * 8
+
+    @pytest.fixture(autouse=True)
+    def attachment_path(self, monkeypatch: pytest.MonkeyPatch, tmp_path):
+        # other fixtures, like the memory provider, write to tmp_path too
+        path = tmp_path / "attachments"
+        path.mkdir()
+        monkeypatch.setattr(settings, "database_attachment_path", path)
+        return path
+
+    async def _add_image(self, thread: Thread) -> None:
+        await thread.add_user_message_async(
+            ["Describe this", BinaryContent(data=self.IMAGE, media_type="image/png")]
+        )
+
+    async def _stored_item(self, thread_id: str) -> dict:
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(DBMessage).where(DBMessage.thread_id == thread_id)
+            )
+            return result.scalar_one().message["parts"][0]["content"][1]
+
+    async def _read_back(self, thread: Thread) -> bytes:
+        _history_cache.clear()
+        messages = await thread.get_messages_async()
+        return messages[-1].message.parts[0].content[1].data
+
+    async def test_attachments_are_stored_as_files(self, attachment_path):
+        thread = Thread()
+        await self._add_image(thread)
+
+        item = await self._stored_item(thread.id)
+        assert "data" not in item
+        assert item["media_type"] == "image/png"
+        assert (attachment_path / item["data_blob"][:2] / item["data_blob"]).exists()
+        assert await self._read_back(thread) == self.IMAGE
+
+    async def test_attachments_are_stored_in_the_database(
+        self, monkeypatch: pytest.MonkeyPatch, attachment_path
+    ):
+        monkeypatch.setattr(settings, "database_attachment_store", "database")
+        thread = Thread()
+        await self._add_image(thread)
+        await self._add_image(thread)
+
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(func.count()).select_from(DBAttachment)
+            )
+            assert result.scalar_one() == 1
+        assert not any(attachment_path.iterdir())
+        assert await self._read_back(thread) == self.IMAGE
+
+    async def test_small_attachments_are_stored_inline(self):
+        thread = Thread()
+        await thread.add_user_message_async(
+            ["Describe this", BinaryContent(data=b"tiny", media_type="image/png")]
+        )
+
+        item = await self._stored_item(thread.id)
+        assert "data_blob" not in item
+        assert await self._read_back(thread) == b"tiny"
+
+
+@pytest.mark.usefixtures("synchronous_writes")
+class TestCompaction:
+    async def _age(self, thread: Thread, days: int) -> None:
+        past = datetime.now(timezone.utc) - timedelta(days=days)
+        async with get_async_session() as session:
+            await session.execute(
+                update(DBThread).where(DBThread.id == thread.id).values(created_at=past)
+            )
+            await session.execute(
+                update(DBMessage)
+                .where(DBMessage.thread_id == thread.id)
+                .values(created_at=past)
+            )
+
+    async def _count(self, model, *where) -> int:
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(func.count()).select_from(model).where(*where)
+            )
+            return result.scalar_one()
+
+    async def test_old_threads_are_deleted(self):
+        old, recent = Thread(), Thread()
+        for thread in (old, recent):
+            # the system prompt is mapped individually rather than as a range
+            prompt = await thread.add_messages_async(
+                [SystemMessage("Be brief"), UserMessage("Hello")]
+            )
+            completion = await thread.add_messages_async([AgentMessage("Hi")])
+            await DBLLMCall.create(
+                thread_id=thread.id,
+                usage=Usage(),
+                prompt_messages=prompt,
+                completion_messages=completion,
+            )
+        await self._age(old, days=40)
+
+        result = await compact_database_async(older_than=timedelta(days=30))
+
+        assert (result.threads, result.messages, result.llm_calls) == (1, 3, 1)
+        assert await self._count(DBThread, DBThread.id == old.id) == 0
+        assert await self._count(DBLLMCall, DBLLMCall.thread_id == old.id) == 0
+        assert await self._count(DBLLMCallMessage) == 2
+        assert await self._count(DBMessage, DBMessage.thread_id == recent.id) == 3
+        assert await self._count(DBLLMCall, DBLLMCall.thread_id == recent.id) == 1
+        assert await search_messages_async("Hello", thread_id=old.id) == []
+
+    async def test_parents_of_forks_are_kept(self):
+        parent = Thread()
+        await parent.add_messages_async([UserMessage("Hello")])
+        fork = await parent.fork_async()
+        await self._age(parent, days=40)
+
+        await compact_database_async(older_than=timedelta(days=30))
+        assert await self._count(DBThread, DBThread.id == parent.id) == 1
+
+        await self._age(fork, days=40)
+        result = await compact_database_async(older_than=timedelta(days=30))
+        assert result.threads == 2
+
+    async def test_messages_beyond_the_cap_are_deleted(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage(str(i)) for i in range(5)])
+
+        result = await compact_database_async(max_messages_per_thread=2, batch_size=2)
+
+        assert result.messages == 3
+        _history_cache.clear()
+        messages = await thread.get_messages_async()
+        assert [m.message.parts[0].content for m in messages] == ["3", "4"]
+
+    async def test_unreferenced_blobs_are_deleted(self):
+        prompt = "You are a helpful assistant. " * 100
+        old, recent = Thread(), Thread()
+        await old.add_system_message_async(prompt)
+        await old.add_system_message_async("Another long prompt. " * 100)
+        await recent.add_system_message_async(prompt)
+        await self._age(old, days=40)
+
+        result = await compact_database_async(older_than=timedelta(days=30))
+
+        assert result.blobs == 1
+        assert await self._count(DBBlob) == 1
+
+    async def test_blob_references_are_found_across_batches(self):
+        prompt = "You are a helpful assistant. " * 100
+        old = Thread()
+        await old.add_system_message_async(prompt)
+        await old.add_system_message_async("Another long prompt. " * 100)
+        for i in range(3):
+            recent = Thread()
+            await recent.add_system_message_async(f"Prompt number {i} is long. " * 100)
+        await recent.add_system_message_async(prompt)
+        await self._age(old, days=40)
+
+        result = await compact_database_async(
+            older_than=timedelta(days=30), batch_size=1
+        )
+
+        assert result.blobs == 1
+        assert await self._count(DBBlob) == 4
+
+    async def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            await compact_database_async(batch_size=0)
+        with pytest.raises(ValueError):
+            await compact_database_async(max_messages_per_thread=-1)
+
+
+class TestWriteBehind:
+    @pytest.fixture(autouse=True)
+    def write_behind(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(settings, "database_write_behind", True)
+        # a long latency keeps rows buffered until the test flushes them
+        monkeypatch.setattr(settings, "database_write_behind_max_latency", 60.0)
+        _write_behind_queues.clear()
+        yield
+        _write_behind_queues.clear()
+
+    async def _count_messages(self, thread_id: str) -> int:
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(func.count())
+                .select_from(DBMessage)
+                .where(DBMessage.thread_id == thread_id)
+            )
+            return result.scalar_one()
+
+    async def test_messages_are_buffered_until_flush(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello"), AgentMessage("Hi")])
+
+        assert await self._count_messages(thread.id) == 0
+
+        await flush_write_behind()
+
+        assert await self._count_messages(thread.id) == 2
+
+    async def test_thread_reads_its_own_writes(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello")])
+        await thread.add_messages_async([AgentMessage("Hi")])
+
+        messages = await thread.get_messages_async()
+        assert [m.message.parts[0].content for m in messages] == ["Hello", "Hi"]
+
+        messages = await thread.get_messages_async(limit=1)
+        assert [m.message.parts[0].content for m in messages] == ["Hi"]
+
+        await flush_write_behind()
+        messages = await thread.get_messages_async()
+        assert [m.message.parts[0].content for m in messages] == ["Hello", "Hi"]
+
+    async def test_batch_size_triggers_flush(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(settings, "database_write_behind_max_batch_size", 3)
+        thread = Thread()
+        # the thread row plus two messages fill the batch
+        await thread.add_messages_async([UserMessage("Hello"), AgentMessage("Hi")])
+
+        assert await self._count_messages(thread.id) == 2
+
+    async def test_failed_rows_do_not_block_others(self):
+        thread = Thread()
+        [message] = await thread.add_messages_async([UserMessage("Hello")])
+        await flush_write_behind()
+
+        # a row that can never be inserted
+        duplicate = DBMessage.from_message(
+            thread_id=thread.id, message=UserMessage("Hello"), seq=message.seq
+        )
+        duplicate.id = message.id
+        queue = get_write_behind_queue()
+        await queue.add_all([duplicate])
+        await thread.add_messages_async([AgentMessage("Hi")])
+
+        await flush_write_behind()
+        assert await self._count_messages(thread.id) == 2
+        assert len(queue) == 1
+
+        # the bad row is retried and then dropped
+        for _ in range(queue.max_attempts - 1):
+            await flush_write_behind()
+        assert len(queue) == 0
+
+    async def test_recreated_thread_keeps_its_sequence_numbers(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a"), AgentMessage("b")])
+        await flush_write_behind()
+        # as in a new process
+        _next_message_seqs.clear()
+
+        # the buffered insert is dropped as a duplicate when it is flushed
+        await DBThread.create(id=thread.id)
+        [message] = await thread.add_messages_async([UserMessage("c")])
+
+        assert message.seq == 3
+        await flush_write_behind()
+        messages = await thread.get_messages_async()
+        assert [m.seq for m in messages] == [1, 2, 3]
+
+    async def test_messages_are_renumbered_after_another_writer(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a")])
+        await flush_write_behind()
+
+        # another process writes the next message of the thread
+        [mine] = await thread.add_messages_async([UserMessage("mine")])
+        [later] = await thread.add_messages_async([UserMessage("later")])
+        other = DBMessage.from_message(
+            thread_id=thread.id, message=UserMessage("other process"), seq=mine.seq
+        )
+        async with get_async_session() as session:
+            await bulk_insert(session, [other])
+
+        await flush_write_behind()
+        queue = get_write_behind_queue()
+        assert len(queue) == 0
+
+        messages = await thread.get_messages_async()
+        assert [m.message.parts[0].content for m in messages] == [
+            "a",
+            "other process",
+            "mine",
+            "later",
+        ]
+        # the messages the caller holds have the stored sequence numbers
+        assert [mine.seq, later.seq] == [m.seq for m in messages[2:]]
+        assert other.seq < mine.seq < later.seq
+
+    def test_rows_buffered_on_a_stopped_loop_are_committed(self):
+        thread = Thread()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(thread.add_messages_async([UserMessage("Hello")]))
+            loop.run_until_complete(dispose_async_engine())
+        finally:
+            loop.close()
+
+        async def flush_and_count() -> int:
+            await flush_write_behind()
+            count = await self._count_messages(thread.id)
+            await dispose_async_engine()
+            return count
+
+        assert asyncio.run(flush_and_count()) == 1
+        assert loop not in _write_behind_queues
+
+    async def test_llm_calls_are_visible_to_owning_thread(self):
+        thread = Thread()
+        messages = await thread.add_messages_async([UserMessage("Hello")])
+        await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(),
+            prompt_messages=messages,
+            completion_messages=[],
+        )
+
+        llm_calls = await thread.get_llm_calls_async()
+        assert len(llm_calls) == 1
+        call_messages = await llm_calls[0].get_messages_async()
+        assert [m.id for m in call_messages.prompt] == [messages[0].id]
+
+
+class TestSQLitePerformanceProfile:
+    @pytest.fixture(autouse=True)
+    async def performance_profile(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(settings, "database_sqlite_profile", "performance")
+        _async_engine_cache.clear()
+        _engine_state_cache.clear()
+        yield
+        await dispose_async_engine()
+
+    async def test_pragmas_are_applied(self):
+        async with get_async_session() as session:
+            journal_mode = (await session.execute(text("PRAGMA journal_mode"))).scalar()
+            synchronous = (await session.execute(text("PRAGMA synchronous"))).scalar()
+
+        assert journal_mode == "wal"
+        # NORMAL
+        assert synchronous == 1
+
+    async def test_readonly_sessions_use_the_reader_pool(self):
+        async with get_async_session() as session:
+            session.add(DBThread(id="test-thread"))
+
+        async with get_async_session(readonly=True) as session:
+            assert await session.get(DBThread, "test-thread") is not None
+
+        with pytest.raises(OperationalError):
+            async with get_async_session(readonly=True) as session:
+                session.add(DBThread(id="other-thread"))
+
+    async def test_concurrent_threads(self):
+        async def run_thread(i: int) -> list[str]:
+            thread = Thread()
+            for j in range(5):
+                await thread.add_messages_async([UserMessage(f"{i}-{j}")])
+                await thread.get_messages_async()
+            return [
+                m.message.parts[0].content for m in await thread.get_messages_async()
+            ]
+
+        results = await asyncio.gather(*(run_thread(i) for i in range(10)))
+
+        assert results == [[f"{i}-{j}" for j in range(5)] for i in range(10)]
@@ -1,11 +1,26 @@
 import pytest
 from pydantic_ai import ImageUrl
+from pydantic_ai.messages import (
+    CachePoint,
+    ModelRequest,
+    ModelResponse,
+    ToolCallPart,
+    ToolReturnPart,
+)
 
 from marvin import Thread
 from marvin.agents.agent import Agent
+from marvin.database import DBLLMCall, get_async_session
+from marvin.engine.context import (
+    CompactionPolicy,
+    ContextPolicy,
+    wait_for_compactions,
+)
+from marvin.engine.llm import AgentMessage, UserMessage
 from marvin.engine.orchestrator import Orchestrator
 from marvin.tasks.task import Task
 from marvin.thread import Message
+from marvin.utilities.tokens import count_message_tokens
 
 
 @pytest.mark.asyncio
@@ -19,7 +34,7 @@ async def test_get_messages_empty_thread():
     tasks = [task]
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == " "  # Default minimal prompt
@@ -41,7 +56,7 @@ async def test_get_messages_with_user_content():
     await thread.add_user_message_async("Test user prompt")
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == "Test user prompt"
@@ -67,7 +82,7 @@ async def test_get_messages_with_multiple_messages():
     await thread.add_user_message_async("Third user message")
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == "Third user message"
@@ -98,7 +113,7 @@ async def test_get_messages_with_non_user_last_message():
     await thread.add_agent_message_async("Second AI message")
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == " "  # Default minimal prompt
@@ -120,7 +135,7 @@ async def test_get_messages_with_multiple_tasks():
     tasks = [task1, task2]
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == " "  # Default minimal prompt
@@ -145,7 +160,7 @@ async def test_get_messages_extracts_user_prompt_correctly():
     await thread.add_user_message_async("Latest user prompt")
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == "Latest user prompt"
@@ -177,7 +192,7 @@ async def test_get_messages_ignores_previous_system_messages():
     await thread.add_user_message_async("Final user message")
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     assert user_prompt == "Final user message"
@@ -222,7 +237,7 @@ async def test_get_messages_with_complex_user_prompt():
     await thread.add_user_message_async(text_and_image)
 
     # Call the method
-    user_prompt, messages = await orchestrator._get_messages(actor, tasks)
+    user_prompt, messages, _ = await orchestrator._get_messages(actor, tasks)
 
     # Assertions
     # The entire complex message should be returned as the user prompt
@@ -230,3 +245,287 @@ async def test_get_messages_with_complex_user_prompt():
 
     # There should be system message + 2 previous messages (the complex one was extracted)
     assert len(messages) == 3
+
+
+def record_prompt(monkeypatch: pytest.MonkeyPatch) -> list[Message]:
+    """Collect the messages the orchestrator last sent before the user prompt.
+
+    Summaries written during compaction run their own turns first, so the
+    latest prompt is the one of the turn that compacted.
+    """
+    sent: list[Message] = []
+    get_messages = Orchestrator._get_messages
+
+    async def spy(self, actor, assigned_tasks):
+        result = await get_messages(self, actor, assigned_tasks)
+        sent[:] = result[1]
+        return result
+
+    monkeypatch.setattr(Orchestrator, "_get_messages", spy)
+    return sent
+
+
+class TestContextPolicy:
+    def _messages(self, *contents: str) -> list[Message]:
+        return [
+            Message(
+                thread_id="thread",
+                message=(UserMessage if i % 2 == 0 else AgentMessage)(content),
+            )
+            for i, content in enumerate(contents)
+        ]
+
+    def _tokens(self, messages: list[Message]) -> int:
+        return sum(count_message_tokens(m) for m in messages)
+
+    def test_no_budget_keeps_everything(self):
+        messages = self._messages("a", "b", "c")
+        assert ContextPolicy().apply(messages) == messages
+
+    def test_keeps_newest_messages_that_fit(self):
+        messages = self._messages(*(f"message {i}" * 10 for i in range(6)))
+        policy = ContextPolicy(max_tokens=self._tokens(messages[-3:]) + 5)
+
+        assert policy.apply(messages) == messages[-3:]
+        assert policy.apply(messages, reserved_tokens=10**6) == messages[-1:]
+
+    def test_keep_first_and_keep_last(self):
+        messages = self._messages(*(f"message {i}" * 10 for i in range(6)))
+        policy = ContextPolicy(max_tokens=1, keep_first=1, keep_last=2)
+
+        assert policy.apply(messages) == [messages[0], *messages[-2:]]
+
+    def test_tool_calls_and_returns_are_kept_together(self):
+        call = ModelResponse(parts=[ToolCallPart(tool_name="f", tool_call_id="1")])
+        result = ModelRequest(
+            parts=[ToolReturnPart(tool_name="f", content="x", tool_call_id="1")]
+        )
+        messages = self._messages("question") + [
+            Message(thread_id="thread", message=call),
+            Message(thread_id="thread", message=result),
+        ]
+        policy = ContextPolicy(max_tokens=1)
+
+        # keeping the last message keeps the tool call it answers
+        assert policy.apply(messages) == messages[1:]
+
+    def test_cache_prefix_drops_history_in_steps(self):
+        messages = self._messages(*(f"message {i}" * 10 for i in range(12)))
+        tokens = count_message_tokens(messages[0])
+        policy = ContextPolicy(
+            max_tokens=tokens * 6, cache_step_tokens=tokens * 3, cache_prefix=True
+        )
+
+        # the first overflow drops a whole step
+        sent = policy.apply(messages[:7])
+        assert sent == messages[3:7]
+
+        # the prompt starts the same way until the history grows by a step
+        assert policy.apply(messages[:8])[0] is sent[0]
+        assert policy.apply(messages[:9])[0] is sent[0]
+        assert policy.apply(messages[:10])[0] is messages[6]
+
+    async def test_cache_prefix_marks_cache_point(self):
+        thread = Thread()
+        await thread.add_user_message_async("prompt")
+
+        agent = Agent(context_policy=ContextPolicy(cache_prefix=True))
+        orchestrator = Orchestrator(tasks=[], thread=thread)
+        user_prompt, _, _ = await orchestrator._get_messages(agent, [Task("t")])
+
+        assert user_prompt == ["prompt", CachePoint()]
+
+    async def test_orchestrator_applies_agent_policy(self):
+        thread = Thread()
+        for i in range(5):
+            await thread.add_user_message_async(f"user {i}")
+            await thread.add_agent_message_async(f"agent {i}")
+        await thread.add_user_message_async("prompt")
+
+        agent = Agent(context_policy=ContextPolicy(max_tokens=1, keep_last=2))
+        orchestrator = Orchestrator(tasks=[], thread=thread)
+        user_prompt, messages, _ = await orchestrator._get_messages(agent, [Task("t")])
+
+        assert user_prompt == "prompt"
+        assert [m.message.parts[0].content for m in messages[1:]] == [
+            "user 4",
+            "agent 4",
+        ]
+
+        # the orchestrator's policy overrides the agent's
+        orchestrator = Orchestrator(
+            tasks=[], thread=thread, context_policy=ContextPolicy()
+        )
+        _, messages, _ = await orchestrator._get_messages(agent, [Task("t")])
+        assert len(messages) == 11
+
+    @pytest.mark.usefixtures("synchronous_writes")
+    async def test_llm_call_records_the_truncated_prompt(
+        self, monkeypatch: pytest.MonkeyPatch
+    ):
+        thread = Thread()
+        for i in range(10):
+            await thread.add_user_message_async(f"user {i} " * 20)
+            await thread.add_agent_message_async(f"agent {i} " * 20)
+        await thread.add_user_message_async("prompt")
+
+        sent = record_prompt(monkeypatch)
+        agent = Agent(context_policy=ContextPolicy(max_tokens=400, keep_first=2))
+        orchestrator = Orchestrator(tasks=[Task("t", agents=[agent])], thread=thread)
+        await orchestrator.run()
+
+        # the first two messages are kept, then the history skips to the end
+        assert len(sent) < 21
+        [call] = await thread.get_llm_calls_async()
+        call_messages = await call.get_messages_async()
+        assert [m.id for m in call_messages.prompt] == [m.id for m in sent]
+
+
+class TestCompactionPolicy:
+    async def _thread(self, turns: int) -> Thread:
+        thread = Thread()
+        for i in range(turns):
+            await thread.add_user_message_async(f"user {i} " * 20)
+            await thread.add_agent_message_async(f"agent {i} " * 20)
+        return thread
+
+    def test_keep_tokens_must_be_below_max_tokens(self):
+        assert CompactionPolicy(max_tokens=100).keep_tokens == 50
+        with pytest.raises(ValueError):
+            CompactionPolicy(max_tokens=100, keep_tokens=100)
+
+    async def test_short_history_is_not_compacted(self):
+        thread = await self._thread(2)
+        messages = await thread.get_messages_async()
+        policy = CompactionPolicy(max_tokens=10**6, background=False)
+
+        assert await policy.apply(thread, messages) == (None, messages)
+        assert await thread.get_checkpoint_async() is None
+
+    async def test_compaction_replaces_old_history_with_checkpoint(self):
+        thread = await self._thread(6)
+        messages = await thread.get_messages_async()
+        tokens = count_message_tokens(messages[-1])
+        policy = CompactionPolicy(
+            max_tokens=tokens * 4, keep_tokens=tokens * 2, background=False
+        )
+
+        checkpoint, tail = await policy.apply(thread, messages)
+
+        assert checkpoint is not None
+        assert tail == messages[-2:]
+        assert checkpoint.through_seq == messages[-3].seq
+        assert await thread.get_checkpoint_async() == checkpoint
+
+    async def test_checkpoints_are_incremental(self):
+        thread = await self._thread(6)
+        messages = await thread.get_messages_async()
+        tokens = count_message_tokens(messages[-1])
+        policy = CompactionPolicy(
+            max_tokens=tokens * 4, keep_tokens=tokens * 2, background=False
+        )
+        first, _ = await policy.apply(thread, messages)
+
+        # new turns below the threshold reuse the checkpoint
+        await thread.add_user_message_async("short")
+        messages = await thread.get_messages_async()
+        checkpoint, tail = await policy.apply(thread, messages)
+        assert checkpoint == first
+        assert tail == messages[-3:]
+
+        for i in range(3):
+            await thread.add_agent_message_async(f"more {i} " * 20)
+        messages = await thread.get_messages_async()
+        second, tail = await policy.apply(thread, messages)
+        assert second is not None and second.through_seq > first.through_seq
+        assert all(m.seq > second.through_seq for m in tail)
+
+    async def test_background_compaction_does_not_block_turn(self):
+        thread = await self._thread(6)
+        messages = await thread.get_messages_async()
+        tokens = count_message_tokens(messages[-1])
+        policy = CompactionPolicy(max_tokens=tokens * 4, keep_tokens=tokens * 2)
+
+        # the triggering turn sends the full history
+        assert await policy.apply(thread, messages) == (None, messages)
+
+        await wait_for_compactions()
+        checkpoint, tail = await policy.apply(thread, messages)
+        assert checkpoint is not None
+        assert tail == messages[-2:]
+
+    def test_sync_run_finishes_background_compaction(self):
+        thread = Thread()
+        for i in range(6):
+            thread.add_user_message(f"user {i} " * 20)
+            thread.add_agent_message(f"agent {i} " * 20)
+        tokens = count_message_tokens(thread.get_messages()[-1])
+        agent = Agent(
+            context_policy=ContextPolicy(
+                compaction=CompactionPolicy(
+                    max_tokens=tokens * 4, keep_tokens=tokens * 2
+                )
+            )
+        )
+
+        Task("t", agents=[agent]).run(thread=thread)
+
+        assert thread.get_checkpoint() is not None
+
+    async def test_orchestrator_sends_checkpoint_and_tail(self):
+        thread = await self._thread(6)
+        await thread.add_user_message_async("prompt")
+        history = (await thread.get_messages_async())[:-1]
+        tokens = count_message_tokens(history[-1])
+        agent = Agent(
+            context_policy=ContextPolicy(
+                compaction=CompactionPolicy(
+                    max_tokens=tokens * 4, keep_tokens=tokens * 2, background=False
+                )
+            )
+        )
+        orchestrator = Orchestrator(tasks=[], thread=thread)
+        user_prompt, messages, history_start = await orchestrator._get_messages(
+            agent, [Task("t")]
+        )
+
+        checkpoint = await thread.get_checkpoint_async()
+        assert user_prompt == "prompt"
+        assert messages[1] == checkpoint.to_message()
+        assert messages[2:] == history[-2:]
+        # the history after the checkpoint has no gaps
+        assert history_start == 2
+
+    @pytest.mark.usefixtures("synchronous_writes")
+    async def test_llm_call_after_compaction_records_checkpoint(
+        self, monkeypatch: pytest.MonkeyPatch
+    ):
+        thread = await self._thread(6)
+        await thread.add_user_message_async("prompt")
+        history = (await thread.get_messages_async())[:-1]
+        tokens = count_message_tokens(history[-1])
+        agent = Agent(
+            context_policy=ContextPolicy(
+                compaction=CompactionPolicy(
+                    max_tokens=tokens * 4, keep_tokens=tokens * 2, background=False
+                )
+            )
+        )
+        sent = record_prompt(monkeypatch)
+        orchestrator = Orchestrator(tasks=[Task("t", agents=[agent])], thread=thread)
+        await orchestrator.run()
+
+        checkpoint = await thread.get_checkpoint_async()
+        assert sent[1] == checkpoint.to_message()
+        [call] = await thread.get_llm_calls_async()
+        call_messages = await call.get_messages_async()
+        assert [m.id for m in call_messages.prompt] == [m.id for m in sent]
+        assert call_messages.prompt[1] == checkpoint.to_message()
+
+        # the history after the checkpoint is still stored as a range
+        async with get_async_session() as session:
+            db_call = await session.get(DBLLMCall, call.id)
+        assert (db_call.prompt_start_seq, db_call.prompt_end_seq) == (
+            sent[2].seq,
+            sent[-1].seq,
+        )
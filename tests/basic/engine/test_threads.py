@@ -1,10 +1,29 @@
 import uuid
+from datetime import datetime, timezone
 
 import pytest
 from pydantic_ai.messages import ModelRequest, ModelResponse, UserPromptPart
+from pydantic_ai.usage import Usage
+from sqlalchemy import delete, func, select
 
+from marvin.database import (
+    DBLLMCall,
+    DBMessage,
+    DBThread,
+    forget_threads,
+    get_async_session,
+)
 from marvin.engine.llm import AgentMessage, SystemMessage, UserMessage
-from marvin.thread import Message, Thread
+from marvin.settings import settings
+from marvin.thread import (
+    Message,
+    Thread,
+    ThreadHistoryCache,
+    _history_cache,
+    get_usage_summary_async,
+    search_messages_async,
+)
+from marvin.utilities.tokens import estimate_message_tokens
 
 
 def test_basic_message_handling():
@@ -37,6 +56,23 @@ def test_get_messages_doesnt_include_system_messages():
     assert all_messages[0].message.parts[0].content == "You are a helpful assistant"
 
 
+async def test_system_messages_are_filtered_in_sql(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "thread_history_cache_max_threads", 0)
+    thread = Thread()
+    await thread.add_messages_async(
+        [
+            SystemMessage("one"),
+            SystemMessage("two"),
+            UserMessage("Hi"),
+            SystemMessage("three"),
+            AgentMessage("Hello"),
+        ]
+    )
+
+    messages = await thread.get_messages_async(limit=2)
+    assert [m.part_kinds for m in messages] == [["user-prompt"], ["text"]]
+
+
 def test_conversation_flow():
     """Test a complete conversation flow with different message types."""
     thread = Thread()
@@ -100,3 +136,438 @@ def test_thread_messages():
 def test_uuid_thread_id():
     with pytest.raises(ValueError):
         Thread(id=uuid.uuid4())
+
+
+class TestHistoryCache:
+    async def test_reads_pick_up_messages_written_elsewhere(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello")])
+        assert len(await thread.get_messages_async()) == 1
+
+        # simulate another process appending to the thread
+        async with get_async_session() as session:
+            session.add(DBMessage.from_message(thread.id, AgentMessage("Hi")))
+
+        messages = await thread.get_messages_async()
+        assert [m.message.parts[0].content for m in messages] == ["Hello", "Hi"]
+
+    async def test_reads_detect_deleted_messages(self):
+        thread = Thread()
+        added = await thread.add_messages_async(
+            [UserMessage("Hello"), AgentMessage("Hi")]
+        )
+        assert len(await thread.get_messages_async()) == 2
+
+        async with get_async_session() as session:
+            await session.execute(delete(DBMessage).where(DBMessage.id == added[0].id))
+
+        messages = await thread.get_messages_async()
+        assert [m.id for m in messages] == [added[1].id]
+
+    async def test_added_messages_update_the_cache(self):
+        thread = Thread()
+        await thread.get_messages_async()
+        await thread.add_messages_async([UserMessage("Hello")])
+
+        entry = _history_cache.get(thread._cache_key())
+        assert entry is not None
+        assert [m.message.parts[0].content for m in entry.messages] == ["Hello"]
+
+    async def test_system_messages_are_filtered_before_caching(self):
+        thread = Thread()
+        await thread.get_messages_async()
+        await thread.get_messages_async(include_system_messages=True)
+        await thread.add_messages_async([SystemMessage("Be brief"), UserMessage("Hi")])
+
+        entry = _history_cache.get(thread._cache_key())
+        assert [m.message.parts[0].content for m in entry.messages] == ["Hi"]
+        entry = _history_cache.get(thread._cache_key(include_system_messages=True))
+        assert len(entry.messages) == 2
+
+        _history_cache.clear()
+        await thread.get_messages_async()
+        entry = _history_cache.get(thread._cache_key())
+        assert [m.message.parts[0].content for m in entry.messages] == ["Hi"]
+
+    async def test_filtered_reads_skip_the_cache(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("Hello"), AgentMessage("Hi")])
+
+        messages = await thread.get_messages_async(limit=1)
+
+        assert [m.message.parts[0].content for m in messages] == ["Hi"]
+        assert _history_cache.get(thread._cache_key()) is None
+
+    def test_cache_is_bounded_by_thread_count(self):
+        cache = ThreadHistoryCache(max_threads=2, max_bytes=1_000)
+        for i in range(3):
+            cache.put((None, str(i)), [(Message(message=UserMessage("x")), 10)])
+
+        assert len(cache) == 2
+        assert cache.get((None, "0")) is None
+
+    def test_cache_is_bounded_by_size(self):
+        cache = ThreadHistoryCache(max_threads=10, max_bytes=25)
+        for i in range(3):
+            cache.put((None, str(i)), [(Message(message=UserMessage("x")), 10)])
+
+        assert len(cache) == 2
+        assert cache.get((None, "0")) is None
+
+
+class TestIterMessages:
+    @pytest.fixture
+    async def thread(self) -> Thread:
+        thread = Thread()
+        await thread.add_messages_async(
+            [SystemMessage("Be brief")] + [UserMessage(str(i)) for i in range(7)]
+        )
+        return thread
+
+    async def _contents(self, thread: Thread, **kwargs) -> list[str]:
+        return [
+            m.message.parts[0].content async for m in thread.iter_messages(**kwargs)
+        ]
+
+    async def test_iterates_in_order_across_pages(self, thread: Thread):
+        assert await self._contents(thread, page_size=3) == [str(i) for i in range(7)]
+
+    async def test_iterates_in_reverse(self, thread: Thread):
+        assert await self._contents(thread, reverse=True, page_size=2) == [
+            str(i) for i in reversed(range(7))
+        ]
+
+    async def test_sequence_bounds(self, thread: Thread):
+        messages = [m async for m in thread.iter_messages()]
+        contents = await self._contents(
+            thread, after_seq=messages[1].seq, before_seq=messages[5].seq, page_size=2
+        )
+        assert contents == ["2", "3", "4"]
+
+    async def test_include_system_messages(self, thread: Thread):
+        contents = await self._contents(thread, include_system_messages=True)
+        assert contents == ["Be brief"] + [str(i) for i in range(7)]
+
+    async def test_invalid_page_size(self, thread: Thread):
+        with pytest.raises(ValueError):
+            await self._contents(thread, page_size=0)
+
+
+class TestFork:
+    def _contents(self, messages: list[Message]) -> list[str]:
+        return [m.message.parts[0].content for m in messages]
+
+    async def test_fork_shares_history(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a"), AgentMessage("b")])
+        fork = await thread.fork_async()
+        await fork.add_messages_async([UserMessage("fork")])
+        await thread.add_messages_async([UserMessage("parent")])
+
+        assert fork.parent_id == thread.id
+        assert self._contents(await fork.get_messages_async()) == ["a", "b", "fork"]
+        assert self._contents(await thread.get_messages_async()) == [
+            "a",
+            "b",
+            "parent",
+        ]
+
+    async def test_fork_does_not_copy_messages(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a"), AgentMessage("b")])
+        fork = await thread.fork_async()
+
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(func.count())
+                .select_from(DBMessage)
+                .where(DBMessage.thread_id == fork.id)
+            )
+            assert result.scalar_one() == 0
+
+    async def test_fork_at_message(self):
+        thread = Thread()
+        added = await thread.add_messages_async(
+            [UserMessage("a"), AgentMessage("b"), UserMessage("c")]
+        )
+        fork = await thread.fork_async(at=added[0])
+
+        assert self._contents(await fork.get_messages_async()) == ["a"]
+
+    async def test_fork_of_fork(self):
+        thread = Thread()
+        added = await thread.add_messages_async([UserMessage("a"), AgentMessage("b")])
+        fork = await thread.fork_async()
+        await fork.add_messages_async([UserMessage("c")])
+        nested = await fork.fork_async()
+        await nested.add_messages_async([UserMessage("d")])
+        earlier = await fork.fork_async(at=added[0])
+
+        assert self._contents(await nested.get_messages_async()) == [
+            "a",
+            "b",
+            "c",
+            "d",
+        ]
+        assert self._contents(await earlier.get_messages_async()) == ["a"]
+
+    async def test_reloaded_fork_shares_history(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a")])
+        fork = await thread.fork_async()
+        await fork.add_messages_async([UserMessage("b")])
+
+        reloaded = Thread(id=fork.id)
+        assert self._contents(await reloaded.get_messages_async()) == ["a", "b"]
+        assert self._contents(
+            [m async for m in reloaded.iter_messages(page_size=1)]
+        ) == ["a", "b"]
+
+
+class TestKnownThreads:
+    async def test_known_thread_skips_database(self, monkeypatch: pytest.MonkeyPatch):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage("a")])
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("thread should not be created again")
+
+        monkeypatch.setattr(DBThread, "create", fail)
+        reloaded = Thread(id=thread.id)
+        await reloaded.add_messages_async([UserMessage("b")])
+        assert [m.seq for m in await reloaded.get_messages_async()] == [1, 2]
+
+    @pytest.mark.usefixtures("synchronous_writes")
+    async def test_existing_thread_is_not_overwritten(self):
+        parent = Thread()
+        await parent.add_messages_async([UserMessage("a")])
+        child = Thread(parent_id=parent.id)
+        await child.add_messages_async([UserMessage("b")])
+
+        await DBThread.create(id=child.id, if_not_exists=True)
+        forget_threads([child.id])
+        await Thread(id=child.id).add_messages_async([UserMessage("c")])
+
+        async with get_async_session() as session:
+            db_thread = await session.get(DBThread, child.id)
+            assert db_thread.parent_thread_id == parent.id
+        messages = await Thread(id=child.id).get_messages_async()
+        assert [m.seq for m in messages] == [1, 2]
+
+
+class TestLazyMessages:
+    async def test_messages_are_decoded_on_access(self):
+        thread = Thread()
+        await thread.add_messages_async([SystemMessage("Be brief"), UserMessage("Hi")])
+        _history_cache.clear()
+
+        messages = await thread.get_messages_async(include_system_messages=True)
+        assert all("message" not in m.__dict__ for m in messages)
+        assert [m.kind for m in messages] == ["request", "request"]
+        assert [m.part_kinds for m in messages] == [["system-prompt"], ["user-prompt"]]
+        assert all("message" not in m.__dict__ for m in messages)
+
+        assert messages[1].message.parts[0].content == "Hi"
+        assert "message" in messages[1].__dict__
+
+    async def test_added_messages_are_returned_without_decoding(self):
+        thread = Thread()
+        message = UserMessage("Hi")
+        [added] = await thread.add_messages_async([message])
+
+        assert added.message is message
+        assert added.thread_id == thread.id
+        assert added.seq is not None
+
+    def test_constructed_messages_have_kinds(self):
+        message = Message(message=AgentMessage("Hi"))
+        assert message.kind == "response"
+        assert message.part_kinds == ["text"]
+
+    def test_missing_attributes_raise(self):
+        with pytest.raises(AttributeError):
+            Message(message=UserMessage("Hi")).missing
+
+
+class TestSearch:
+    async def test_search_ranks_matching_messages(self):
+        thread = Thread()
+        added = await thread.add_messages_async(
+            [
+                UserMessage("How do I reset my password?"),
+                AgentMessage("Open settings and choose reset password."),
+                UserMessage("Thanks, what about billing?"),
+            ]
+        )
+
+        results = await search_messages_async("reset password")
+        assert {r.message_id for r in results} == {added[0].id, added[1].id}
+        assert all(r.thread_id == thread.id for r in results)
+        assert all("[" in r.snippet for r in results)
+        assert results[0].rank >= results[1].rank
+
+    async def test_search_by_thread_and_page(self):
+        threads = [Thread(), Thread()]
+        for thread in threads:
+            await thread.add_messages_async(
+                [UserMessage(f"invoice {i}") for i in range(3)]
+            )
+
+        results = await search_messages_async("invoice", thread_id=threads[0].id)
+        assert len(results) == 3
+        assert {r.thread_id for r in results} == {threads[0].id}
+
+        first = await search_messages_async("invoice", limit=4)
+        rest = await search_messages_async("invoice", limit=4, offset=4)
+        assert len(first) == 4 and len(rest) == 2
+        assert not {r.message_id for r in first} & {r.message_id for r in rest}
+
+    async def test_system_prompts_are_not_indexed(self):
+        thread = Thread()
+        await thread.add_messages_async([SystemMessage("secret instructions")])
+
+        assert await search_messages_async("secret", thread_id=thread.id) == []
+
+    async def test_query_syntax_is_escaped(self):
+        thread = Thread()
+        await thread.add_messages_async([UserMessage('a "quoted" OR (odd) query*')])
+
+        results = await search_messages_async('"quoted" OR (odd', thread_id=thread.id)
+        assert len(results) == 1
+        assert await search_messages_async("   ") == []
+
+
+class TestUsage:
+    async def _record_call(self, thread: Thread, model: str, input_tokens: int):
+        await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(requests=1, input_tokens=input_tokens, output_tokens=10),
+            model=model,
+        )
+
+    async def test_thread_usage_is_summed(self):
+        thread = Thread()
+        await thread._ensure_thread_exists()
+        await self._record_call(thread, "openai:gpt-4o", 100)
+        await self._record_call(thread, "openai:gpt-4o-mini", 50)
+
+        usage = await thread.get_usage_async()
+        assert (usage.requests, usage.input_tokens, usage.output_tokens) == (2, 150, 20)
+
+    async def test_thread_usage_keeps_audio_tokens_and_details(self):
+        thread = Thread()
+        await thread._ensure_thread_exists()
+        for _ in range(2):
+            await DBLLMCall.create(
+                thread_id=thread.id,
+                usage=Usage(
+                    requests=1,
+                    input_audio_tokens=5,
+                    cache_audio_read_tokens=3,
+                    output_audio_tokens=7,
+                    details={"reasoning_tokens": 11},
+                ),
+            )
+
+        usage = await thread.get_usage_async()
+        assert usage.input_audio_tokens == 10
+        assert usage.cache_audio_read_tokens == 6
+        assert usage.output_audio_tokens == 14
+        assert usage.details == {"reasoning_tokens": 22}
+
+        [summary] = await get_usage_summary_async(thread_id=thread.id)
+        assert summary.usage.output_audio_tokens == 14
+        assert summary.usage.details == {"reasoning_tokens": 22}
+
+    async def test_usage_details_are_summed_per_group(self):
+        threads = [Thread(), Thread()]
+        for thread, details in zip(threads, [{"a": 1, "b": 2}, {"a": 3}]):
+            await thread._ensure_thread_exists()
+            await DBLLMCall.create(
+                thread_id=thread.id, usage=Usage(requests=1, details=details)
+            )
+        await DBLLMCall.create(thread_id=threads[1].id, usage=Usage(requests=1))
+
+        by_thread = await get_usage_summary_async(group_by="thread")
+        assert {s.thread_id: s.usage.details for s in by_thread} == {
+            threads[0].id: {"a": 1, "b": 2},
+            threads[1].id: {"a": 3},
+        }
+        [today] = await get_usage_summary_async(group_by="day")
+        assert today.usage.details == {"a": 4, "b": 2}
+
+    async def test_empty_thread_has_no_usage(self):
+        usage = await Thread().get_usage_async()
+        assert usage.requests == 0
+        assert usage.input_tokens == 0
+
+    async def test_usage_summary_groups(self):
+        threads = [Thread(), Thread()]
+        for thread in threads:
+            await thread._ensure_thread_exists()
+        await self._record_call(threads[0], "openai:gpt-4o", 100)
+        await self._record_call(threads[0], "openai:gpt-4o-mini", 50)
+        await self._record_call(threads[1], "openai:gpt-4o", 25)
+
+        [total] = await get_usage_summary_async()
+        assert (total.llm_calls, total.usage.input_tokens) == (3, 175)
+
+        by_model = await get_usage_summary_async(group_by="model")
+        assert [(s.model, s.usage.input_tokens) for s in by_model] == [
+            ("openai:gpt-4o", 125),
+            ("openai:gpt-4o-mini", 50),
+        ]
+
+        by_thread = await get_usage_summary_async(group_by="thread")
+        assert {s.thread_id: s.llm_calls for s in by_thread} == {
+            threads[0].id: 2,
+            threads[1].id: 1,
+        }
+
+        [today] = await get_usage_summary_async(group_by="day")
+        assert today.day == datetime.now(timezone.utc).date()
+
+    async def test_cache_hit_rate(self):
+        thread = Thread()
+        await thread._ensure_thread_exists()
+        await DBLLMCall.create(
+            thread_id=thread.id,
+            usage=Usage(requests=1, input_tokens=200, cache_read_tokens=150),
+        )
+
+        [summary] = await get_usage_summary_async(thread_id=thread.id)
+        assert summary.usage.cache_read_tokens == 150
+        assert summary.cache_hit_rate == 0.75
+
+    async def test_invalid_usage_group(self):
+        with pytest.raises(ValueError):
+            await get_usage_summary_async(group_by="week")
+
+
+class TestTokenCounts:
+    async def test_token_counts_are_stored_with_messages(self):
+        thread = Thread()
+        [added] = await thread.add_messages_async([UserMessage("a" * 400)])
+        assert added.tokens == estimate_message_tokens(added.message)
+
+        _history_cache.clear()
+        [loaded] = await thread.get_messages_async()
+        assert loaded.tokens == added.tokens
+
+    async def test_cumulative_token_counts(self):
+        thread = Thread()
+        messages = await thread.add_messages_async(
+            [SystemMessage("Be brief")] + [UserMessage("a" * 40 * i) for i in range(4)]
+        )
+        counts = await thread.get_token_counts_async()
+
+        assert [c.message_id for c in counts] == [m.id for m in messages[1:]]
+        assert [c.cumulative_tokens for c in counts] == [
+            sum(m.tokens for m in messages[1 : i + 2]) for i in range(4)
+        ]
+
+        newest = await thread.get_token_counts_async(
+            reverse=True, after_seq=messages[1].seq
+        )
+        assert [c.seq for c in newest] == [m.seq for m in reversed(messages[2:])]
+        assert newest[0].cumulative_tokens == messages[-1].tokens
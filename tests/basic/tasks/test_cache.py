@@ -0,0 +1,180 @@
+import enum
+import time
+from pathlib import Path
+
+import pytest
+from pydantic import BaseModel
+
+import marvin
+import marvin.fns.run
+from marvin import Thread
+from marvin.agents.agent import Agent
+from marvin.defaults import override_defaults
+from marvin.tasks.cache import (
+    MemoryResultCache,
+    ResultCache,
+    SQLiteResultCache,
+    bypass_task_cache,
+    dump_result,
+    fingerprint_task,
+    load_result,
+)
+from marvin.tasks.task import Task
+
+
+class Color(enum.Enum):
+    RED = "red"
+    BLUE = "blue"
+
+
+class Point(BaseModel):
+    x: int
+    y: int
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def result_cache(request: pytest.FixtureRequest, tmp_path: Path) -> ResultCache:
+    if request.param == "sqlite":
+        return SQLiteResultCache(path=tmp_path / "cache.db", max_entries=3)
+    return MemoryResultCache(max_entries=3)
+
+
+class TestResultCache:
+    async def test_get_and_set(self, result_cache: ResultCache):
+        assert await result_cache.get("a") is None
+        await result_cache.set("a", b"1")
+        assert await result_cache.get("a") == b"1"
+
+        await result_cache.delete("a")
+        assert await result_cache.get("a") is None
+
+    async def test_expired_entries_are_missing(self, result_cache: ResultCache):
+        await result_cache.set("a", b"1", ttl=0.01)
+        await result_cache.set("b", b"2")
+        time.sleep(0.02)
+
+        assert await result_cache.get("a") is None
+        assert await result_cache.get("b") == b"2"
+
+    async def test_least_recently_used_entries_are_evicted(
+        self, result_cache: ResultCache
+    ):
+        for key in "abc":
+            await result_cache.set(key, b"1")
+        await result_cache.get("a")
+        await result_cache.set("d", b"1")
+
+        assert await result_cache.get("b") is None
+        assert [await result_cache.get(key) for key in "acd"] == [b"1"] * 3
+
+    async def test_eviction_by_size(self, result_cache: ResultCache):
+        result_cache.max_bytes = 10
+        await result_cache.set("a", b"x" * 6)
+        await result_cache.set("b", b"x" * 6)
+
+        assert await result_cache.get("a") is None
+        assert await result_cache.get("b") is not None
+
+    async def test_sqlite_cache_persists(self, tmp_path: Path):
+        await SQLiteResultCache(path=tmp_path / "cache.db").set("a", b"1")
+        assert await SQLiteResultCache(path=tmp_path / "cache.db").get("a") == b"1"
+
+
+class TestTaskCache:
+    @pytest.fixture
+    def runs(self, monkeypatch: pytest.MonkeyPatch) -> list[Task]:
+        runs: list[Task] = []
+        run_tasks_async = marvin.fns.run.run_tasks_async
+
+        async def counting_run_tasks_async(tasks, **kwargs):
+            runs.extend(tasks)
+            return await run_tasks_async(tasks, **kwargs)
+
+        monkeypatch.setattr(marvin.fns.run, "run_tasks_async", counting_run_tasks_async)
+        return runs
+
+    async def test_fns_use_default_cache(self, runs: list[Task]):
+        with override_defaults(task_cache=MemoryResultCache()):
+            first = await marvin.cast_async("three", int)
+            second = await marvin.cast_async("three", int)
+            await marvin.cast_async("four", int)
+
+        assert first == second
+        assert len(runs) == 2
+
+    async def test_no_cache_by_default(self, runs: list[Task]):
+        await marvin.cast_async("three", int)
+        await marvin.cast_async("three", int)
+        assert len(runs) == 2
+
+    async def test_bypass(self, runs: list[Task]):
+        cache = MemoryResultCache()
+        await Task("Say hi", cache=cache).run_async()
+        await Task("Say hi", cache=False).run_async()
+        with override_defaults(task_cache=cache), bypass_task_cache():
+            await Task("Say hi").run_async()
+        assert len(runs) == 3
+
+    async def test_tasks_in_threads_are_not_cached(self, runs: list[Task]):
+        cache = MemoryResultCache()
+        await Task("Say hi", cache=cache).run_async(thread=Thread())
+        await Task("Say hi", cache=cache).run_async(thread=Thread())
+        assert len(runs) == 2
+
+    def test_fingerprint(self):
+        def tool() -> None:
+            pass
+
+        assert fingerprint_task(Task("a")) == fingerprint_task(Task("a"))
+        assert fingerprint_task(Task("a")) != fingerprint_task(Task("b"))
+        assert fingerprint_task(Task("a", result_type=int)) != fingerprint_task(
+            Task("a")
+        )
+        assert fingerprint_task(Task("a", context={"x": 1})) != fingerprint_task(
+            Task("a", context={"x": 2})
+        )
+        assert fingerprint_task(
+            Task("a", agents=[Agent(model="openai:gpt-4o-mini")])
+        ) != fingerprint_task(Task("a", agents=[Agent(model="openai:gpt-4o")]))
+        assert fingerprint_task(Task("a", tools=[tool])) is None
+
+    async def test_invalid_entries_are_misses(self, runs: list[Task]):
+        cache = MemoryResultCache()
+        task = Task("Count", result_type=int, cache=cache)
+        await cache.set(fingerprint_task(task), b'"not a number"')
+
+        await task.run_async()
+        assert len(runs) == 1
+        assert isinstance(task.result, int)
+
+
+class TestResultSerialization:
+    @pytest.mark.parametrize(
+        "result_type, result",
+        [
+            (str, "hello"),
+            (int | None, None),
+            (Point, Point(x=1, y=2)),
+            (list[Point], [Point(x=1, y=2)]),
+            (Color, Color.BLUE),
+            (["a", "b"], "b"),
+            ([["a", "b", "c"]], ["a", "c"]),
+        ],
+    )
+    def test_round_trip(self, result_type, result):
+        task = Task("a", result_type=result_type)
+        assert load_result(task, dump_result(task, result)) == result
+
+    def test_results_are_json(self):
+        task = Task("a", result_type=Point)
+        assert dump_result(task, Point(x=1, y=2)) == b'{"x":1,"y":2}'
+
+    def test_results_of_the_wrong_type_are_not_serialized(self):
+        assert dump_result(Task("a", result_type=int), object()) is None
+        assert dump_result(Task("a", result_type=["a", "b"]), "c") is None
+
+    def test_invalid_data_raises(self):
+        with pytest.raises(ValueError):
+            load_result(Task("a", result_type=int), b"not json")
+        with pytest.raises(ValueError):
+            load_result(Task("a", result_type=["a", "b"]), b"5")
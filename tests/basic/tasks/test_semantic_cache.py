@@ -0,0 +1,72 @@
+import pytest
+
+import marvin
+import marvin.fns.run
+from marvin.defaults import override_defaults
+from marvin.tasks.cache import bypass_task_cache
+from marvin.tasks.semantic_cache import MISS, SemanticCache
+from marvin.tasks.task import Task
+
+
+@pytest.fixture
+def runs(monkeypatch: pytest.MonkeyPatch) -> list[Task]:
+    runs: list[Task] = []
+    run_tasks_async = marvin.fns.run.run_tasks_async
+
+    async def counting_run_tasks_async(tasks, **kwargs):
+        runs.extend(tasks)
+        return await run_tasks_async(tasks, **kwargs)
+
+    monkeypatch.setattr(marvin.fns.run, "run_tasks_async", counting_run_tasks_async)
+    return runs
+
+
+class TestSemanticCache:
+    async def test_similar_inputs_hit(self):
+        cache = SemanticCache(threshold=0.75)
+        assert (await cache.lookup("key", "Reset my password"))[0] is MISS
+        await cache.add("key", "Reset my password", "account")
+
+        result, _ = await cache.lookup("key", "reset password pls")
+        assert result == "account"
+        assert (await cache.lookup("key", "Where is my order?"))[0] is MISS
+        assert (await cache.lookup("other key", "Reset my password"))[0] is MISS
+
+        assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+        assert cache.stats.hit_rate == 0.25
+
+    async def test_cached_none_is_a_hit(self):
+        cache = SemanticCache()
+        await cache.add("key", "nothing", None)
+        assert (await cache.lookup("key", "nothing"))[0] is None
+
+    async def test_least_recently_used_inputs_are_evicted(self):
+        cache = SemanticCache(max_entries=2)
+        for text in ["a", "b", "c"]:
+            await cache.add("key", text, text)
+        assert (await cache.lookup("key", "a"))[0] is MISS
+        assert (await cache.lookup("key", "c"))[0] == "c"
+
+    def test_invalid_threshold(self):
+        with pytest.raises(ValueError):
+            SemanticCache(threshold=0)
+
+
+class TestClassifyWithSemanticCache:
+    async def test_similar_inputs_reuse_results(self, runs: list[Task]):
+        labels = ["account", "shipping"]
+        with override_defaults(semantic_cache=SemanticCache(threshold=0.75)):
+            first = await marvin.classify_async("Reset my password", labels)
+            second = await marvin.classify_async("reset password pls", labels)
+            # different labels are never compared
+            await marvin.classify_async("reset password pls", ["account", "other"])
+
+        assert first == second
+        assert len(runs) == 2
+
+    async def test_bypass(self, runs: list[Task]):
+        with override_defaults(semantic_cache=SemanticCache()):
+            await marvin.classify_async("Reset my password", ["a", "b"])
+            with bypass_task_cache():
+                await marvin.classify_async("Reset my password", ["a", "b"])
+        assert len(runs) == 2
@@ -0,0 +1,78 @@
+"""Regression tests for the cost of `import marvin`.
+
+Import time itself depends on the machine, so it is measured by
+`scripts/benchmark_import_time.py` rather than asserted here.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+# Modules that are only imported when the public names that need them are used
+LAZY_MODULES = [
+    "jinja2",
+    "marvin.agents.agent",
+    "marvin.database",
+    "marvin.fns.run",
+    "marvin.handlers.print_handler",
+    "marvin.tasks.task",
+    "marvin.thread",
+    "pydantic_ai",
+    "rich",
+    "sqlalchemy",
+]
+
+
+def run_python(tmp_path, *args: str) -> subprocess.CompletedProcess[str]:
+    env = {**os.environ, "MARVIN_HOME_PATH": str(tmp_path / "home")}
+    env.pop("MARVIN_DATABASE_URL", None)
+    return subprocess.run(
+        [sys.executable, *args], env=env, check=True, capture_output=True, text=True
+    )
+
+
+def test_import_is_lazy(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    # validating a configured model loads pydantic-ai's list of known models
+    monkeypatch.delenv("MARVIN_AGENT_MODEL", raising=False)
+    # pydantic plugins from other packages, like logfire's, are imported when
+    # the first pydantic model is built and may import anything
+    monkeypatch.setenv("PYDANTIC_DISABLE_PLUGINS", "__all__")
+    result = run_python(
+        tmp_path,
+        "-c",
+        "import json, sys, marvin; print(json.dumps(sorted(sys.modules)))",
+    )
+    modules = set(json.loads(result.stdout))
+    assert [m for m in LAZY_MODULES if m in modules] == []
+
+
+def test_public_names_are_loaded_on_access():
+    import marvin
+
+    assert marvin.Agent.__module__ == "marvin.agents.agent"
+    assert marvin.run.__module__ == "marvin.fns.run"
+    assert marvin.handlers.PrintHandler.__name__ == "PrintHandler"
+    assert isinstance(marvin.__version__, str)
+    assert set(marvin.__all__) <= set(dir(marvin))
+    with pytest.raises(AttributeError):
+        marvin.does_not_exist
+
+
+def test_task_runs_in_a_fresh_interpreter(tmp_path):
+    # nothing else has imported marvin's submodules in a new interpreter
+    script = textwrap.dedent(
+        """
+        import marvin
+        from pydantic_ai.models.test import TestModel
+
+        task = marvin.Task("Say hi", agents=[marvin.Agent(model=TestModel())])
+        task.run()
+        print(task.is_successful())
+        """
+    )
+    result = run_python(tmp_path, "-c", script)
+    assert result.stdout.splitlines()[-1] == "True"
@@ -0,0 +1,22 @@
+import math
+
+from marvin.utilities.embeddings import HashingEmbedder, dot
+
+
+async def test_hashing_embedder_returns_unit_vectors():
+    embedder = HashingEmbedder(dimensions=64)
+    [vector, empty] = await embedder.embed(["Reset my password", ""])
+
+    assert len(vector) == 64
+    assert math.isclose(dot(vector, vector), 1.0)
+    assert not any(empty)
+
+
+async def test_hashing_embedder_similarity():
+    embedder = HashingEmbedder()
+    query, similar, different = await embedder.embed(
+        ["Reset my password", "reset password pls", "Where is my order?"]
+    )
+
+    assert dot(query, similar) > 0.75
+    assert dot(query, similar) > dot(query, different)
@@ -0,0 +1,72 @@
+from pydantic_ai import ImageUrl
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+
+from marvin.database import serialize_message
+from marvin.engine.llm import AgentMessage, UserMessage
+from marvin.thread import Message
+from marvin.utilities.tokens import (
+    MEDIA_TOKENS,
+    MESSAGE_OVERHEAD_TOKENS,
+    count_message_tokens,
+    estimate_message_tokens,
+    estimate_tokens,
+    model_tokenizer,
+    set_tokenizer,
+)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_estimate_message_tokens():
+    assert estimate_message_tokens(AgentMessage("a" * 40)) == (
+        MESSAGE_OVERHEAD_TOKENS + 10
+    )
+    assert estimate_message_tokens(
+        UserMessage(["a" * 40, ImageUrl(url="https://example.com/image.png")])
+    ) == (MESSAGE_OVERHEAD_TOKENS + 10 + MEDIA_TOKENS)
+
+
+def test_tool_calls_count_their_arguments():
+    message = ModelResponse(
+        parts=[ToolCallPart(tool_name="lookup", args={"query": "a" * 40})]
+    )
+    assert estimate_message_tokens(message) > MESSAGE_OVERHEAD_TOKENS + 10
+
+
+def test_serialized_messages_match_decoded_messages():
+    message = UserMessage("hello world, " * 20)
+    assert estimate_message_tokens(serialize_message(message)) == (
+        estimate_message_tokens(message)
+    )
+
+
+def test_count_message_tokens_caches_by_id():
+    message = Message(thread_id="thread", message=AgentMessage("a" * 40))
+    assert count_message_tokens(message) == MESSAGE_OVERHEAD_TOKENS + 10
+
+    # messages never change, so the estimate is reused
+    message.message = AgentMessage("a" * 400)
+    assert count_message_tokens(message) == MESSAGE_OVERHEAD_TOKENS + 10
+
+
+def test_stored_counts_are_used():
+    message = Message(thread_id="thread", message=AgentMessage("a" * 40), tokens=7)
+    assert count_message_tokens(message) == 7
+
+
+def test_set_tokenizer():
+    message = AgentMessage("one two three")
+    try:
+        set_tokenizer(lambda text: len(text.split()))
+        assert estimate_message_tokens(message) == MESSAGE_OVERHEAD_TOKENS + 3
+    finally:
+        set_tokenizer(None)
+    assert estimate_message_tokens(message) == MESSAGE_OVERHEAD_TOKENS + 4
+
+
+def test_unknown_models_use_the_heuristic():
+    assert model_tokenizer("test:unknown-model") is estimate_tokens
@@ -42,6 +42,7 @@ async def setup_test_db(monkeypatch: pytest.MonkeyPatch, worker_id: str):
 
             # Clear cached engines for the new URL.
             database._async_engine_cache.clear()
+            _discard_write_behind_queues()
 
             # Force re-evaluation of settings.database_url to use the new env var.
             # Direct assignment triggers the 'before' validator due to `validate_assignment=True`.
@@ -64,6 +65,7 @@ async def setup_test_db(monkeypatch: pytest.MonkeyPatch, worker_id: str):
         # Teardown
         with _db_lock:
             database._async_engine_cache.clear()
+            _discard_write_behind_queues()
 
             # Restore original MARVIN_DATABASE_URL environment variable.
             if original_env_marvin_db_url is not None:
@@ -89,6 +91,19 @@ async def setup_test_db(monkeypatch: pytest.MonkeyPatch, worker_id: str):
                 )
 
 
+def _discard_write_behind_queues():
+    """Drop rows still buffered for a previous test's database."""
+    for queue in database._write_behind_queues.values():
+        queue.drain()
+    database._write_behind_queues.clear()
+
+
+@pytest.fixture
+def synchronous_writes(monkeypatch: pytest.MonkeyPatch):
+    """Commit each write before it returns, for tests that inspect stored rows."""
+    monkeypatch.setattr(settings, "database_write_behind", False)
+
+
 @pytest.fixture
 async def session():
     """Provide an async database session for tests."""